@@ -0,0 +1,125 @@
+"""partition notifications by month
+
+Revision ID: 135b3567926d
+Revises: 8d47c3a1e2f6
+Create Date: 2026-10-18 11:20:00.000000
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '135b3567926d'
+down_revision: Union[str, None] = '8d47c3a1e2f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Сколько месяцев вперед создавать секции (дальше их создает tools.notifications_retention)
+MONTHS_AHEAD = 2
+
+COLUMNS = """
+    id INTEGER NOT NULL DEFAULT nextval('notifications_id_seq'),
+    receipt_id INTEGER NOT NULL,
+    type_webhook VARCHAR(50) NOT NULL,
+    instance_id BIGINT NOT NULL,
+    wid VARCHAR(100) NOT NULL,
+    type_instance VARCHAR(50) NOT NULL,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    message_id VARCHAR(100) NOT NULL,
+    chat_id VARCHAR(100) NOT NULL,
+    chat_name VARCHAR(255),
+    sender VARCHAR(100) NOT NULL,
+    sender_name VARCHAR(255),
+    sender_contact_name VARCHAR(255),
+    message_type VARCHAR(50) NOT NULL,
+    message_text TEXT,
+    description TEXT,
+    title VARCHAR(255),
+    preview_type VARCHAR(50),
+    jpeg_thumbnail TEXT,
+    forwarding_score INTEGER,
+    is_forwarded BOOLEAN,
+    raw_data JSON
+"""
+
+COLUMN_NAMES = (
+    "id, receipt_id, type_webhook, instance_id, wid, type_instance, timestamp, message_id, "
+    "chat_id, chat_name, sender, sender_name, sender_contact_name, message_type, message_text, "
+    "description, title, preview_type, jpeg_thumbnail, forwarding_score, is_forwarded, raw_data"
+)
+
+INDEXES = (
+    ("ix_notifications_chat_id_timestamp", "chat_id, timestamp"),
+    ("ix_notifications_sender", "sender"),
+    ("ix_notifications_message_id", "message_id"),
+)
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _rename_old_table() -> None:
+    op.execute("ALTER TABLE notifications RENAME TO notifications_old")
+    op.execute("ALTER TABLE notifications_old RENAME CONSTRAINT notifications_pkey TO notifications_old_pkey")
+    for name, _ in INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_old")
+
+
+def _create_indexes() -> None:
+    for name, columns in INDEXES:
+        op.execute(f"CREATE INDEX {name} ON notifications ({columns})")
+
+
+def upgrade() -> None:
+    _rename_old_table()
+
+    # Строки без времени (колонка была nullable) попадают в секцию текущего месяца
+    op.execute("UPDATE notifications_old SET timestamp = now() WHERE timestamp IS NULL")
+
+    op.execute(f"""
+        CREATE TABLE notifications ({COLUMNS},
+            CONSTRAINT notifications_pkey PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+
+    bind = op.get_bind()
+    first = bind.execute(sa.text("SELECT min(timestamp) FROM notifications_old")).scalar()
+    current = date.today().replace(day=1)
+    month = date(first.year, first.month, 1) if first else current
+    last = _add_months(current, MONTHS_AHEAD)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE notifications_p{month:%Y_%m} PARTITION OF notifications "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        month = _add_months(month, 1)
+    # Страховка для строк вне созданных секций (например, если задача хранения не запускалась)
+    op.execute("CREATE TABLE notifications_default PARTITION OF notifications DEFAULT")
+
+    _create_indexes()
+
+    op.execute(f"INSERT INTO notifications ({COLUMN_NAMES}) SELECT {COLUMN_NAMES} FROM notifications_old")
+    op.execute("ALTER SEQUENCE notifications_id_seq OWNED BY notifications.id")
+    op.execute("DROP TABLE notifications_old")
+
+
+def downgrade() -> None:
+    _rename_old_table()
+
+    op.execute(f"""
+        CREATE TABLE notifications ({COLUMNS},
+            CONSTRAINT notifications_pkey PRIMARY KEY (id)
+        )
+    """)
+    _create_indexes()
+
+    op.execute(f"INSERT INTO notifications ({COLUMN_NAMES}) SELECT {COLUMN_NAMES} FROM notifications_old")
+    op.execute("ALTER SEQUENCE notifications_id_seq OWNED BY notifications.id")
+    # Секции удаляются вместе с родительской таблицей
+    op.execute("DROP TABLE notifications_old")
@@ -0,0 +1,36 @@
+"""add conversation_messages
+
+Revision ID: 5b0e1c2d7a94
+Revises: ca0de8641cc8
+Create Date: 2026-10-18 10:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b0e1c2d7a94'
+down_revision: Union[str, None] = 'ca0de8641cc8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Первичный ключ (chat_id, seq) служит индексом для выборки последних реплик чата
+    op.create_table(
+        'conversation_messages',
+        sa.Column('chat_id', sa.String(length=100), nullable=False),
+        sa.Column('seq', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('role', sa.String(length=20), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('token_count', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('chat_id', 'seq')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('conversation_messages')
@@ -0,0 +1,39 @@
+"""add notification indexes
+
+Revision ID: 8d47c3a1e2f6
+Revises: 5b0e1c2d7a94
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d47c3a1e2f6'
+down_revision: Union[str, None] = '5b0e1c2d7a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись в notifications, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index('ix_notifications_chat_id_timestamp', 'notifications', ['chat_id', 'timestamp'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_notifications_sender', 'notifications', ['sender'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_notifications_message_id', 'notifications', ['message_id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_notifications_message_id', table_name='notifications',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_notifications_sender', table_name='notifications',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_notifications_chat_id_timestamp', table_name='notifications',
+                      postgresql_concurrently=True, if_exists=True)
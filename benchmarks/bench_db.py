@@ -0,0 +1,113 @@
+# benchmarks/bench_db.py
+from datetime import datetime
+import pytest
+from conftest import BENCH_CHAT_ID
+
+
+HISTORY = [
+    {"role": role, "content": f"Реплика {index}: межкомнатные двери, размер проема 80 см, доставка", "tokens": 20, "seq": index}
+    for index, role in enumerate(["user", "assistant"] * 10)
+]
+
+
+@pytest.fixture(scope="module")
+def cleanup(db, run):
+    """Удаляет строки бенчмарков из БД после прогона"""
+    yield
+    from sqlalchemy import delete
+    from bots.bot_whatsapp.db.models import ConversationContext, ConversationMessage, Notification
+
+    async def clean():
+        async with db() as session:
+            await session.execute(delete(Notification).where(Notification.chat_id == BENCH_CHAT_ID))
+            await session.execute(delete(ConversationContext).where(ConversationContext.phone_number == BENCH_CHAT_ID))
+            await session.execute(delete(ConversationMessage).where(ConversationMessage.chat_id == BENCH_CHAT_ID))
+            await session.commit()
+
+    run(clean)
+
+
+@pytest.fixture(scope="module")
+def conversation(db, run, cleanup):
+    """20 реплик чата бенчмарков в conversation_messages (удаляются в cleanup)"""
+    from sqlalchemy.dialects.postgresql import insert
+    from bots.bot_whatsapp.db.models import ConversationMessage
+
+    async def seed():
+        async with db() as session:
+            rows = [
+                {
+                    "chat_id": BENCH_CHAT_ID,
+                    "seq": item["seq"],
+                    "role": item["role"],
+                    "content": item["content"],
+                    "token_count": item["tokens"],
+                    "created_at": datetime.now(),
+                }
+                for item in HISTORY
+            ]
+            await session.execute(insert(ConversationMessage).values(rows).on_conflict_do_nothing())
+            await session.commit()
+
+    run(seed)
+    return HISTORY
+
+
+def bench_conversation_context_load(benchmark, db, run, cleanup):
+    from bots.bot_whatsapp.db.models import ConversationContext
+
+    async def load():
+        async with db() as session:
+            context = await ConversationContext.get_or_create(session, BENCH_CHAT_ID)
+            return context.context
+
+    benchmark(run, load)
+
+
+def bench_conversation_context_save(benchmark, db, run, cleanup):
+    from bots.bot_whatsapp.db.models import ConversationContext
+
+    async def save():
+        async with db() as session:
+            context = await ConversationContext.get_or_create(session, BENCH_CHAT_ID)
+            await context.save_context(session, HISTORY)
+
+    benchmark(run, save)
+
+
+def bench_load_recent(benchmark, run, db, conversation):
+    """Чтение последних реплик из conversation_messages при создании AITraveler"""
+    from bots.bot_whatsapp.db.context_store import context_writer
+
+    rows, next_seq = benchmark(run, lambda: context_writer.load_recent(BENCH_CHAT_ID, len(conversation)))
+    assert len(rows) == len(conversation) and next_seq == len(conversation)
+
+
+def notification_row(notification: dict) -> dict:
+    from bots.bot_whatsapp.utils.extract_message import extract_message_data
+
+    data = extract_message_data(notification)
+    data["timestamp"] = datetime.now()
+    data["chat_id"] = data["sender"] = BENCH_CHAT_ID
+    return data
+
+
+def bench_create_notification(benchmark, db, run, cleanup, notification):
+    from bots.bot_whatsapp.db.queries import create_notification
+
+    async def create():
+        async with db() as session:
+            await create_notification(session, notification_row(notification))
+
+    benchmark(run, create)
+
+
+def bench_create_notifications_batch(benchmark, db, run, cleanup, notification):
+    """Пакет из 100 уведомлений одним INSERT (NotificationSink), для сравнения с построчной записью"""
+    from bots.bot_whatsapp.db.queries import create_notifications
+
+    async def create():
+        async with db() as session:
+            await create_notifications(session, [notification_row(notification) for _ in range(100)])
+
+    benchmark(run, create)
@@ -0,0 +1,14 @@
+# benchmarks/bench_extract_message.py
+import pytest
+from bots.bot_whatsapp.utils.extract_message import extract_message_data, extract_message_text
+
+
+def bench_extract_message_data(benchmark, notification):
+    data = benchmark(extract_message_data, notification)
+    assert data["chat_id"] == notification["body"]["senderData"]["chatId"]
+
+
+@pytest.mark.parametrize("index", [0, 1, 2], ids=["text", "extended_text", "image"])
+def bench_extract_message_text(benchmark, notifications, index):
+    message_data = notifications[index]["body"]["messageData"]
+    assert benchmark(extract_message_text, message_data)
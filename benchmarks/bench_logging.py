@@ -0,0 +1,21 @@
+# benchmarks/bench_logging.py
+from settings.logger import setup_logger
+
+
+# Имя в пространстве bot_whatsapp: те же обработчики и файл, что у бота
+logger = setup_logger("bots.bot_whatsapp.benchmarks")
+
+
+def bench_log_notification(benchmark, notification):
+    """Строка лога с уведомлением целиком, как в начале WhatsAppBot.message_handler"""
+    benchmark(lambda: logger.info(f"Получено уведомление/сообщение: {notification}"))
+
+
+def bench_log_short_line(benchmark, notification):
+    chat_id = notification["body"]["senderData"]["chatId"]
+    benchmark(lambda: logger.info(f"[{chat_id}] Сообщение добавлено в историю"))
+
+
+def bench_log_debug_filtered(benchmark, notification):
+    """DEBUG пишется только в файл: стоимость строки, отсеянной консольным обработчиком"""
+    benchmark(lambda: logger.debug(f"Получено уведомление/сообщение: {notification}"))
@@ -0,0 +1,71 @@
+# benchmarks/bench_traveler.py
+from dataclasses import replace
+import pytest
+from conftest import CATALOG_PATH, SAMPLES
+
+
+REPLY = "Здравствуйте! Межкомнатные двери есть в наличии, доставка по городу. Подскажите размер проема?"
+QUESTION = "Сколько стоит доставка двери 80 см в Алматы?"
+
+
+def load_questions() -> list:
+    with open(SAMPLES / "questions.txt", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    from bots.bot_whatsapp.stack.catalog import Catalog
+
+    return Catalog.load(str(CATALOG_PATH))
+
+
+@pytest.fixture
+def traveler(catalog):
+    """
+    AITraveler без БД и провайдера: модель-заглушка отвечает сразу, кэш ответов
+    и резюме выключены, чтобы каждый прогон проходил полную сборку запроса
+    """
+    # Модули бота импортируются при запуске бенчмарка, а не при сборе: сбор не зависит от окружения
+    from bots.bot_whatsapp.stack.answer_cache import AnswerCache
+    from bots.bot_whatsapp.stack.stub_ai import StubAI
+    from bots.bot_whatsapp.stack.traveler import AITraveler
+
+    traveler = AITraveler(
+        ai_model=StubAI("gpt-4o-mini", reply=REPLY),
+        answers=AnswerCache(max_size=0),
+        catalog=catalog,
+        fast_model=StubAI("gpt-4o-mini", reply=REPLY),
+    )
+    traveler.config = replace(traveler.config, SUMMARY_TRIGGER_TOKENS=0)
+    return traveler
+
+
+def with_history(traveler, turns: int) -> list:
+    for question in load_questions()[:turns]:
+        traveler._commit_turn(question, REPLY)
+    return list(traveler.conversation_history)
+
+
+@pytest.mark.parametrize("turns", [0, 8], ids=["first_turn", "history_8"])
+def bench_process_message(benchmark, run, traveler, turns):
+    history = with_history(traveler, turns)
+
+    def setup():
+        traveler.conversation_history = list(history)
+        traveler._next_seq = len(history)
+
+    benchmark.pedantic(
+        lambda: run(lambda: traveler.process_message(QUESTION)),
+        setup=setup,
+        rounds=200,
+        warmup_rounds=5,
+    )
+    assert traveler.conversation_history[-1]["content"] == REPLY
+
+
+def bench_build_context(benchmark, traveler):
+    """Поиск по каталогу и выбор промпта без запроса к модели"""
+    history = [{"role": "user", "content": QUESTION}]
+    context = benchmark(traveler.build_context, "default", history)
+    assert context["reference"]
@@ -0,0 +1,72 @@
+# benchmarks/conftest.py
+import asyncio
+import json
+from pathlib import Path
+import pytest
+
+
+ROOT = Path(__file__).resolve().parent.parent
+SAMPLES = ROOT / "tools" / "samples"
+CATALOG_PATH = ROOT / "data" / "catalog.json"
+
+# Чат для строк, которые бенчмарки пишут в БД (удаляются после прогона)
+BENCH_CHAT_ID = "00099999999@c.us"
+
+
+def load_notifications() -> list:
+    """Записанные вебхуки в формате receiveNotification"""
+    notifications = []
+    with open(SAMPLES / "webhooks.jsonl", encoding="utf-8") as file:
+        for receipt_id, line in enumerate(file, start=1):
+            if line.strip():
+                notifications.append({"receiptId": receipt_id, "body": json.loads(line)})
+    return notifications
+
+
+@pytest.fixture(scope="session")
+def notifications() -> list:
+    return load_notifications()
+
+
+@pytest.fixture(scope="session")
+def notification(notifications) -> dict:
+    """Обычное входящее текстовое сообщение"""
+    return notifications[0]
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def run(loop):
+    """Выполняет корутину в общем цикле событий: benchmark(run, lambda: coro())"""
+    def run(factory):
+        return loop.run_until_complete(factory())
+    return run
+
+
+@pytest.fixture(scope="session")
+def db(run):
+    """
+    Фабрика сессий локальной БД (DB_* из окружения, таблицы - alembic upgrade head).
+    Без доступной БД бенчмарки с ней пропускаются.
+    """
+    try:
+        from sqlalchemy import text
+        from settings.connection_db import async_session
+    except Exception as e:
+        pytest.skip(f"БД не настроена: {e}")
+
+    async def ping():
+        async with async_session() as session:
+            await session.execute(text("SELECT 1"))
+
+    try:
+        run(ping)
+    except Exception as e:
+        pytest.skip(f"БД недоступна: {e}")
+    return async_session
@@ -0,0 +1,316 @@
+# bot_whatsapp/controller/debouncer.py
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+from settings.logger import setup_logger
+from bots.bot_whatsapp.utils.metrics import metrics
+
+
+logger = setup_logger(__name__)
+
+
+@dataclass
+class _ChatBuffer:
+    # Сообщения, на которые еще не отправлен ответ, и их отметки о завершении
+    texts: List[str] = field(default_factory=list)
+    waiters: List[asyncio.Future] = field(default_factory=list)
+    first_at: float = 0.0
+    # Ожидание окна и генерация ответа; отменяется новым сообщением
+    task: Optional[asyncio.Task] = None
+    generating: bool = False
+    # Последняя отправка ответа: следующий ответ чата уходит только после нее
+    send_task: Optional[asyncio.Task] = None
+    # Последний готовый ответ по правилу: сообщения после него ждут его отправки
+    rule_task: Optional[asyncio.Task] = None
+    # Счетчики сообщений: всего получено и уже вошло в ходы
+    received: int = 0
+    taken: int = 0
+    # Принятые wait_room уведомления чата, обработка которых еще не закончена (см. free_room)
+    admitted: int = 0
+
+
+class MessageDebouncer:
+    """
+    Объединяет несколько сообщений чата, пришедших подряд, в один ход разговора.
+
+    Ответ генерируется, когда от клиента window секунд нет новых сообщений (но не позже
+    max_wait секунд после первого). Если новое сообщение приходит во время генерации,
+    генерация отменяется и запускается заново уже для всех накопленных сообщений.
+    generate должен быть безопасен для отмены (см. AITraveler.process_message),
+    отправка готового ответа не отменяется.
+
+    Генерации ответов всех чатов выполняются под общим limiter (семафор обработчиков
+    уведомлений), поэтому число одновременных запросов к модели ограничено. Число чатов,
+    ожидающих ответа, ограничено max_chats: wait_room ждет, пока место освободится, так
+    что медленная генерация сдерживает прием новых уведомлений. Место занимается при
+    приеме уведомления и освобождается, когда ответ чата отправлен и free_room вызван
+    для каждого принятого уведомления.
+
+    Готовый ответ без модели (submit_reply) не обгоняет ожидающие сообщения: сначала
+    без ожидания окна отвечается на сообщения, пришедшие до него, затем ход записывается
+    в историю и ответ ставится в ту же цепочку отправки.
+
+    submit и submit_reply возвращают future, который завершается, когда ответ на
+    сообщение передан в send, и завершается с ошибкой, если сгенерировать или передать
+    ответ не удалось. По нему вызывающий узнает, что сообщение обработано до конца.
+    """
+
+    def __init__(self,
+                 generate: Callable[[str, str], Awaitable[Optional[str]]],
+                 send: Callable[[str, str], Awaitable[None]],
+                 window: float = 2.0,
+                 max_wait: float = 10.0,
+                 record: Optional[Callable[[str, str, str], Awaitable[None]]] = None,
+                 limiter: Optional[asyncio.Semaphore] = None,
+                 max_chats: int = 0):
+        """
+        :param generate: Генерация ответа по номеру чата и объединенному тексту сообщений
+        :param send: Отправка ответа в чат
+        :param window: Сколько секунд ждать следующего сообщения клиента
+        :param max_wait: Максимальная задержка ответа от первого сообщения, секунды
+        :param record: Запись в историю хода с готовым ответом (номер чата, сообщение, ответ)
+        :param limiter: Ограничение одновременных генераций (без него - без ограничения)
+        :param max_chats: Максимум чатов, ожидающих ответа (0 - без ограничения), см. wait_room
+        """
+        self.generate = generate
+        self.send = send
+        self.record = record
+        self.limiter = limiter
+        self.window = window
+        self.max_wait = max_wait
+        self.max_chats = max_chats
+        self._buffers: Dict[str, _ChatBuffer] = {}
+        self._room = asyncio.Event()
+        self.messages = 0
+        self.turns = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.rule_replies = 0
+
+    async def wait_room(self, chat_id: str):
+        """
+        Ждет, пока у чата будет место без превышения max_chats, и занимает его до free_room.
+        Чат, уже ожидающий ответа, новое место не занимает: его уведомления принимаются сразу
+        """
+        while self.max_chats and chat_id not in self._buffers and len(self._buffers) >= self.max_chats:
+            metrics.incr("debounce.room_waits")
+            self._room.clear()
+            await self._room.wait()
+        self._buffers.setdefault(chat_id, _ChatBuffer()).admitted += 1
+
+    def free_room(self, chat_id: str):
+        """Обработка принятого wait_room уведомления закончена: место освобождается после ответа чата"""
+        buffer = self._buffers.get(chat_id)
+        if buffer is None:
+            return
+        buffer.admitted = max(buffer.admitted - 1, 0)
+        self._release(chat_id, buffer)
+
+    def submit(self, chat_id: str, text: str) -> asyncio.Future:
+        """Добавляет сообщение чата и переносит ответ на конец окна"""
+        buffer = self._buffers.setdefault(chat_id, _ChatBuffer())
+        if buffer.task and not buffer.task.done():
+            if buffer.generating:
+                self.cancelled += 1
+                metrics.incr("debounce.cancelled")
+                logger.info(f"Новое сообщение от {chat_id}: генерация ответа отменена")
+            buffer.task.cancel()
+        if not buffer.texts:
+            buffer.first_at = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        buffer.texts.append(text)
+        buffer.waiters.append(waiter)
+        buffer.received += 1
+        self.messages += 1
+        metrics.incr("debounce.messages")
+        buffer.task = asyncio.create_task(self._run(chat_id, buffer, buffer.rule_task))
+        return waiter
+
+    def submit_reply(self, chat_id: str, text: str, reply: str) -> asyncio.Future:
+        """
+        Ставит готовый ответ на сообщение в очередь чата после ответа на уже ожидающие
+        сообщения. Ожидание окна для них прерывается, начатая генерация доводится до конца.
+        """
+        buffer = self._buffers.setdefault(chat_id, _ChatBuffer())
+        previous = buffer.task
+        if previous and not previous.done() and not buffer.generating:
+            previous.cancel()
+        # Теперь ее дожидается готовый ответ: следующие сообщения с ней уже не объединятся
+        buffer.task = None
+        self.rule_replies += 1
+        metrics.incr("debounce.rule_replies")
+        waiter = asyncio.get_running_loop().create_future()
+        buffer.rule_task = asyncio.create_task(
+            self._reply(chat_id, text, reply, buffer, buffer.received, previous, buffer.rule_task, waiter)
+        )
+        return waiter
+
+    def stats(self) -> Dict:
+        return {
+            "messages": self.messages,
+            "turns": self.turns,
+            "coalesced": self.coalesced,
+            "pending": self.pending(),
+            "cancelled": self.cancelled,
+            "rule_replies": self.rule_replies,
+            "pending_chats": sum(1 for buffer in self._buffers.values() if buffer.texts),
+            "chats": len(self._buffers),
+        }
+
+    def pending(self) -> int:
+        return sum(len(buffer.texts) for buffer in self._buffers.values())
+
+    async def stop(self):
+        """Сразу отвечает на все накопленные сообщения и дожидается отправки"""
+        for buffer in self._buffers.values():
+            if buffer.task:
+                buffer.task.cancel()
+        await asyncio.gather(*(buffer.task for buffer in self._buffers.values() if buffer.task),
+                             return_exceptions=True)
+        # Готовые ответы сами отвечают на сообщения, пришедшие до них
+        await asyncio.gather(*(buffer.rule_task for buffer in self._buffers.values() if buffer.rule_task),
+                             return_exceptions=True)
+        await asyncio.gather(
+            *(self._process(chat_id, buffer) for chat_id, buffer in self._buffers.items() if buffer.texts),
+            return_exceptions=True,
+        )
+        await asyncio.gather(*(buffer.send_task for buffer in self._buffers.values() if buffer.send_task),
+                             return_exceptions=True)
+        # Ответ на оставшиеся сообщения не отправлен: ожидающие узнают об этом отменой
+        for buffer in self._buffers.values():
+            for waiter in buffer.waiters:
+                waiter.cancel()
+        self._buffers.clear()
+        self._room.set()
+
+    async def _run(self, chat_id: str, buffer: _ChatBuffer, rule_task: Optional[asyncio.Task]):
+        delay = min(self.window, self.max_wait - (time.monotonic() - buffer.first_at))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if rule_task:
+            # Ответ на сообщения после готового ответа уходит только после него
+            await asyncio.wait([rule_task])
+        if buffer.texts:
+            await self._process(chat_id, buffer)
+        self._release(chat_id, buffer)
+
+    async def _reply(self,
+                     chat_id: str,
+                     text: str,
+                     reply: str,
+                     buffer: _ChatBuffer,
+                     upto: int,
+                     previous: Optional[asyncio.Task],
+                     rule_task: Optional[asyncio.Task],
+                     waiter: asyncio.Future):
+        """
+        Отвечает на сообщения, пришедшие до сообщения с готовым ответом, затем записывает
+        ход с готовым ответом и ставит ответ в очередь отправки.
+
+        :param upto: Сколько сообщений чата было получено до сообщения с готовым ответом
+        :param waiter: Отметка о завершении сообщения с готовым ответом
+        """
+        waiting = [task for task in (previous, rule_task) if task]
+        if waiting:
+            await asyncio.wait(waiting)
+        if upto > buffer.taken:
+            await self._process(chat_id, buffer, upto - buffer.taken)
+        if self.record:
+            try:
+                await self.record(chat_id, text, reply)
+            except Exception as e:
+                logger.error(f"Ошибка при записи хода с готовым ответом для {chat_id}: {e}", exc_info=True)
+        buffer.send_task = asyncio.create_task(
+            self._send_after(chat_id, reply, buffer, buffer.send_task, [waiter])
+        )
+        if buffer.rule_task is asyncio.current_task():
+            buffer.rule_task = None
+        self._release(chat_id, buffer)
+
+    def _release(self, chat_id: str, buffer: _ChatBuffer):
+        """Удаляет буфер чата, когда ему нечего ждать и нечего отправлять"""
+        current = asyncio.current_task()
+        busy = [
+            task for task in (buffer.task, buffer.rule_task, buffer.send_task)
+            if task and task is not current and not task.done()
+        ]
+        if buffer.texts or buffer.admitted or busy:
+            return
+        if self._buffers.get(chat_id) is buffer:
+            del self._buffers[chat_id]
+            self._room.set()
+
+    async def _process(self, chat_id: str, buffer: _ChatBuffer, count: Optional[int] = None):
+        """Ход разговора по первым count ожидающим сообщениям (по умолчанию по всем)"""
+        count = len(buffer.texts) if count is None else min(count, len(buffer.texts))
+        text = "\n".join(buffer.texts[:count])
+        error = None
+        buffer.generating = True
+        try:
+            if self.limiter:
+                async with self.limiter:
+                    reply = await self.generate(chat_id, text)
+            else:
+                reply = await self.generate(chat_id, text)
+        except asyncio.CancelledError:
+            # Сообщения остаются в буфере и войдут в следующий ход
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при генерации ответа для {chat_id}: {e}", exc_info=True)
+            reply = None
+            error = e
+        finally:
+            buffer.generating = False
+
+        # Ход завершен: дальше без await, новое сообщение попадет уже в следующий ход
+        waiters = buffer.waiters[:count]
+        del buffer.texts[:count]
+        del buffer.waiters[:count]
+        buffer.taken += count
+        self.turns += 1
+        metrics.incr("debounce.turns")
+        if count > 1:
+            self.coalesced += count - 1
+            metrics.incr("debounce.coalesced", count - 1)
+            logger.info(f"Сообщений от {chat_id} объединено в один ход: {count}")
+        if reply:
+            buffer.send_task = asyncio.create_task(
+                self._send_after(chat_id, reply, buffer, buffer.send_task, waiters)
+            )
+        else:
+            self._settle(waiters, error)
+
+    async def _send_after(self,
+                          chat_id: str,
+                          reply: str,
+                          buffer: _ChatBuffer,
+                          previous: Optional[asyncio.Task],
+                          waiters: List[asyncio.Future]):
+        if previous:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            await self.send(chat_id, reply)
+            self._settle(waiters)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке ответа {chat_id}: {e}", exc_info=True)
+            self._settle(waiters, e)
+        finally:
+            # Отправку прервали: ответ мог не уйти, ожидающие узнают об этом отменой
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.cancel()
+            if buffer.send_task is asyncio.current_task():
+                buffer.send_task = None
+                self._release(chat_id, buffer)
+
+    @staticmethod
+    def _settle(waiters: List[asyncio.Future], error: Optional[BaseException] = None):
+        """Завершает отметки сообщений хода: успешно или с ошибкой генерации/отправки"""
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if error is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(error)
@@ -1,50 +1,102 @@
 # bot_whatsapp/controller/green_api_heandler.py
 import aiohttp
 import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from typing import Dict, Optional
+from settings.config import load_config
 
 
 logger = logging.getLogger(__name__)
 
+
+class GreenAPIError(Exception):
+    """Ошибочный HTTP-ответ Green API"""
+
+    def __init__(self, status: int, body: str = "", retry_after: Optional[float] = None):
+        super().__init__(f"Green API вернул статус {status}: {body[:200]}")
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        """Превышение лимита и ошибки сервера можно повторить"""
+        return self.status == 429 or self.status >= 500
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата) в секунды ожидания"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
 class GreenAPIHandler:
     def __init__(self, instance_id: str, api_token: str):
         self.instance_id = instance_id
         self.api_token = api_token
+        self.config = load_config()
         # Формируем базовый URL для запросов
-        self.base_url = f"https://api.green-api.com/waInstance{instance_id}"
-        # Сессия HTTP-клиента (инициализируется позже)
+        self.base_url = f"{self.config.GREEN_API_URL.rstrip('/')}/waInstance{instance_id}"
+        # Общая HTTP-сессия с пулом keep-alive соединений (открывается в start)
         self.session: Optional[aiohttp.ClientSession] = None
+        # Таймауты отдельных запросов
+        self.receive_timeout = aiohttp.ClientTimeout(total=self.config.GREEN_API_RECEIVE_TIMEOUT)
+        self.delete_timeout = aiohttp.ClientTimeout(total=self.config.GREEN_API_DELETE_TIMEOUT)
+        self.send_timeout = aiohttp.ClientTimeout(total=self.config.GREEN_API_SEND_TIMEOUT)
         logger.info(f"Инициализация GreenAPIHandler для инстанса {instance_id}")
 
-    async def __aenter__(self):
-        """Контекстный менеджер для автоматического открытия HTTP-сессии"""
+    async def start(self):
+        """Открывает HTTP-сессию, которая живет все время работы бота"""
         if not self.session or self.session.closed:
-            self.session = aiohttp.ClientSession()
+            connector = aiohttp.TCPConnector(
+                limit=self.config.GREEN_API_CONNECTION_LIMIT,
+                ttl_dns_cache=self.config.GREEN_API_DNS_TTL,
+                keepalive_timeout=self.config.GREEN_API_KEEPALIVE_TIMEOUT,
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+            logger.info(f"Открыт пул соединений Green API (лимит {self.config.GREEN_API_CONNECTION_LIMIT})")
         return self
 
-    async def __aexit__(self, exc_type, exc, tb):
-        """Контекстный менеджер для автоматического закрытия HTTP-сессии"""
+    async def close(self):
         if self.session and not self.session.closed:
             await self.session.close()
+            logger.info("Пул соединений Green API закрыт")
 
-    async def send_message(self, phone: str, message: str) -> Dict:
-        # Если сессия не инициализирована или закрыта, создаю временную сессию
-        if not self.session or self.session.closed:
-            async with aiohttp.ClientSession() as session:
-                return await self._send_message(session, phone, message)
-        return await self._send_message(self.session, phone, message)
+    async def __aenter__(self):
+        """Контекстный менеджер: открывает сессию на время жизни владельца"""
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """Контекстный менеджер: закрывает сессию вместе с пулом соединений"""
+        await self.close()
 
-    async def receive_notification(self) -> Dict:
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # Если сессия еще не открыта владельцем, открываю ее один раз и переиспользую
         if not self.session or self.session.closed:
-            async with aiohttp.ClientSession() as session:
-                return await self._receive_notification(session)
-        return await self._receive_notification(self.session)
+            await self.start()
+        return self.session
+
+    async def send_message(self, phone: str, message: str) -> Dict:
+        return await self._send_message(await self._get_session(), phone, message)
+
+    async def receive_notification(self, receive_timeout: Optional[int] = None) -> Dict:
+        """
+        :param receive_timeout: Время long-poll ожидания уведомления на стороне Green API (5-60 сек)
+        """
+        return await self._receive_notification(await self._get_session(), receive_timeout)
 
     async def delete_notification(self, receipt_id: str) -> Dict:
-        if not self.session or self.session.closed:
-            async with aiohttp.ClientSession() as session:
-                return await self._delete_notification(session, receipt_id)
-        return await self._delete_notification(self.session, receipt_id)
+        return await self._delete_notification(await self._get_session(), receipt_id)
 
 #* Вспомогательные функции
     # Логика отправки сообщений
@@ -54,7 +106,14 @@ class GreenAPIHandler:
             "chatId": phone,
             "message": message
         }
-        async with session.post(endpoint, json=payload) as response:
+        async with session.post(endpoint, json=payload, timeout=self.send_timeout) as response:
+            if response.status >= 400:
+                # Статус и Retry-After нужны отправителю, чтобы решить, повторять ли запрос
+                raise GreenAPIError(
+                    response.status,
+                    await response.text(),
+                    parse_retry_after(response.headers.get("Retry-After")),
+                )
             result = await response.json()
             logger.info(f"Отправка сообщения на {phone}")
             logger.info(f"Эндпоинт: {endpoint}")
@@ -64,17 +123,24 @@ class GreenAPIHandler:
             return result
 
     # Логика получения уведомлений
-    async def _receive_notification(self, session) -> Dict:
+    async def _receive_notification(self, session, receive_timeout: Optional[int] = None) -> Dict:
         endpoint = f"{self.base_url}/receiveNotification/{self.api_token}"
-        async with session.get(endpoint) as response:
+        params = None
+        timeout = self.receive_timeout
+        if receive_timeout:
+            params = {"receiveTimeout": receive_timeout}
+            # Запрос висит на сервере до receive_timeout, поэтому таймаут клиента больше
+            timeout = aiohttp.ClientTimeout(total=receive_timeout + self.receive_timeout.total)
+        async with session.get(endpoint, params=params, timeout=timeout) as response:
             result = await response.json()
-            logger.info("Уведомление получено успешно")
+            if result:
+                logger.info("Уведомление получено успешно")
             return result
 
     # Логика удаления уведомлений
     async def _delete_notification(self, session, receipt_id: str) -> Dict:
         endpoint = f"{self.base_url}/deleteNotification/{self.api_token}/{receipt_id}"
-        async with session.delete(endpoint) as response:
+        async with session.delete(endpoint, timeout=self.delete_timeout) as response:
             result = await response.json()
             logger.info(f"Уведомление с ID {receipt_id} удалено успешно")
             return result
@@ -0,0 +1,233 @@
+# bot_whatsapp/controller/outbound_dispatcher.py
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+import aiohttp
+from settings.config import load_config
+from settings.connection_db import async_session
+from settings.logger import setup_logger
+from bots.bot_whatsapp.controller.green_api_handler import GreenAPIHandler, GreenAPIError
+from bots.bot_whatsapp.db.queries import create_failed_message
+from bots.bot_whatsapp.utils.metrics import metrics
+
+
+logger = setup_logger(__name__)
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов по алгоритму token bucket"""
+
+    def __init__(self, rate: float, capacity: int):
+        """
+        :param rate: Скорость пополнения, токенов в секунду
+        :param capacity: Максимальный запас токенов (допустимый всплеск)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу токенов (например, по Retry-After)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class OutboundMessage:
+    chat_id: str
+    message: str
+    attempts: int = 0
+    last_status: Optional[int] = None
+    last_error: Optional[str] = None
+
+
+class OutboundDispatcher:
+    """
+    Очередь исходящих сообщений Green API.
+
+    Обработчик только ставит сообщение в очередь, доставкой занимаются воркеры:
+    общий лимит частоты, повторы с задержкой (429/5xx, Retry-After), а сообщения,
+    которые так и не удалось доставить, сохраняются в failed_messages.
+
+    Сообщения одного чата доставляются строго по порядку: пока предыдущее сообщение
+    чата отправляется или ждет повтора, следующие ждут в очереди этого чата.
+    """
+
+    def __init__(self, green_api: GreenAPIHandler):
+        self.green_api = green_api
+        self.config = load_config()
+        self.bucket = TokenBucket(self.config.OUTBOUND_RATE, self.config.OUTBOUND_BURST)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.OUTBOUND_QUEUE_SIZE)
+        self.workers: list[asyncio.Task] = []
+        # Недоставленные сообщения чатов, которые сейчас отправляются: первое - текущее
+        self._chats: Dict[str, Deque[OutboundMessage]] = {}
+        # Отложенные повторы: задача -> сообщение
+        self._retries: Dict[asyncio.Task, OutboundMessage] = {}
+
+    async def start(self):
+        self.workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.config.OUTBOUND_WORKERS)
+        ]
+        logger.info(
+            f"Очередь исходящих запущена: {self.config.OUTBOUND_RATE} сообщений/сек, "
+            f"всплеск {self.config.OUTBOUND_BURST}, воркеров {len(self.workers)}"
+        )
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Дожидается отправки очереди и отложенных повторов (не дольше timeout), затем
+        останавливает воркеры. Неотправленные сообщения сохраняются в failed_messages.
+        """
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        tasks = [*self.workers, *self._retries]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
+        self._retries.clear()
+
+        # Повторно поставленные в очередь сообщения уже есть в очередях своих чатов
+        leftover = [item for pending in self._chats.values() for item in pending]
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            self.queue.task_done()
+            if item.attempts == 0:
+                leftover.append(item)
+        self._chats.clear()
+        if leftover:
+            logger.warning(f"Не отправлено сообщений при остановке: {len(leftover)}")
+        for item in leftover:
+            item.last_error = item.last_error or "Бот остановлен до отправки"
+            await self._dead_letter(item)
+
+    async def _drain(self):
+        """Ожидает, пока не останется ни сообщений в очереди, ни отложенных повторов"""
+        while True:
+            await self.queue.join()
+            if not self._retries:
+                return
+            await asyncio.wait(list(self._retries))
+
+    async def enqueue(self, chat_id: str, message: str):
+        """Ставит сообщение в очередь отправки, не дожидаясь доставки"""
+        if self.queue.full():
+            logger.warning("Очередь исходящих заполнена, ожидаю освобождения места.")
+        await self.queue.put(OutboundMessage(chat_id=chat_id, message=message))
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                if item.attempts == 0:
+                    pending = self._chats.get(item.chat_id)
+                    if pending is not None:
+                        # Чат занят предыдущим сообщением: его воркер отправит и это
+                        metrics.incr("outbound.held")
+                        pending.append(item)
+                        continue
+                    self._chats[item.chat_id] = deque([item])
+                # Повтор уже первый в очереди своего чата
+                await self._deliver_chat(item.chat_id)
+            finally:
+                self.queue.task_done()
+
+    async def _deliver_chat(self, chat_id: str):
+        """Отправляет сообщения чата по порядку, пока они есть или пока одно не ждет повтора"""
+        pending = self._chats[chat_id]
+        while pending:
+            item = pending[0]
+            try:
+                delay = await self._deliver(item)
+            except Exception as e:
+                logger.error(f"Ошибка отправки сообщения на {item.chat_id}: {e}", exc_info=True)
+                item.last_error = repr(e)
+                await self._dead_letter(item)
+                delay = None
+            if delay is not None:
+                # Чат остается занятым: следующие сообщения ждут доставки этого
+                task = asyncio.create_task(self._retry_later(item, delay))
+                self._retries[task] = item
+                task.add_done_callback(lambda done: self._retries.pop(done, None))
+                return
+            pending.popleft()
+        del self._chats[chat_id]
+
+    async def _deliver(self, item: OutboundMessage) -> Optional[float]:
+        """Одна попытка отправки. Возвращает задержку перед повтором или None, если повтора не будет"""
+        await self.bucket.acquire()
+        item.attempts += 1
+        try:
+            with metrics.timer("outbound.send"):
+                await self.green_api.send_message(item.chat_id, item.message)
+            metrics.incr("outbound.sent")
+            return None
+        except GreenAPIError as e:
+            item.last_status, item.last_error = e.status, str(e)
+            retryable, retry_after = e.retryable, e.retry_after
+            if e.status == 429:
+                # Лимит общий для инстанса: притормаживаю все воркеры
+                self.bucket.pause(retry_after or self._backoff(item.attempts))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            item.last_status, item.last_error = None, repr(e)
+            retryable, retry_after = True, None
+
+        if not retryable or item.attempts >= self.config.OUTBOUND_MAX_ATTEMPTS:
+            await self._dead_letter(item)
+            return None
+
+        delay = max(retry_after or 0.0, self._backoff(item.attempts))
+        metrics.incr("outbound.retried")
+        logger.warning(
+            f"Не удалось отправить сообщение на {item.chat_id} (попытка {item.attempts}): "
+            f"{item.last_error}. Повтор через {delay:.1f} сек"
+        )
+        return delay
+
+    def _backoff(self, attempt: int) -> float:
+        """Экспоненциальная задержка со случайным разбросом (full jitter)"""
+        ceiling = min(self.config.OUTBOUND_BACKOFF_MAX, self.config.OUTBOUND_BACKOFF_BASE * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    async def _retry_later(self, item: OutboundMessage, delay: float):
+        await asyncio.sleep(delay)
+        await self.queue.put(item)
+
+    async def _dead_letter(self, item: OutboundMessage):
+        metrics.incr("outbound.dead_lettered")
+        logger.error(
+            f"Сообщение на {item.chat_id} не доставлено после {item.attempts} попыток: {item.last_error}"
+        )
+        try:
+            async with async_session() as session:
+                await create_failed_message(session, {
+                    "chat_id": item.chat_id,
+                    "message": item.message,
+                    "attempts": item.attempts,
+                    "last_status": item.last_status,
+                    "last_error": item.last_error,
+                })
+        except Exception as db_error:
+            logger.error(f"Ошибка при сохранении недоставленного сообщения в БД: {db_error}")
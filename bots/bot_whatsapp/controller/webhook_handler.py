@@ -1,28 +1,62 @@
 # bot_whatsapp/utils/webhook_handler.py
-from typing import Dict
+import asyncio
+from typing import Dict, Optional
 import logging
 from settings.logger import setup_logger
 from settings.config import load_config
-from bots.bot_whatsapp.stack.traveler import AITraveler
+from bots.bot_whatsapp.stack.rules import RuleEngine
+from bots.bot_whatsapp.stack.traveler_cache import TravelerCache
 from bots.bot_whatsapp.utils.extract_message import extract_message_text
 from bots.bot_whatsapp.controller.green_api_handler import GreenAPIHandler
+from bots.bot_whatsapp.controller.outbound_dispatcher import OutboundDispatcher
+from bots.bot_whatsapp.controller.debouncer import MessageDebouncer
 
 
 logger = setup_logger(__name__)
 
 class WebhookHandler:
     """Класс для обработки вебхуков WhatsApp."""
-    def __init__(self):
+    def __init__(self,
+                 green_api: Optional[GreenAPIHandler] = None,
+                 outbound: Optional[OutboundDispatcher] = None,
+                 limiter: Optional[asyncio.Semaphore] = None):
+        """
+        :param green_api: Клиент Green API владельца (бота), чтобы использовать общий пул соединений
+        :param outbound: Очередь исходящих сообщений; без нее ответ отправляется напрямую
+        :param limiter: Общий с обработчиками уведомлений лимит одновременных генераций ответа
+        """
         self.config = load_config()
-        self.ai_travelers = {}
+        # AITraveler живут в памяти ограниченное время, холодные разговоры вытесняются
+        self.ai_travelers = TravelerCache(
+            max_size=self.config.TRAVELER_CACHE_SIZE,
+            ttl=self.config.TRAVELER_CACHE_TTL,
+        )
+        # Готовые ответы на изображения и вложения без запроса к модели, реакции без ответа
+        self.rules = RuleEngine()
         instance_id = self.config.WHATSAPP_INSTANCE_ID
         api_token = self.config.WHATSAPP_API_TOKEN
             
-        self.green_api = GreenAPIHandler(instance_id, api_token)
+        self.green_api = green_api or GreenAPIHandler(instance_id, api_token)
+        self.outbound = outbound
+        # Несколько сообщений подряд от одного клиента получают один общий ответ
+        self.debouncer = MessageDebouncer(
+            generate=self._generate_reply,
+            send=self._send_reply,
+            window=self.config.WHATSAPP_DEBOUNCE_WINDOW,
+            max_wait=self.config.WHATSAPP_DEBOUNCE_MAX_WAIT,
+            record=self._record_turn,
+            limiter=limiter,
+            max_chats=self.config.WHATSAPP_DEBOUNCE_MAX_CHATS,
+        )
 
 
     async def handle_incoming_message(self, body: Dict):
-        """Обрабатывает входящее сообщение."""
+        """
+        Обрабатывает входящее сообщение.
+
+        Возвращает отправленный ответ, а при объединении сообщений (WHATSAPP_DEBOUNCE_WINDOW > 0) -
+        future, который завершится после отправки ответа на это сообщение
+        """
         message_data = body.get("messageData", {})
         message_text = extract_message_text(message_data)
         logger.info(f"Входящее сообщение {message_text}")
@@ -31,18 +65,45 @@ class WebhookHandler:
         if not phone_number:
             raise ValueError("Номер телефона отсутствует в данных вебхука.")
 
-        # Инициализируем AITraveler для нового номера телефона
-        if phone_number not in self.ai_travelers:
-            logger.info(f"Создание нового AITraveler для номера: {phone_number}")
-            self.ai_travelers[phone_number] = AITraveler(phone_number=phone_number)
-            
-        ai_traveler = self.ai_travelers[phone_number]
-        ai_response = await ai_traveler.process_message(message_text)
+        if self.rules.ignores(message_data.get("typeMessage", "")):
+            return None
 
-        logger.info(f"Ответ от ИИ {ai_response}")
-        await self.green_api.send_message(phone_number, ai_response)
+        ai_response = self.rules.reply(
+            message_data.get("typeMessage", ""),
+            message_text,
+            {"sender_name": body.get("senderData", {}).get("senderName", "")},
+        )
+        if self.config.WHATSAPP_DEBOUNCE_WINDOW > 0:
+            if ai_response is None:
+                # Ответ модели будет отправлен после паузы в сообщениях клиента
+                return self.debouncer.submit(phone_number, message_text)
+            # Готовый ответ уходит после ответа на уже ожидающие сообщения
+            return self.debouncer.submit_reply(phone_number, message_text, ai_response)
+
+        if ai_response is None:
+            ai_response = await self._generate_reply(phone_number, message_text)
+        else:
+            await self._record_turn(phone_number, message_text, ai_response)
+
+        await self._send_reply(phone_number, ai_response)
         return ai_response
 
+    async def _record_turn(self, phone_number: str, message_text: str, ai_response: str):
+        # AITraveler для номера берется из кэша или создается заново
+        ai_traveler = await self.ai_travelers.get(phone_number)
+        await ai_traveler.record_turn(message_text, ai_response)
+
+    async def _generate_reply(self, phone_number: str, message_text: str) -> str:
+        ai_traveler = await self.ai_travelers.get(phone_number)
+        return await ai_traveler.process_message(message_text)
+
+    async def _send_reply(self, phone_number: str, ai_response: str):
+        logger.info(f"Ответ от ИИ {ai_response}")
+        if self.outbound:
+            await self.outbound.enqueue(phone_number, ai_response)
+        else:
+            await self.green_api.send_message(phone_number, ai_response)
+
 
     async def handle_outgoing_message(self, body: Dict):
         """Обрабатывает исходящее сообщение."""
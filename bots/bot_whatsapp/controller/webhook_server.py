@@ -0,0 +1,73 @@
+# bot_whatsapp/controller/webhook_server.py
+import hmac
+import json
+from typing import Awaitable, Callable, Dict, Optional
+from aiohttp import web
+from settings.logger import setup_logger
+
+
+logger = setup_logger(__name__)
+
+
+class WebhookServer:
+    """HTTP-сервер для приема вебхуков Green API (push-режим вместо опроса)"""
+
+    def __init__(self,
+                 on_notification: Callable[[Dict], Awaitable[bool]],
+                 host: str = "0.0.0.0",
+                 port: int = 8080,
+                 path: str = "/webhook",
+                 token: str = ""):
+        """
+        :param on_notification: Прием уведомления (запись во входящие и постановка в очередь), False - если принять не удалось
+        :param host: Адрес, на котором слушает сервер
+        :param port: Порт сервера
+        :param path: Путь, на который Green API отправляет вебхуки
+        :param token: Токен webhookUrlToken из настроек инстанса (пустой - без проверки)
+        """
+        self.on_notification = on_notification
+        self.host = host
+        self.port = port
+        self.path = path
+        self.token = token
+        self.runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.router.add_post(self.path, self.handle_webhook)
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        logger.info(f"Сервер вебхуков запущен на {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+            logger.info("Сервер вебхуков остановлен")
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        """Подтверждает вебхук после записи во входящие, обработка идет через общую очередь бота"""
+        if self.token:
+            expected = f"Bearer {self.token}"
+            if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+                logger.warning(f"Вебхук с неверным токеном от {request.remote}")
+                return web.Response(status=401)
+
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            logger.warning(f"Вебхук с некорректным JSON от {request.remote}")
+            return web.Response(status=400)
+
+        # Приводим вебхук к формату receiveNotification, чтобы путь обработки был общим.
+        # У вебхука нет квитанции: удалять из очереди Green API нечего
+        notification = {"receiptId": 0, "body": body}
+        if not await self.on_notification(notification):
+            # Green API повторит доставку вебхука позже
+            logger.warning("Очередь обработки заполнена или входящие недоступны, вебхук отклонен.")
+            return web.Response(status=503)
+
+        return web.json_response({"status": "ok"})
@@ -1,15 +1,24 @@
 # bot_whatsapp/controller/whatsapp_bot.py
 import asyncio
-from typing import Dict
+import time
+from typing import Dict, Optional, Set
+from functools import partial
 from datetime import datetime
 from settings.logger import setup_logger
-from settings.connection_db import async_session
+from settings.config import load_config
 from urllib.error import HTTPError
 from bots.bot_whatsapp.controller.green_api_handler import GreenAPIHandler
-from bots.bot_whatsapp.db.queries import save_notification_to_db
+from bots.bot_whatsapp.controller.outbound_dispatcher import OutboundDispatcher
+from bots.bot_whatsapp.db.inbox import NotificationInbox
+from bots.bot_whatsapp.db.notification_sink import NotificationSink
+from bots.bot_whatsapp.db.context_store import context_writer
 from bots.bot_whatsapp.utils.extract_message import extract_message_data
+from bots.bot_whatsapp.utils.keyed_scheduler import KeyedScheduler
+from bots.bot_whatsapp.utils.metrics import metrics
 from bots.bot_whatsapp.controller.webhook_handler import WebhookHandler
+from bots.bot_whatsapp.controller.webhook_server import WebhookServer
 from bots.bot_whatsapp.stack.traveler import AITraveler
+from bots.bot_whatsapp.stack.chatgpt_ai import close_client
 
 
 logger = setup_logger(__name__)
@@ -17,42 +26,325 @@ logger = setup_logger(__name__)
 
 class WhatsAppBot:
     def __init__(self, instance_id: str, api_token: str):
+        self.config = load_config()
         self.green_api = GreenAPIHandler(instance_id, api_token)
-        self.webhook_handler = WebhookHandler()
+        self.outbound = OutboundDispatcher(self.green_api)
+        # Уведомления пишутся в БД пакетами в фоне, не задерживая ответ
+        self.notification_sink = NotificationSink(
+            max_buffer=self.config.NOTIFICATION_BUFFER_SIZE,
+            batch_size=self.config.NOTIFICATION_BATCH_SIZE,
+            flush_interval=self.config.NOTIFICATION_FLUSH_INTERVAL,
+        )
+        # Уведомления сохраняются до удаления из Green API и удаляются отсюда после отправки ответа
+        self.inbox = NotificationInbox()
+        # Отметки во входящих после отложенных ответов и повторы неудачных уведомлений
+        self._inbox_tasks: Set[asyncio.Task] = set()
+        self._retry_tasks: Set[asyncio.Task] = set()
+        # Сообщения одного чата обрабатываются по порядку, разных чатов - параллельно
+        self.scheduler = KeyedScheduler(
+            concurrency=self.config.WHATSAPP_WORKERS,
+            lane_size=self.config.WHATSAPP_LANE_SIZE,
+            idle_timeout=self.config.WHATSAPP_LANE_IDLE_TIMEOUT,
+            max_overflow=self.config.WHATSAPP_QUEUE_SIZE,
+        )
+        # Ответы после паузы в сообщениях генерируются вне полос, но под тем же лимитом обработчиков
+        self.webhook_handler = WebhookHandler(
+            green_api=self.green_api,
+            outbound=self.outbound,
+            limiter=self.scheduler.semaphore,
+        )
         self.ai_traveler = AITraveler()
+        # Ограниченная очередь между опросом API и планировщиком: пары (уведомление, ID во входящих)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.WHATSAPP_QUEUE_SIZE)
+        self.dispatcher: Optional[asyncio.Task] = None
+        self._last_poll_counters: Dict[str, int] = {}
 
     async def start(self):
         logger.info("Запуск бота WhatsApp...")
+        self.dispatcher = asyncio.create_task(self._dispatch_loop())
+        logger.info(
+            f"Параллельных обработчиков: {self.scheduler.concurrency}, размер очереди: {self.queue.maxsize}"
+        )
+        # Одна HTTP-сессия Green API на все время работы бота
+        async with self.green_api:
+            await self.outbound.start()
+            await self.webhook_handler.ai_travelers.start(self.config.TRAVELER_CACHE_SWEEP_INTERVAL)
+            await context_writer.start()
+            await self.notification_sink.start()
+            try:
+                await self._recover_inbox()
+                if self.config.WHATSAPP_RECEIVE_MODE == "webhook":
+                    await self._serve_webhooks()
+                else:
+                    await self._poll_loop()
+            finally:
+                await self._shutdown()
+
+    async def _shutdown(self):
+        """
+        Останавливает компоненты по порядку. Ошибка остановки одного записывается в лог
+        и не мешает остальным: буферы уведомлений, контекстов и исходящих не теряются
+        """
+        debouncer = self.webhook_handler.debouncer
+
+        async def stop_dispatcher():
+            self.dispatcher.cancel()
+            await asyncio.gather(self.dispatcher, return_exceptions=True)
+
+        async def stop_debouncer():
+            # Накопленные сообщения получают ответ до остановки AITraveler и отправки
+            await debouncer.stop()
+            logger.info(f"Объединение сообщений: {debouncer.stats()}")
+
+        async def settle_inbox():
+            # Отвеченные уведомления удаляются из входящих, ожидающие повтора остаются до перезапуска
+            for task in self._retry_tasks:
+                task.cancel()
+            await asyncio.gather(*self._retry_tasks, *self._inbox_tasks, return_exceptions=True)
+
+        steps = (
+            ("распределение уведомлений", stop_dispatcher),
+            ("планировщик", self.scheduler.close),
+            ("объединение сообщений", stop_debouncer),
+            ("входящие", settle_inbox),
+            ("кэш AITraveler", self.webhook_handler.ai_travelers.stop),
+            # Все отложенные контексты записываются до выхода
+            ("запись контекста", context_writer.stop),
+            ("запись уведомлений", self.notification_sink.stop),
+            ("исходящие сообщения", self.outbound.stop),
+            ("клиент OpenAI", close_client),
+        )
+        for name, stop in steps:
+            try:
+                await stop()
+            except Exception as e:
+                logger.error(f"Ошибка при остановке ({name}): {e}", exc_info=True)
+
+    async def _serve_webhooks(self):
+        """Принимает вебхуки Green API через HTTP-сервер вместо опроса"""
+        server = WebhookServer(
+            self.accept_notification,
+            host=self.config.WEBHOOK_HOST,
+            port=self.config.WEBHOOK_PORT,
+            path=self.config.WEBHOOK_PATH,
+            token=self.config.WEBHOOK_TOKEN,
+        )
+        await server.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    async def _recover_inbox(self):
+        """Ставит в обработку уведомления, не обработанные до прошлой остановки"""
+        pending = await self.inbox.pending()
+        if pending:
+            logger.warning(f"Необработанных уведомлений с прошлого запуска: {len(pending)}, обрабатываю.")
+        for inbox_id, notification in pending:
+            metrics.incr("green_api.recovered")
+            await self.queue.put((notification, inbox_id))
+
+    async def accept_notification(self, notification: Dict) -> bool:
+        """
+        Прием вебхука: запись во входящие и постановка в очередь. False - если очередь
+        заполнена или запись в БД не удалась, тогда Green API повторит вебхук позже
+        """
+        if self.queue.full():
+            return False
+        try:
+            inbox_id = await self.inbox.save(notification)
+        except Exception as e:
+            logger.error(f"Ошибка при записи вебхука во входящие: {e}")
+            return False
+        # Вебхук уже во входящих: он будет обработан, даже если очередь успела заполниться
+        await self.queue.put((notification, inbox_id))
+        return True
+
+    async def _poll_loop(self):
+        """
+        Получает уведомления от API и складывает их в очередь обработки.
+
+        Пока уведомления идут, очередь Green API вычитывается без пауз. Пустой ответ
+        приходит только после long-poll ожидания на сервере, поэтому следующий опрос
+        начинается сразу. Пауза, растущая экспоненциально до WHATSAPP_POLL_BACKOFF_MAX,
+        делается после ошибок, а также после пустых ответов, если long-poll выключен.
+        """
+        api = self.green_api
+        idle_delay = 0.0
+        last_report = time.monotonic()
         while True:
             try:
-                async with self.green_api as api:
-                    # Получаю уведомление от API
-                    notification = await api.receive_notification()
-                    
-                    if notification:
-                        await self.message_handler(notification)
-                        try:
-                            await api.delete_notification(notification.get("receiptId"))
-                        except Exception as delete_error:
-                            logger.error(f"Ошибка при удалении уведомления: {delete_error}")
+                # Получаю уведомление от API
+                metrics.incr("green_api.polls")
+                with metrics.timer("green_api.receive"):
+                    notification = await api.receive_notification(self.config.GREEN_API_LONG_POLL_TIMEOUT)
+                
+                if notification:
+                    idle_delay = 0.0
+                    if self.queue.full():
+                        logger.warning("Очередь обработки заполнена, ожидаю свободного обработчика.")
+                    # Уведомление удаляется из Green API только после записи во входящие в БД:
+                    # если записать не удалось, оно придет снова при следующем опросе
+                    inbox_id = await self.inbox.save(notification)
+                    # Ожидание свободного места в очереди и есть backpressure:
+                    # пока обработчики заняты, новые уведомления не забираются
+                    await self.queue.put((notification, inbox_id))
+                    # Green API отдает одно и то же уведомление, пока оно не удалено,
+                    # поэтому удаляю его сразу после постановки в очередь
+                    try:
+                        await api.delete_notification(notification.get("receiptId"))
+                    except Exception as delete_error:
+                        logger.error(f"Ошибка при удалении уведомления: {delete_error}")
+                else:
+                    metrics.incr("green_api.polls_empty")
+                    logger.debug("Пустой ответ от API, новых уведомлений нет.")
+                    # Сервер уже ждал новых уведомлений весь long-poll таймаут
+                    if self.config.GREEN_API_LONG_POLL_TIMEOUT > 0:
+                        idle_delay = 0.0
                     else:
-                        logger.warning("Пустой ответ от API. Пропускаю обработку уведомления.")
+                        idle_delay = self._next_idle_delay(idle_delay)
             
             except Exception as e:
+                metrics.incr("green_api.polls_failed")
                 if isinstance(e, HTTPError) and e.response.status_code == 500:
                     logger.warning(f"Ошибка 500 от API, продолжаю работу.")
                 else:
                     logger.error(f"Ошибка при опросе: {e}")
-            
-            await asyncio.sleep(1)
+                idle_delay = self._next_idle_delay(idle_delay)
+
+            if time.monotonic() - last_report >= self.config.WHATSAPP_POLL_REPORT_INTERVAL:
+                self._report_poll_metrics(time.monotonic() - last_report)
+                last_report = time.monotonic()
+
+            if idle_delay:
+                await asyncio.sleep(idle_delay)
+
+    def _next_idle_delay(self, current: float) -> float:
+        """Экспоненциальная пауза между пустыми опросами с ограничением сверху"""
+        if not current:
+            return self.config.WHATSAPP_POLL_BACKOFF_MIN
+        return min(current * 2, self.config.WHATSAPP_POLL_BACKOFF_MAX)
+
+    def _report_poll_metrics(self, interval: float):
+        """Пишет в лог частоту опросов и долю пустых ответов за прошедший интервал"""
+        counters = metrics.counters
+        polls = counters["green_api.polls"] - self._last_poll_counters.get("polls", 0)
+        empty = counters["green_api.polls_empty"] - self._last_poll_counters.get("empty", 0)
+        self._last_poll_counters = {
+            "polls": counters["green_api.polls"],
+            "empty": counters["green_api.polls_empty"],
+        }
+        rate = polls / interval if interval else 0.0
+        empty_ratio = empty / polls if polls else 0.0
+        logger.info(
+            f"Опрос Green API: {rate:.2f} запросов/сек, пустых ответов {empty_ratio:.0%} "
+            f"({empty} из {polls}), в очереди {self.queue.qsize()}"
+        )
+
+    async def _dispatch_loop(self):
+        """
+        Раскладывает уведомления из очереди по полосам чатов. Ответы после паузы генерируются
+        вне полос, поэтому новый чат принимается, только когда у объединения сообщений есть
+        для него место: иначе медленная генерация не сдерживала бы прием уведомлений
+        """
+        debouncer = self.webhook_handler.debouncer
+        while True:
+            notification, inbox_id = await self.queue.get()
+            try:
+                chat_key = self.get_chat_key(notification)
+                if self.config.WHATSAPP_DEBOUNCE_WINDOW > 0:
+                    await debouncer.wait_room(chat_key)
+                try:
+                    await self.scheduler.submit(chat_key, partial(self._handle, notification, inbox_id))
+                except Exception:
+                    debouncer.free_room(chat_key)
+                    raise
+                depth = self.scheduler.depth(chat_key)
+                if depth > 1:
+                    logger.info(f"В очереди чата {chat_key} ожидает сообщений: {depth}")
+            except Exception as e:
+                logger.error(f"Ошибка при распределении уведомления: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    @staticmethod
+    def get_chat_key(notification: Dict) -> str:
+        """Ключ, по которому сериализуется обработка: отправитель или ID чата"""
+        body = notification.get("body", {})
+        sender_data = body.get("senderData", {})
+        key = sender_data.get("sender") or sender_data.get("chatId")
+        # Служебные уведомления без чата не связаны друг с другом
+        return key or f"notification:{id(notification)}"
 
     async def send_message(self, phone: str, message: str) -> Dict:
         """Прокси-метод для отправки сообщения"""
-        async with self.green_api as api:
-            return await api.send_message(phone, message)
+        return await self.green_api.send_message(phone, message)
+
+    async def _handle(self, notification: Dict, inbox_id: int):
+        """
+        Обработка уведомления с отметкой во входящих. Строка удаляется, когда ответ отправлен:
+        при объединении сообщений - не по возврату обработчика, а по завершении отложенного
+        ответа. Прерванное остановкой бота уведомление остается и будет обработано после перезапуска
+        """
+        try:
+            reply = await self.message_handler(notification)
+        except Exception as e:
+            logger.error(f"Ошибка обработки уведомления: {e}", exc_info=True)
+            await self._settle(notification, inbox_id, e)
+            return
+        finally:
+            # Место чата, занятое при распределении, держится, пока он ждет ответа
+            self.webhook_handler.debouncer.free_room(self.get_chat_key(notification))
+        if reply is None:
+            await self._settle(notification, inbox_id, None)
+        else:
+            reply.add_done_callback(partial(self._on_reply_done, notification, inbox_id))
+
+    def _on_reply_done(self, notification: Dict, inbox_id: int, reply: asyncio.Future):
+        # Ответ не отправлен из-за остановки: строка остается во входящих
+        if reply.cancelled():
+            return
+        task = asyncio.create_task(self._settle(notification, inbox_id, reply.exception()))
+        self._inbox_tasks.add(task)
+        task.add_done_callback(self._inbox_tasks.discard)
+
+    async def _settle(self, notification: Dict, inbox_id: int, error: Optional[BaseException]):
+        """
+        Удаляет обработанное уведомление из входящих. Неудачное ставится в очередь повторно
+        с растущей паузой, после WHATSAPP_INBOX_MAX_ATTEMPTS попыток удаляется
+        """
+        if error is None:
+            await self.inbox.done(inbox_id)
+            return
+        attempts = await self.inbox.fail(inbox_id)
+        if attempts is None:
+            return
+        if attempts >= self.config.WHATSAPP_INBOX_MAX_ATTEMPTS:
+            metrics.incr("green_api.inbox_dropped")
+            logger.error(
+                f"Уведомление {inbox_id} не обработано за {attempts} попыток и удалено из входящих: {error}"
+            )
+            await self.inbox.done(inbox_id)
+            return
+        metrics.incr("green_api.inbox_retried")
+        delay = self.config.WHATSAPP_INBOX_RETRY_DELAY * attempts
+        logger.warning(f"Уведомление {inbox_id} будет обработано повторно через {delay:.0f} сек (попытка {attempts}).")
+        task = asyncio.create_task(self._retry(notification, inbox_id, delay))
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def _retry(self, notification: Dict, inbox_id: int, delay: float):
+        # Повтор ставится в общую очередь вне полосы чата, чтобы не занимать обработчик на время паузы
+        await asyncio.sleep(delay)
+        await self.queue.put((notification, inbox_id))
+
+    async def message_handler(self, notification: Dict) -> Optional[asyncio.Future]:
+        """
+        Основная логика обработки полученных сообщений от WhatsApp.
 
-    async def message_handler(self, notification: Dict):
-        """Основная логика обработки полученных сообщений от WhatsApp"""
+        Ошибка обработчика пробрасывается. Если ответ будет отправлен позже (объединение
+        сообщений), возвращает future, который завершится после его отправки
+        """
         #* Сохраняю все данные сообщения
         logger.info(f"Получено уведомление/сообщение: {notification}")
         
@@ -63,8 +355,7 @@ class WhatsAppBot:
             data_to_save['timestamp'] = datetime.fromtimestamp(data_to_save['timestamp'])
             
         logger.info(f"\n\nДанные для сохранения: {data_to_save}\n\n")
-        async with async_session() as session:
-            await save_notification_to_db(session, data_to_save)
+        await self.notification_sink.submit(data_to_save)
 
         # --------------------------------------------------------------------
         #? Делаю проверку на TypeWebhook и произвожу манипуляции
@@ -85,7 +376,12 @@ class WhatsAppBot:
         if handler:
             try:
                 result = await handler(body)
-                logger.info(f"Результат обработки: {result}")
             except Exception as e:
                 logger.error(f"Ошибка обработки вебхука {webhook_type}: {str(e)}")
+                raise
+            if isinstance(result, asyncio.Future):
+                logger.info("Ответ будет отправлен после паузы в сообщениях клиента")
+                return result
+            logger.info(f"Результат обработки: {result}")
+        return None
 
@@ -0,0 +1,205 @@
+# bots/bot_whatsapp/db/context_store.py
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import cast, delete, func, select
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from settings.config import load_config
+from settings.connection_db import async_session
+from settings.logger import setup_logger
+from bots.bot_whatsapp.utils.metrics import metrics
+from .models import ConversationContext, ConversationMessage
+
+
+logger = setup_logger(__name__)
+
+
+class ContextWriteBehind:
+    """
+    Отложенная запись реплик разговоров в conversation_messages.
+
+    Каждая реплика - одна новая строка, ход разговора только добавляет ее в буфер.
+    Запись идет в фоне: раз в flush_interval секунд или при накоплении max_pending
+    реплик, все накопленные реплики пишутся одним многострочным INSERT.
+    """
+
+    # Ограничение числа строк в одном INSERT (лимит параметров запроса PostgreSQL)
+    BATCH_SIZE = 1000
+
+    def __init__(self, flush_interval: float = 2.0, max_pending: int = 100):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Незаписанные реплики по чатам, в порядке seq
+        self._pending: Dict[str, List[Dict]] = {}
+        self._pending_count = 0
+        # Реплики, которые сейчас пишутся в БД: их уже нет в _pending, но еще может не быть в таблице
+        self._flushing: Dict[str, List[Dict]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def append(self, chat_id: str, seq: int, role: str, content: str, token_count: Optional[int] = None):
+        """Добавляет реплику в буфер записи"""
+        self._pending.setdefault(chat_id, []).append({
+            "chat_id": chat_id,
+            "seq": seq,
+            "role": role,
+            "content": content,
+            "token_count": token_count,
+            "created_at": datetime.now(),
+        })
+        self._pending_count += 1
+        if self._pending_count >= self.max_pending:
+            self._wakeup.set()
+
+    def pending(self, chat_id: str) -> List[Dict]:
+        """Еще не записанные реплики чата"""
+        return list(self._pending.get(chat_id, []))
+
+    async def load_recent(self, chat_id: str, limit: int) -> Tuple[List[Dict], int]:
+        """
+        Последние реплики чата с учетом еще не записанных.
+
+        Незаписанные реплики берутся до запроса к БД вместе с теми, что пишутся прямо
+        сейчас: реплика, записанная во время запроса, окажется хотя бы в одном из источников.
+
+        :return: Реплики в хронологическом порядке и следующий свободный seq
+        """
+        unsaved = self._flushing.get(chat_id, []) + self.pending(chat_id)
+        with metrics.timer("db.context_load"):
+            async with async_session() as session:
+                stmt = (
+                    select(
+                        ConversationMessage.seq,
+                        ConversationMessage.role,
+                        ConversationMessage.content,
+                        ConversationMessage.token_count,
+                    )
+                    .where(ConversationMessage.chat_id == chat_id)
+                    .order_by(ConversationMessage.seq.desc())
+                    .limit(limit)
+                )
+                result = await session.execute(stmt)
+                rows = [row._asdict() for row in result.all()]
+
+        # Реплика может оказаться и в БД, и в буфере: остается одна на каждый seq
+        by_seq = {row["seq"]: row for row in rows}
+        for row in unsaved:
+            by_seq.setdefault(row["seq"], row)
+        rows = [by_seq[seq] for seq in sorted(by_seq)]
+        next_seq = rows[-1]["seq"] + 1 if rows else 0
+        return rows[-limit:], next_seq
+
+    async def load_summary(self, chat_id: str) -> Tuple[str, int]:
+        """
+        Сохраненное резюме старой части разговора.
+
+        :return: Текст резюме и seq первой реплики, не вошедшей в резюме
+        """
+        with metrics.timer("db.context_load"):
+            async with async_session() as session:
+                context = await session.scalar(
+                    select(ConversationContext.context).where(ConversationContext.phone_number == chat_id)
+                )
+        context = context or {}
+        return context.get("summary") or "", context.get("summary_seq", 0)
+
+    async def save_summary(self, chat_id: str, summary: str, summary_seq: int):
+        """Сохраняет резюме в conversation_contexts.context, не затирая остальные ключи"""
+        value = {"summary": summary, "summary_seq": summary_seq}
+        async with async_session() as session:
+            stmt = insert(ConversationContext).values(
+                phone_number=chat_id, context=value, updated_at=datetime.now()
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["phone_number"],
+                set_={
+                    "context": func.coalesce(ConversationContext.context, cast({}, JSONB)).op("||")(stmt.excluded.context),
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            )
+            await session.execute(stmt)
+            await session.commit()
+
+    async def delete_chat(self, chat_id: str):
+        """Удаляет все реплики и резюме чата, включая незаписанные реплики"""
+        async with self._flush_lock:
+            self._pending_count -= len(self._pending.pop(chat_id, []))
+            async with async_session() as session:
+                await session.execute(delete(ConversationMessage).where(ConversationMessage.chat_id == chat_id))
+                await session.execute(delete(ConversationContext).where(ConversationContext.phone_number == chat_id))
+                await session.commit()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Останавливает фоновую запись и сохраняет все накопленные реплики"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self, chat_ids: Optional[List[str]] = None):
+        """
+        Записывает накопленные реплики в БД.
+
+        :param chat_ids: Записать только эти чаты (по умолчанию - все)
+        """
+        async with self._flush_lock:
+            if chat_ids is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {chat: self._pending.pop(chat) for chat in chat_ids if chat in self._pending}
+            rows = [row for chat_rows in batch.values() for row in chat_rows]
+            self._pending_count -= len(rows)
+            if not rows:
+                return
+
+            self._flushing = batch
+            try:
+                with metrics.timer("db.context_flush"):
+                    await self._write(rows)
+                metrics.incr("db.context_rows", len(rows))
+                logger.info(f"Сохранено реплик разговоров: {len(rows)} ({len(batch)} чатов)")
+            except Exception as e:
+                # Возвращаю несохраненные реплики в начало буфера, чтобы сохранить порядок
+                for chat, chat_rows in batch.items():
+                    self._pending[chat] = chat_rows + self._pending.get(chat, [])
+                self._pending_count += len(rows)
+                logger.error(f"Ошибка при сохранении реплик ({len(rows)} шт.): {e}")
+                raise
+            finally:
+                self._flushing = {}
+
+    async def _write(self, rows: List[Dict]):
+        async with async_session() as session:
+            for start in range(0, len(rows), self.BATCH_SIZE):
+                stmt = insert(ConversationMessage).values(rows[start:start + self.BATCH_SIZE])
+                # Повторная запись после сбоя не должна падать на уже записанных строках
+                stmt = stmt.on_conflict_do_nothing(index_elements=["chat_id", "seq"])
+                await session.execute(stmt)
+            await session.commit()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # Ошибка уже залогирована, повтор на следующем цикле
+                pass
+
+
+_config = load_config()
+
+# Общая для процесса очередь записи реплик
+context_writer = ContextWriteBehind(
+    flush_interval=_config.CONTEXT_FLUSH_INTERVAL,
+    max_pending=_config.CONTEXT_FLUSH_MAX_PENDING,
+)
@@ -0,0 +1,73 @@
+# bots/bot_whatsapp/db/inbox.py
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, insert, update
+from sqlalchemy.future import select
+from settings.connection_db import async_session
+from settings.logger import setup_logger
+from bots.bot_whatsapp.utils.metrics import metrics
+from .models import InboxNotification
+
+
+logger = setup_logger(__name__)
+
+
+class NotificationInbox:
+    """
+    Входящие уведомления, еще не обработанные ботом (таблица notification_inbox).
+
+    Уведомление записывается сюда до удаления из очереди Green API (или до ответа
+    на вебхук) и удаляется после того, как ответ на него отправлен. После аварийной
+    остановки необработанные уведомления обрабатываются при следующем запуске:
+    доставка «хотя бы один раз» вместо «не больше одного раза». Неудачные попытки
+    обработки считаются в attempts, чтобы бот мог ограничить число повторов.
+    """
+
+    async def save(self, notification: Dict) -> int:
+        """Сохраняет уведомление; ошибка БД пробрасывается, чтобы уведомление не удалялось из Green API"""
+        with metrics.timer("db.inbox_save"):
+            async with async_session() as session:
+                inbox_id = await session.scalar(
+                    insert(InboxNotification)
+                    .values(receipt_id=notification.get("receiptId"), raw_data=notification)
+                    .returning(InboxNotification.id)
+                )
+                await session.commit()
+        return inbox_id
+
+    async def done(self, inbox_id: int):
+        """Удаляет обработанное уведомление"""
+        try:
+            with metrics.timer("db.inbox_done"):
+                async with async_session() as session:
+                    await session.execute(delete(InboxNotification).where(InboxNotification.id == inbox_id))
+                    await session.commit()
+        except Exception as e:
+            # Уведомление будет обработано повторно после перезапуска
+            metrics.incr("db.inbox_done_failed")
+            logger.error(f"Ошибка при удалении обработанного уведомления {inbox_id} из входящих: {e}")
+
+    async def fail(self, inbox_id: int) -> Optional[int]:
+        """Отмечает неудачную попытку обработки; возвращает число попыток или None при ошибке БД"""
+        try:
+            with metrics.timer("db.inbox_fail"):
+                async with async_session() as session:
+                    attempts = await session.scalar(
+                        update(InboxNotification)
+                        .where(InboxNotification.id == inbox_id)
+                        .values(attempts=InboxNotification.attempts + 1)
+                        .returning(InboxNotification.attempts)
+                    )
+                    await session.commit()
+            return attempts
+        except Exception as e:
+            # Уведомление останется во входящих и будет обработано после перезапуска
+            logger.error(f"Ошибка при отметке неудачной обработки уведомления {inbox_id}: {e}")
+            return None
+
+    async def pending(self) -> List[Tuple[int, Dict]]:
+        """Необработанные уведомления в порядке получения"""
+        async with async_session() as session:
+            result = await session.execute(
+                select(InboxNotification.id, InboxNotification.raw_data).order_by(InboxNotification.id)
+            )
+            return [(row.id, row.raw_data) for row in result.all()]
@@ -7,7 +7,8 @@ from sqlalchemy import (
     JSON, 
     BigInteger,
     Text,
-    DateTime
+    DateTime,
+    Index
 )
 import json
 from sqlalchemy.orm import Session
@@ -86,8 +87,28 @@ class ConversationContext(Base):
             return []
 
 
+class ConversationMessage(Base):
+    """Реплики разговора: одна строка на сообщение, таблица только дополняется"""
+    __tablename__ = "conversation_messages"
+
+    chat_id = Column(String(100), primary_key=True, doc="ID чата (номер телефона)")
+    seq = Column(Integer, primary_key=True, autoincrement=False, doc="Порядковый номер реплики в чате")
+    role = Column(String(20), nullable=False, doc="Роль: user или assistant")
+    content = Column(Text, nullable=False, doc="Текст реплики")
+    token_count = Column(Integer, nullable=True, doc="Количество токенов в реплике")
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+
 class Notification(Base):
     __tablename__ = "notifications"
+    # Таблица секционирована по месяцам (см. db/partitions.py), поэтому
+    # ключ секционирования timestamp входит в первичный ключ
+    __table_args__ = (
+        Index("ix_notifications_chat_id_timestamp", "chat_id", "timestamp"),
+        Index("ix_notifications_sender", "sender"),
+        Index("ix_notifications_message_id", "message_id"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     receipt_id = Column(Integer, nullable=False, doc="ID квитанции")
@@ -95,7 +116,7 @@ class Notification(Base):
     instance_id = Column(BigInteger, nullable=False, doc="ID инстанции")
     wid = Column(String(100), nullable=False, doc="ID WhatsApp")
     type_instance = Column(String(50), nullable=False, doc="Тип инстанции")
-    timestamp = Column(BigInteger, nullable=False, doc="Метка времени")
+    timestamp = Column(DateTime, primary_key=True, default=datetime.now, doc="Время сообщения")
     message_id = Column(String(100), nullable=False, doc="ID сообщения")
     chat_id = Column(String(100), nullable=False, doc="ID чата")
     chat_name = Column(String(255), doc="Имя чата")
@@ -112,4 +133,29 @@ class Notification(Base):
     is_forwarded = Column(Boolean, default=False, doc="Флаг пересылки")
     raw_data = Column(JSON, doc="Сырые данные уведомления")
 
-    timestamp = Column(DateTime, default=datetime.now)
\ No newline at end of file
+
+class FailedMessage(Base):
+    """Исходящие сообщения, которые не удалось доставить после всех попыток"""
+    __tablename__ = "failed_messages"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(String(100), nullable=False, doc="ID чата получателя")
+    message = Column(Text, nullable=False, doc="Текст сообщения")
+    attempts = Column(Integer, nullable=False, default=0, doc="Количество попыток отправки")
+    last_status = Column(Integer, nullable=True, doc="HTTP-статус последней попытки")
+    last_error = Column(Text, nullable=True, doc="Текст последней ошибки")
+    created_at = Column(DateTime, default=datetime.now, doc="Время помещения в список недоставленных")
+
+
+class InboxNotification(Base):
+    """
+    Полученные, но еще не обработанные уведомления. Строка пишется до удаления
+    уведомления из очереди Green API и удаляется после обработки
+    """
+    __tablename__ = "notification_inbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    receipt_id = Column(Integer, nullable=True, doc="ID квитанции Green API")
+    raw_data = Column(JSON, nullable=False, doc="Уведомление целиком")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0", doc="Неудачных попыток обработки")
+    received_at = Column(DateTime, default=datetime.now, doc="Время получения")
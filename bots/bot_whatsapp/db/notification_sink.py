@@ -0,0 +1,102 @@
+# bots/bot_whatsapp/db/notification_sink.py
+import asyncio
+from typing import Dict, List, Optional
+from settings.connection_db import async_session
+from settings.logger import setup_logger
+from bots.bot_whatsapp.utils.metrics import metrics
+from .queries import create_notifications, create_notification
+
+
+logger = setup_logger(__name__)
+
+# Признак остановки в очереди: все, что было поставлено до него, будет записано
+_STOP = object()
+
+
+class NotificationSink:
+    """
+    Фоновая пакетная запись уведомлений в таблицу notifications.
+
+    Обработчик только кладет строку в ограниченный буфер и продолжает работу.
+    Буфер сбрасывается одним многострочным INSERT, когда набирается batch_size
+    строк или проходит flush_interval секунд с первой строки пакета.
+    """
+
+    def __init__(self, max_buffer: int = 1000, batch_size: int = 100, flush_interval: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, data: Dict):
+        """Ставит уведомление в буфер записи; если буфер заполнен - ждет места"""
+        if self.queue.full():
+            metrics.incr("db.notification_buffer_full")
+            logger.warning("Буфер записи уведомлений заполнен, ожидаю записи в БД.")
+        await self.queue.put(data)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Записывает все, что накопилось в буфере, и останавливает запись"""
+        if self._task and not self._task.done():
+            await self.queue.put(_STOP)
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        # Если фоновую запись отменили раньше (остановка процесса), остаток дописываю здесь
+        rest = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not _STOP:
+                rest.append(item)
+        for start in range(0, len(rest), self.batch_size):
+            await self._write(rest[start:start + self.batch_size])
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self.queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+    async def _write(self, batch: List[Dict]):
+        try:
+            with metrics.timer("db.notification_flush"):
+                async with async_session() as session:
+                    await create_notifications(session, batch)
+            metrics.incr("db.notification_flushes")
+            metrics.incr("db.notification_rows", len(batch))
+            metrics.observe("db.notification_batch_size", len(batch))
+            logger.info(f"Уведомлений сохранено в БД одним запросом: {len(batch)}")
+        except Exception as db_error:
+            logger.error(f"Ошибка пакетной записи уведомлений ({len(batch)} шт.): {db_error}")
+            await self._write_one_by_one(batch)
+
+    async def _write_one_by_one(self, batch: List[Dict]):
+        """Запасной путь: одна некорректная строка не должна терять весь пакет"""
+        for data in batch:
+            try:
+                async with async_session() as session:
+                    await create_notification(session, data)
+                metrics.incr("db.notification_rows")
+            except Exception as db_error:
+                metrics.incr("db.notification_failed")
+                logger.error(f"Ошибка при сохранении уведомления в БД: {db_error}")
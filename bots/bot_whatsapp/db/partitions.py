@@ -0,0 +1,42 @@
+# bots/bot_whatsapp/db/partitions.py
+"""Помесячные секции таблицы notifications (RANGE по timestamp)"""
+import re
+from datetime import date, datetime
+from typing import Optional, Union
+
+
+PARENT_TABLE = "notifications"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+
+_PARTITION_RE = re.compile(rf"^{PARENT_TABLE}_p(\d{{4}})_(\d{{2}})$")
+
+
+def month_start(value: Union[date, datetime]) -> date:
+    """Первое число месяца для даты"""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    """Сдвиг первого числа месяца на count месяцев"""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month:%Y_%m}"
+
+
+def parse_partition_month(name: str) -> Optional[date]:
+    """Месяц секции по ее имени или None для чужих таблиц (например, секции DEFAULT)"""
+    match = _PARTITION_RE.match(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def create_partition_sql(month: date) -> str:
+    """DDL секции на месяц: [первое число месяца, первое число следующего)"""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
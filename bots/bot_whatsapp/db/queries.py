@@ -1,10 +1,13 @@
 # bots/bot_whatsapp/db/queries.py
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, text, tuple_
+from sqlalchemy.engine import Row
 from sqlalchemy.future import select
 from sqlalchemy.exc import NoResultFound
-from typing import Dict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
 from settings.logger import setup_logger
-from .models import Notification
+from .models import Notification, FailedMessage
 
 logger = setup_logger(__name__)
 
@@ -24,6 +27,20 @@ async def create_notification(session: AsyncSession, data: dict) -> Notification
     return notification
 
 
+async def create_notifications(session: AsyncSession, rows: list[dict]) -> int:
+    """
+    Создает несколько записей уведомлений одним многострочным INSERT.
+    :param session: Асинхронная сессия SQLAlchemy
+    :param rows: Данные уведомлений (одинаковый набор ключей)
+    :return: Количество записанных уведомлений
+    """
+    if not rows:
+        return 0
+    await session.execute(insert(Notification).values(rows))
+    await session.commit()
+    return len(rows)
+
+
 async def get_notification_by_id(session: AsyncSession, notification_id: int) -> Notification:
     """
     Получает уведомление по ID.
@@ -42,16 +59,152 @@ async def get_notification_by_id(session: AsyncSession, notification_id: int) ->
 async def get_all_notifications(session: AsyncSession, limit: int = 100, offset: int = 0) -> list[Notification]:
     """
     Получает список уведомлений с пагинацией.
+    Для глубоких страниц используйте get_notifications_page (пагинация по курсору).
     :param session: Асинхронная сессия SQLAlchemy
     :param limit: Лимит записей
     :param offset: Смещение
     :return: Список объектов Notification
     """
-    stmt = select(Notification).limit(limit).offset(offset)
+    stmt = select(Notification).order_by(Notification.id).limit(limit).offset(offset)
     result = await session.execute(stmt)
     return result.scalars().all()
 
 
+# Колонки для списков уведомлений: без raw_data и миниатюр, строки вместо ORM-объектов
+NOTIFICATION_ROW_COLUMNS = (
+    Notification.id,
+    Notification.timestamp,
+    Notification.chat_id,
+    Notification.sender,
+    Notification.sender_name,
+    Notification.type_webhook,
+    Notification.message_type,
+    Notification.message_id,
+    Notification.message_text,
+)
+
+
+async def get_notifications_page(session: AsyncSession,
+                                 limit: int = 100,
+                                 after_id: Optional[int] = None) -> list[Row]:
+    """
+    Получает страницу уведомлений по курсору (keyset-пагинация по id).
+    :param session: Асинхронная сессия SQLAlchemy
+    :param limit: Размер страницы
+    :param after_id: id последнего уведомления предыдущей страницы
+    :return: Список строк с колонками NOTIFICATION_ROW_COLUMNS
+    """
+    stmt = select(*NOTIFICATION_ROW_COLUMNS).order_by(Notification.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.where(Notification.id > after_id)
+    result = await session.execute(stmt)
+    return result.all()
+
+
+async def get_chat_timeline(session: AsyncSession,
+                            chat_id: str,
+                            limit: int = 50,
+                            before: Optional[Tuple[datetime, int]] = None) -> list[Row]:
+    """
+    Получает уведомления чата от новых к старым (индекс chat_id, timestamp).
+    :param session: Асинхронная сессия SQLAlchemy
+    :param chat_id: ID чата
+    :param limit: Размер страницы
+    :param before: Курсор (timestamp, id) последней строки предыдущей страницы
+    :return: Список строк с колонками NOTIFICATION_ROW_COLUMNS
+    """
+    stmt = (
+        select(*NOTIFICATION_ROW_COLUMNS)
+        .where(Notification.chat_id == chat_id)
+        .order_by(Notification.timestamp.desc(), Notification.id.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        stmt = stmt.where(tuple_(Notification.timestamp, Notification.id) < tuple_(*before))
+    result = await session.execute(stmt)
+    return result.all()
+
+
+async def get_notifications_in_range(session: AsyncSession,
+                                     start: datetime,
+                                     end: datetime,
+                                     limit: int = 100,
+                                     after: Optional[Tuple[datetime, int]] = None,
+                                     chat_id: Optional[str] = None) -> list[Row]:
+    """
+    Получает уведомления за период [start, end) в хронологическом порядке.
+    :param session: Асинхронная сессия SQLAlchemy
+    :param start: Начало периода (включительно)
+    :param end: Конец периода (не включительно)
+    :param limit: Размер страницы
+    :param after: Курсор (timestamp, id) последней строки предыдущей страницы
+    :param chat_id: Ограничить выборку одним чатом
+    :return: Список строк с колонками NOTIFICATION_ROW_COLUMNS
+    """
+    stmt = (
+        select(*NOTIFICATION_ROW_COLUMNS)
+        .where(Notification.timestamp >= start, Notification.timestamp < end)
+        .order_by(Notification.timestamp, Notification.id)
+        .limit(limit)
+    )
+    if chat_id is not None:
+        stmt = stmt.where(Notification.chat_id == chat_id)
+    if after is not None:
+        stmt = stmt.where(tuple_(Notification.timestamp, Notification.id) > tuple_(*after))
+    result = await session.execute(stmt)
+    return result.all()
+
+
+async def get_raw_notifications_in_range(session: AsyncSession,
+                                         start: datetime,
+                                         end: datetime,
+                                         limit: int = 500,
+                                         after: Optional[Tuple[datetime, int]] = None,
+                                         chat_id: Optional[str] = None) -> list[Row]:
+    """
+    Получает сохраненные уведомления (raw_data) за период [start, end) в хронологическом порядке.
+    :param session: Асинхронная сессия SQLAlchemy
+    :param start: Начало периода (включительно)
+    :param end: Конец периода (не включительно)
+    :param limit: Размер страницы
+    :param after: Курсор (timestamp, id) последней строки предыдущей страницы
+    :param chat_id: Ограничить выборку одним чатом
+    :return: Список строк (id, timestamp, raw_data)
+    """
+    stmt = (
+        select(Notification.id, Notification.timestamp, Notification.raw_data)
+        .where(
+            Notification.timestamp >= start,
+            Notification.timestamp < end,
+            Notification.raw_data.is_not(None),
+        )
+        .order_by(Notification.timestamp, Notification.id)
+        .limit(limit)
+    )
+    if chat_id is not None:
+        stmt = stmt.where(Notification.chat_id == chat_id)
+    if after is not None:
+        stmt = stmt.where(tuple_(Notification.timestamp, Notification.id) > tuple_(*after))
+    result = await session.execute(stmt)
+    return result.all()
+
+
+async def estimate_notifications_count(session: AsyncSession) -> int:
+    """
+    Оценка числа уведомлений по статистике планировщика (без полного COUNT(*)).
+    Таблица секционирована, поэтому оценка суммируется по секциям.
+    :param session: Асинхронная сессия SQLAlchemy
+    :return: Примерное количество строк (0, если статистика еще не собрана)
+    """
+    stmt = text(
+        "SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:table AS regclass)"
+    )
+    result = await session.execute(stmt, {"table": Notification.__tablename__})
+    return result.scalar() or 0
+
+
 async def update_notification(session: AsyncSession, notification_id: int, data: dict) -> Notification:
     """
     Обновляет уведомление по ID.
@@ -96,4 +249,16 @@ async def save_notification_to_db(session, data_to_save: Dict):
         logger.info("Уведомление сохранено в БД")
         # logger.info(f"Уведомление сохранено в БД: {data_to_save}")
     except Exception as db_error:
-        logger.error(f"Ошибка при сохранении уведомления в БД: {db_error}")
\ No newline at end of file
+        logger.error(f"Ошибка при сохранении уведомления в БД: {db_error}")
+
+async def create_failed_message(session: AsyncSession, data: dict) -> FailedMessage:
+    """
+    Сохраняет недоставленное исходящее сообщение.
+    :param session: Асинхронная сессия SQLAlchemy
+    :param data: Данные сообщения (chat_id, message, attempts, last_status, last_error)
+    :return: Созданный объект FailedMessage
+    """
+    failed_message = FailedMessage(**data)
+    session.add(failed_message)
+    await session.commit()
+    return failed_message
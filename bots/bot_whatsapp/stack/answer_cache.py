@@ -0,0 +1,240 @@
+# bots/bot_whatsapp/stack/answer_cache.py
+import hashlib
+import math
+import re
+import time
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+from settings.config import load_config
+from settings.logger import setup_logger
+from bots.bot_whatsapp.utils.metrics import metrics
+
+
+logger = setup_logger(__name__)
+
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_SPACES_RE = re.compile(r"\s+")
+
+# Длина символьных n-грамм для сравнения похожих вопросов
+NGRAM_SIZE = 3
+# Для очень коротких вопросов ("да", "ок") похожесть ненадежна, только точное совпадение
+MIN_FUZZY_LENGTH = 8
+
+
+def normalize_question(text: str) -> str:
+    """Вопрос без регистра, пунктуации, лишних пробелов и с е вместо ё"""
+    text = text.lower().replace("ё", "е")
+    text = _NON_WORD_RE.sub(" ", text)
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+def char_ngrams(text: str, size: int = NGRAM_SIZE) -> Counter:
+    padded = f" {text} "
+    return Counter(padded[i:i + size] for i in range(max(len(padded) - size + 1, 1)))
+
+
+def prompt_hash(system_prompt: str) -> str:
+    return hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    ngrams: Counter
+    created_at: float
+    # Нормированный TF-IDF вектор вопроса (IDF на момент записи или перестройки индекса)
+    vector: Dict[str, float] = field(default_factory=dict)
+
+
+class AnswerCache:
+    """
+    Кэш ответов модели на типовые вопросы первых ходов разговора.
+
+    Сначала ищется точное совпадение нормализованного текста вопроса, затем самый
+    похожий вопрос по TF-IDF символьных n-грамм (косинусная близость не ниже threshold).
+    Записи живут ttl секунд, при переполнении вытесняются давно не использованные (LRU).
+    Смена системного промпта сбрасывает кэш целиком. Ответы разных уровней моделей
+    (см. stack/tiering.py) хранятся раздельно: быстрая модель отвечает хуже основной.
+
+    Векторы записей считаются при записи и хранятся в инвертированном индексе n-грамм,
+    поэтому поиск похожего вопроса проходит только по записям с общими n-граммами.
+    IDF в сохраненных векторах устаревает по мере изменения кэша: индекс перестраивается
+    целиком, когда число изменений с прошлой перестройки превышает четверть кэша.
+    """
+
+    def __init__(self, max_size: int = 500, ttl: float = 86400.0, threshold: float = 0.85):
+        """
+        :param max_size: Максимальное число ответов в кэше (0 - кэш выключен)
+        :param ttl: Время жизни ответа в секундах
+        :param threshold: Минимальная близость вопросов для нечеткого совпадения
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        # Ключ записи - (уровень модели, нормализованный вопрос)
+        self._entries: "OrderedDict[Tuple[str, str], CachedAnswer]" = OrderedDict()
+        # n-грамма -> веса в векторах записей, где она встречается; длина - частота для IDF
+        self._postings: Dict[str, Dict[Tuple[str, str], float]] = defaultdict(dict)
+        # Записей и удалений с прошлой перестройки индекса
+        self._changes = 0
+        self._prompt_hash: Optional[str] = None
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, question: str, system_prompt: str, tier: str = "") -> Optional[str]:
+        """Ответ модели уровня tier на такой же или похожий вопрос либо None"""
+        if not self.enabled:
+            return None
+        self._check_prompt(system_prompt)
+        question = normalize_question(question)
+        if not question:
+            return None
+
+        key = (tier, question)
+        entry = self._entries.get(key)
+        if entry is not None and not self._is_expired(entry):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.incr("answer_cache.hit")
+            return entry.answer
+
+        if entry is not None:
+            self._remove(key)
+
+        similar_key = self._find_similar(key) if len(question) >= MIN_FUZZY_LENGTH else None
+        if similar_key is not None:
+            self._entries.move_to_end(similar_key)
+            self.similar_hits += 1
+            metrics.incr("answer_cache.hit_similar")
+            logger.info(f"Похожий вопрос в кэше ответов ({tier}): '{question}' ~ '{similar_key[1]}'")
+            return self._entries[similar_key].answer
+
+        self.misses += 1
+        metrics.incr("answer_cache.miss")
+        return None
+
+    def put(self, question: str, system_prompt: str, answer: str, tier: str = ""):
+        if not self.enabled or not answer:
+            return
+        self._check_prompt(system_prompt)
+        question = normalize_question(question)
+        if not question:
+            return
+        key = (tier, question)
+        if key in self._entries:
+            self._remove(key)
+        ngrams = char_ngrams(question)
+        entry = CachedAnswer(answer=answer, ngrams=ngrams, created_at=time.monotonic())
+        self._entries[key] = entry
+        # Частота n-грамм записи учитывает и ее саму, как при перестройке индекса
+        entry.vector = self._vector(ngrams, {gram: self._frequency(gram) + 1 for gram in ngrams})
+        self._index(key, entry)
+        metrics.incr("answer_cache.store")
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+        self._changes += 1
+        if self._changes > len(self._entries) // 4:
+            self._reindex()
+
+    def clear(self):
+        self._entries.clear()
+        self._postings.clear()
+        self._changes = 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+        }
+
+    def _check_prompt(self, system_prompt: str):
+        """Ответы, полученные со старым промптом, могут ему противоречить"""
+        current = prompt_hash(system_prompt)
+        if self._prompt_hash != current:
+            if self._entries:
+                logger.info(f"Системный промпт изменился, кэш ответов сброшен ({len(self._entries)} записей)")
+                metrics.incr("answer_cache.invalidated")
+            self.clear()
+            self._prompt_hash = current
+
+    def _is_expired(self, entry: CachedAnswer) -> bool:
+        return time.monotonic() - entry.created_at > self.ttl
+
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key)
+        for gram in entry.vector:
+            postings = self._postings[gram]
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[gram]
+        self._changes += 1
+
+    def _index(self, key: Tuple[str, str], entry: CachedAnswer):
+        for gram, weight in entry.vector.items():
+            self._postings[gram][key] = weight
+
+    def _reindex(self):
+        """Пересчитывает векторы всех записей по текущему IDF"""
+        frequency = Counter(gram for entry in self._entries.values() for gram in entry.ngrams)
+        self._postings.clear()
+        for key, entry in self._entries.items():
+            entry.vector = self._vector(entry.ngrams, frequency)
+            self._index(key, entry)
+        self._changes = 0
+        metrics.incr("answer_cache.reindex")
+
+    def _frequency(self, gram: str) -> int:
+        """В скольких записях встречается n-грамма"""
+        postings = self._postings.get(gram)
+        return len(postings) if postings else 0
+
+    def _vector(self, ngrams: Counter, frequency: Optional[Dict[str, int]] = None) -> Dict[str, float]:
+        """Нормированный TF-IDF вектор n-грамм; частоты по умолчанию - из индекса"""
+        documents = len(self._entries) + 1
+        vector = {}
+        for gram, count in ngrams.items():
+            seen = frequency.get(gram, 0) if frequency is not None else self._frequency(gram)
+            vector[gram] = (1 + math.log(count)) * math.log((documents + 1) / (seen + 1))
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {gram: weight / norm for gram, weight in vector.items()}
+
+    def _find_similar(self, key: Tuple[str, str]) -> Optional[Tuple[str, str]]:
+        tier, question = key
+        query = self._vector(char_ngrams(question))
+        scores: Dict[Tuple[str, str], float] = defaultdict(float)
+        for gram, weight in query.items():
+            for candidate_key, candidate_weight in self._postings.get(gram, {}).items():
+                if candidate_key[0] == tier:
+                    scores[candidate_key] += weight * candidate_weight
+        # Просроченные записи удаляются, когда оказываются лучшими кандидатами
+        for candidate_key, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            if score < self.threshold:
+                return None
+            if self._is_expired(self._entries[candidate_key]):
+                self._remove(candidate_key)
+                continue
+            return candidate_key
+        return None
+
+
+_config = load_config()
+
+# Общий для процесса кэш ответов
+answer_cache = AnswerCache(
+    max_size=_config.ANSWER_CACHE_SIZE,
+    ttl=_config.ANSWER_CACHE_TTL,
+    threshold=_config.ANSWER_CACHE_THRESHOLD,
+)
@@ -3,6 +3,10 @@ from abc import ABC, abstractmethod
 from typing import Dict, Any
 
 
+class AIError(Exception):
+    """Модель не вернула ответ: ошибка провайдера, таймаут или разомкнутый предохранитель"""
+
+
 class BaseAI(ABC):
     """Абстрактный базовый класс для AI-моделей"""
     
@@ -0,0 +1,157 @@
+# bots/bot_whatsapp/stack/catalog.py
+import hashlib
+import json
+import math
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from settings.config import load_config
+from settings.logger import setup_logger
+
+
+logger = setup_logger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+
+# Окончания, отбрасываемые при поиске: "доставка", "доставки", "доставку" -> "достав"
+_ENDINGS = sorted(
+    (
+        "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ией",
+        "ах", "ях", "ов", "ев", "ей", "ой", "ий", "ый", "ая", "яя", "ое", "ее",
+        "ую", "юю", "ом", "ем", "ам", "ям", "ие", "ые", "ия", "ью",
+        "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+    ),
+    key=len,
+    reverse=True,
+)
+_MIN_STEM = 4
+# Длинные основы обрезаются: "доставка" и "доставите" должны совпасть
+_MAX_STEM = 6
+
+_STOPWORDS = frozenset(
+    "а в во и или к ко на над не ни но о об от по под при про с со у за из до для как что это "
+    "вы вас вам ваш ваши мы нас нам я мне меня он она они у есть ли же бы то так еще уже "
+    "какие какой какая какое сколько где когда можно нужно хочу здравствуйте добрый день".split()
+)
+
+
+def stem(word: str) -> str:
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)][:_MAX_STEM]
+    return word[:_MAX_STEM]
+
+
+def tokenize(text: str) -> List[str]:
+    words = _WORD_RE.findall(text.lower().replace("ё", "е"))
+    return [stem(word) for word in words if word not in _STOPWORDS]
+
+
+@dataclass
+class CatalogEntry:
+    id: str
+    kind: str
+    title: str
+    text: str
+    keywords: List[str] = field(default_factory=list)
+    price: Optional[str] = None
+    # Закрепленные записи передаются модели всегда (например, название компании)
+    pinned: bool = False
+
+    def render(self) -> str:
+        line = f"- {self.title}: {self.text}"
+        if self.price:
+            line += f" Цена: {self.price}."
+        return line
+
+
+class Catalog:
+    """
+    Каталог товаров и услуг с поиском по BM25.
+
+    Инвертированный индекс строится в памяти при загрузке: для каждого терма -
+    записи, где он встречается, и частота. Ключевые слова записи учитываются
+    вместе с заголовком и текстом.
+    """
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, entries: List[CatalogEntry], version: str = ""):
+        self.entries = entries
+        self.version = version
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._lengths: List[int] = []
+        for index, entry in enumerate(entries):
+            terms = tokenize(" ".join([entry.title, entry.text, *entry.keywords]))
+            self._lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                self._postings[term][index] = count
+        self._average_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def load(cls, path: str) -> "Catalog":
+        with open(path, "rb") as file:
+            raw = file.read()
+        data = json.loads(raw)
+        entries = [CatalogEntry(**item) for item in data.get("entries", [])]
+        catalog = cls(entries, version=hashlib.sha1(raw).hexdigest())
+        logger.info(f"Загружен каталог {path}: {len(entries)} записей, {len(catalog._postings)} термов")
+        return catalog
+
+    def matched_terms(self, text: str) -> int:
+        """Число разных слов текста, встречающихся в каталоге"""
+        return sum(1 for term in set(tokenize(text)) if term in self._postings)
+
+    def _idf(self, term: str) -> float:
+        documents = len(self._postings.get(term, ()))
+        return math.log(1 + (len(self.entries) - documents + 0.5) / (documents + 0.5))
+
+    def search(self, query: str, top_k: int = 4) -> List[Tuple[CatalogEntry, float]]:
+        """Записи каталога, наиболее подходящие к запросу, по убыванию оценки BM25"""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for index, frequency in postings.items():
+                norm = self.K1 * (1 - self.B + self.B * self._lengths[index] / self._average_length)
+                scores[index] += idf * frequency * (self.K1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.entries[index], score) for index, score in ranked]
+
+    def reference(self, query: str, top_k: int = 4) -> str:
+        """Справка для модели: закрепленные записи и top_k найденных по запросу"""
+        found = [entry for entry, _ in self.search(query, top_k) if not entry.pinned]
+        selected = [entry for entry in self.entries if entry.pinned] + found
+        if not selected:
+            return ""
+        return "Справка из каталога:\n" + "\n".join(entry.render() for entry in selected)
+
+
+_catalog: Optional[Catalog] = None
+_catalog_failed = False
+
+
+def get_catalog() -> Optional[Catalog]:
+    """
+    Общий для процесса каталог или None, если поиск по каталогу выключен (CATALOG_TOP_K=0)
+    или каталог не удалось загрузить - тогда используется полный промпт
+    """
+    global _catalog, _catalog_failed
+    config = load_config()
+    if config.CATALOG_TOP_K <= 0 or _catalog_failed:
+        return None
+    if _catalog is None:
+        try:
+            _catalog = Catalog.load(config.CATALOG_PATH)
+        except (OSError, ValueError, TypeError) as e:
+            _catalog_failed = True
+            logger.error(f"Не удалось загрузить каталог {config.CATALOG_PATH}, используется полный промпт: {e}")
+            return None
+    return _catalog
@@ -1,19 +1,92 @@
 # bots/bot_whatsapp/stack/chatgpt_ai.py
-import openai
-from typing import Dict, Any
+import asyncio
+import random
+from typing import Dict, Any, Optional
+import httpx
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncOpenAI,
+)
 from settings.config import load_config
 from settings.logger import setup_logger
-from .base_ai import BaseAI
+from bots.bot_whatsapp.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from bots.bot_whatsapp.utils.metrics import metrics
+from .base_ai import AIError, BaseAI
 
 
 logger = setup_logger(__name__)
 
+_client: Optional[AsyncOpenAI] = None
+# Лимит одновременных запросов общий для всех моделей: дублирование и переключение
+# между моделями не увеличивают нагрузку на провайдера сверх OPENAI_CONCURRENCY.
+# Предохранитель у каждой модели свой: сбой одной не мешает переключиться на другую
+_semaphore: Optional[asyncio.Semaphore] = None
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_client() -> AsyncOpenAI:
+    """Общий для процесса клиент OpenAI с пулом соединений"""
+    global _client
+    if _client is None:
+        config = load_config()
+        connections = config.OPENAI_CONCURRENCY
+        _client = AsyncOpenAI(
+            api_key=config.OPENAI_API_KEY,
+            # Пусто - api.openai.com; для совместимых провайдеров и локальных заглушек
+            base_url=config.OPENAI_BASE_URL or None,
+            timeout=httpx.Timeout(config.OPENAI_TIMEOUT, connect=config.OPENAI_CONNECT_TIMEOUT),
+            # Повторы делает ChatGPTAI: с разбросом задержек и с учетом предохранителя
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=connections,
+                    max_keepalive_connections=connections,
+                ),
+            ),
+        )
+    return _client
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    """Ограничение одновременных запросов ко всем моделям на весь процесс"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(load_config().OPENAI_CONCURRENCY)
+    return _semaphore
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    """Предохранитель модели, общий для всех ее экземпляров ChatGPTAI"""
+    if model not in _breakers:
+        config = load_config()
+        _breakers[model] = CircuitBreaker(
+            f"OpenAI {model}",
+            failure_threshold=config.OPENAI_BREAKER_THRESHOLD,
+            reset_timeout=config.OPENAI_BREAKER_RESET,
+        )
+    return _breakers[model]
+
+
+async def close_client():
+    """Закрывает общий клиент (при остановке бота)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
 
 class ChatGPTAI(BaseAI):
-    def __init__(self, model="gpt-4o-mini"):
+    def __init__(self, model: Optional[str] = None, max_attempts: Optional[int] = None):
+        """
+        :param model: Имя модели (по умолчанию MODEL_GPT)
+        :param max_attempts: Число попыток при 429/5xx (по умолчанию OPENAI_MAX_ATTEMPTS);
+            в маршрутизаторе 1, чтобы при ошибке сразу переходить к следующей модели
+        """
         self.config = load_config()
-        openai.api_key = self.config.OPENAI_API_KEY
-        self.model = model
+        self.model = model or self.config.MODEL_GPT or "gpt-4o-mini"
+        self.max_attempts = max_attempts or self.config.OPENAI_MAX_ATTEMPTS
 
     async def generate_response(self, message: str, context: Dict[str, Any] = None) -> str:
         """
@@ -22,23 +95,14 @@ class ChatGPTAI(BaseAI):
         :param message: Текст входящего сообщения
         :param context: Дополнительный контекст для генерации ответа
         :return: Сгенерированный ответ
+        :raises AIError: Если модель не ответила
         """
-        try:
-            messages = [{"role": "user", "content": message}]
-            
-            if context and "system_prompt" in context:
-                messages.insert(0, {"role": "system", "content": context["system_prompt"]})
-            
-            response = await openai.ChatCompletion.acreate(
-                model=self.model,
-                messages=messages
-            )
-            
-            return response.choices[0].message.content.strip()
-        
-        except Exception as e:
-            print(f"Ошибка при генерации ответа: {e}")
-            return "Извините, произошла ошибка при генерации ответа."
+        messages = [{"role": "user", "content": message}]
+
+        if context and "system_prompt" in context:
+            messages.insert(0, {"role": "system", "content": context["system_prompt"]})
+
+        return await self.process_conversation(messages)
 
     async def process_conversation(self, messages: list) -> str:
         """
@@ -46,16 +110,72 @@ class ChatGPTAI(BaseAI):
         
         :param messages: Список сообщений в контексте беседы
         :return: Сгенерированный ответ
+        :raises AIError: Если модель не ответила после всех попыток
         """
-        try:
-            response = await openai.ChatCompletion.acreate(
-                model=self.model,
-                messages=messages
+        breaker = get_breaker(self.model)
+        attempts = self.max_attempts
+        for attempt in range(1, attempts + 1):
+            try:
+                breaker.before_call()
+            except CircuitOpenError as e:
+                metrics.incr("llm.circuit_open")
+                raise AIError(str(e)) from e
+
+            try:
+                async with get_semaphore():
+                    with metrics.timer("llm.request"):
+                        response = await get_client().chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                        )
+            except (APITimeoutError, APIConnectionError) as e:
+                breaker.record_failure()
+                error, retryable, retry_after = repr(e), True, None
+            except APIStatusError as e:
+                retryable = e.status_code == 429 or e.status_code >= 500
+                if e.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    # 4xx - ошибка запроса, сервис при этом работает
+                    breaker.record_success()
+                error, retry_after = f"{e.status_code}: {e.message}", self._retry_after(e)
+            else:
+                breaker.record_success()
+                metrics.incr("llm.requests")
+                if response.usage:
+                    # Фактический расход токенов по моделям (для сравнения быстрой и сильной модели)
+                    metrics.incr(f"llm.tokens.{self.model}.prompt", response.usage.prompt_tokens)
+                    metrics.incr(f"llm.tokens.{self.model}.completion", response.usage.completion_tokens)
+                choice = response.choices[0] if response.choices else None
+                content = (choice.message.content or "").strip() if choice else ""
+                if not content:
+                    # Отказ или обрыв генерации (content_filter, length, tool_calls): повтор не поможет
+                    metrics.incr("llm.empty")
+                    finish_reason = choice.finish_reason if choice else None
+                    logger.error(f"Пустой ответ от {self.model} (finish_reason={finish_reason})")
+                    raise AIError(f"{self.model}: пустой ответ (finish_reason={finish_reason})")
+                return content
+
+            metrics.incr("llm.errors")
+            if not retryable or attempt == attempts:
+                logger.error(f"Ошибка при обработке беседы ({self.model}, попытка {attempt}): {error}")
+                raise AIError(error)
+
+            delay = max(retry_after or 0.0, self._backoff(attempt))
+            metrics.incr("llm.retried")
+            logger.warning(
+                f"Ошибка запроса к {self.model} (попытка {attempt}): {error}. Повтор через {delay:.1f} сек"
             )
-            
-            return response.choices[0].message.content.strip()
-        
-        except Exception as e:
-            print(f"Ошибка при обработке беседы: {e}")
-            return "Извините, произошла ошибка при обработке беседы."
+            await asyncio.sleep(delay)
 
+    def _backoff(self, attempt: int) -> float:
+        """Экспоненциальная задержка со случайным разбросом (full jitter)"""
+        ceiling = min(self.config.OPENAI_BACKOFF_MAX, self.config.OPENAI_BACKOFF_BASE * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def _retry_after(self, error: APIStatusError) -> Optional[float]:
+        try:
+            value = float(error.response.headers.get("retry-after", ""))
+        except ValueError:
+            return None
+        return min(max(value, 0.0), self.config.OPENAI_BACKOFF_MAX)
@@ -0,0 +1,233 @@
+# bots/bot_whatsapp/stack/model_router.py
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+from settings.config import load_config
+from settings.logger import setup_logger
+from bots.bot_whatsapp.utils.metrics import metrics
+from .base_ai import AIError, BaseAI
+from .chatgpt_ai import ChatGPTAI
+
+
+logger = setup_logger(__name__)
+
+
+@dataclass
+class Backend:
+    """Модель в маршрутизаторе и ее статистика"""
+    name: str
+    model: BaseAI
+    # Меньше - предпочтительнее
+    priority: int = 0
+    ewma: Optional[float] = None
+    samples: Deque[float] = field(default_factory=lambda: deque(maxlen=200))
+    failures: int = 0
+    failed_at: float = 0.0
+    wins: int = 0
+
+    def observe(self, seconds: float, alpha: float):
+        self.samples.append(seconds)
+        self.ewma = seconds if self.ewma is None else alpha * seconds + (1 - alpha) * self.ewma
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class ModelRouter(BaseAI):
+    """
+    Маршрутизатор запросов между несколькими моделями.
+
+    Запрос уходит в лучшую модель: сначала по приоритету, при равном приоритете - по
+    скользящему среднему (EWMA) времени ответа; модели с недавней ошибкой идут в конец.
+    Модель без замеров считается самой быстрой, чтобы ее время ответа стало известно.
+    Если ответ задерживается дольше hedge_percentile-го перцентиля обычного времени этой
+    модели, запрос дублируется в следующую (hedging), используется первый ответ. Отмененный
+    проигравший запрос учитывается в замерах временем до отмены: его настоящее время
+    ответа не меньше. При ошибке запрос сразу уходит в следующую модель (failover).
+    """
+
+    def __init__(self,
+                 backends: List[Backend],
+                 hedge_percentile: float = 95.0,
+                 hedge_delay: float = 4.0,
+                 hedge_min_delay: float = 0.5,
+                 max_hedges: int = 1,
+                 ewma_alpha: float = 0.2,
+                 cooldown: float = 30.0,
+                 min_samples: int = 20):
+        """
+        :param backends: Модели с приоритетами
+        :param hedge_percentile: Перцентиль времени ответа, после которого запрос дублируется (0 - без дублирования)
+        :param hedge_delay: Задержка дублирования, пока у модели мало замеров
+        :param hedge_min_delay: Нижняя граница задержки дублирования, секунды
+        :param max_hedges: Сколько дополнительных моделей можно подключить к одному запросу
+        :param ewma_alpha: Вес нового замера в скользящем среднем
+        :param cooldown: Сколько секунд модель после ошибки идет в конец очереди
+        :param min_samples: Сколько замеров нужно для расчета перцентиля
+        """
+        if not backends:
+            raise ValueError("ModelRouter: нужна хотя бы одна модель")
+        self.backends = backends
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.max_hedges = max_hedges
+        self.ewma_alpha = ewma_alpha
+        self.cooldown = cooldown
+        self.min_samples = min_samples
+
+    @property
+    def model(self) -> Optional[str]:
+        """Имя основной модели (для подсчета токенов)"""
+        return getattr(self.ordered()[0].model, "model", None)
+
+    def ordered(self) -> List[Backend]:
+        now = time.monotonic()
+
+        def key(backend: Backend):
+            cooling = backend.failures > 0 and now - backend.failed_at < self.cooldown
+            return cooling, backend.priority, backend.ewma if backend.ewma is not None else 0.0
+
+        return sorted(self.backends, key=key)
+
+    def hedge_after(self, backend: Backend) -> Optional[float]:
+        """Через сколько секунд дублировать запрос к модели (None - не дублировать)"""
+        if not self.hedge_percentile:
+            return None
+        if len(backend.samples) < self.min_samples:
+            return self.hedge_delay
+        return max(self.hedge_min_delay, backend.percentile(self.hedge_percentile))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": backend.name,
+                "priority": backend.priority,
+                "ewma": backend.ewma,
+                "p50": backend.percentile(50),
+                "p95": backend.percentile(95),
+                "failures": backend.failures,
+                "wins": backend.wins,
+            }
+            for backend in self.backends
+        ]
+
+    async def generate_response(self, message: str, context: Dict[str, Any] = None) -> str:
+        messages = [{"role": "user", "content": message}]
+        if context and "system_prompt" in context:
+            messages.insert(0, {"role": "system", "content": context["system_prompt"]})
+        return await self.process_conversation(messages)
+
+    async def process_conversation(self, messages: list) -> str:
+        """
+        Ответ первой успевшей модели.
+
+        :raises AIError: Если ни одна модель не ответила
+        """
+        queue = self.ordered()
+        running: Dict[asyncio.Task, Backend] = {}
+        started: Dict[asyncio.Task, float] = {}
+        hedges = 0
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            backend = queue.pop(0)
+            task = asyncio.create_task(self._call(backend, messages))
+            running[task] = backend
+            started[task] = time.perf_counter()
+            return backend
+
+        try:
+            current = launch()
+            while running:
+                timeout = None
+                if queue and hedges < self.max_hedges:
+                    timeout = self.hedge_after(current)
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedges += 1
+                    metrics.incr("llm.hedged")
+                    logger.info(f"Модель {current.name} отвечает дольше {timeout:.1f} сек, запрос продублирован")
+                    current = launch()
+                    continue
+
+                for task in done:
+                    backend = running.pop(task)
+                    if task.exception() is None:
+                        backend.wins += 1
+                        metrics.incr(f"llm.wins.{backend.name}")
+                        self._observe_losers(running, started)
+                        return task.result()
+                    last_error = task.exception()
+
+                # Все завершившиеся запросы с ошибкой: подключаю следующую модель, если ничего не ждем
+                if not running and queue:
+                    metrics.incr("llm.failover")
+                    logger.warning(f"Ошибка модели: {last_error}. Запрос передан следующей модели")
+                    current = launch()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        raise AIError(f"Ни одна модель не ответила: {last_error}")
+
+    def _observe_losers(self, running: Dict[asyncio.Task, Backend], started: Dict[asyncio.Task, float]):
+        """
+        Запросы, которые обогнал другой ответ, будут отменены: время до отмены - нижняя
+        граница их времени ответа. Без него медленные ответы не попадали бы в перцентиль
+        """
+        now = time.perf_counter()
+        for task, backend in running.items():
+            if not task.done():
+                metrics.incr(f"llm.hedge_lost.{backend.name}")
+                backend.observe(now - started[task], self.ewma_alpha)
+
+    async def _call(self, backend: Backend, messages: list) -> str:
+        started = time.perf_counter()
+        try:
+            response = await backend.model.process_conversation(messages)
+            if not response:
+                raise AIError(f"{backend.name}: пустой ответ")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            backend.failures += 1
+            backend.failed_at = time.monotonic()
+            metrics.incr(f"llm.errors.{backend.name}")
+            raise
+        elapsed = time.perf_counter() - started
+        backend.failures = 0
+        backend.observe(elapsed, self.ewma_alpha)
+        metrics.observe(f"llm.latency.{backend.name}", elapsed)
+        return response
+
+
+def create_default_model() -> BaseAI:
+    """
+    Модель по умолчанию: MODEL_GPT, а если заданы MODEL_FALLBACKS - маршрутизатор
+    между ними. Приоритет у всех моделей одинаковый: запрос уходит в самую быструю
+    исправную, MODEL_GPT - первая, пока замеров нет. В маршрутизаторе каждая модель
+    делает одну попытку: повтор заменяет переход к следующей модели
+    """
+    config = load_config()
+    fallbacks = [name.strip() for name in config.MODEL_FALLBACKS.split(",") if name.strip()]
+    if not fallbacks:
+        return ChatGPTAI(config.MODEL_GPT or None)
+    primary = ChatGPTAI(config.MODEL_GPT or None, max_attempts=1)
+    backends = [Backend(name=primary.model, model=primary)]
+    backends += [Backend(name=name, model=ChatGPTAI(name, max_attempts=1)) for name in fallbacks]
+    return ModelRouter(
+        backends,
+        hedge_percentile=config.LLM_HEDGE_PERCENTILE,
+        hedge_delay=config.LLM_HEDGE_DELAY,
+        hedge_min_delay=config.LLM_HEDGE_MIN_DELAY,
+        cooldown=config.LLM_BACKEND_COOLDOWN,
+    )
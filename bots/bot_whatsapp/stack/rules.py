@@ -0,0 +1,120 @@
+# bots/bot_whatsapp/stack/rules.py
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Pattern, Tuple
+from settings.logger import setup_logger
+from bots.bot_whatsapp.utils.metrics import metrics
+
+
+logger = setup_logger(__name__)
+
+# Типы сообщений, текст которых понимает extract_message_text; остальные считаются UNKNOWN_TYPE
+KNOWN_MESSAGE_TYPES = ("textMessage", "extendedTextMessage", "quotedMessage", "audioMessage", "imageMessage")
+# Вложения, которые бот не разбирает: на них отвечает правило unsupported_media
+MEDIA_MESSAGE_TYPES = (
+    "videoMessage",
+    "documentMessage",
+    "stickerMessage",
+    "locationMessage",
+    "contactMessage",
+    "contactsArrayMessage",
+)
+# Служебные действия клиента, а не сообщения: ни готового ответа, ни ответа модели
+IGNORED_MESSAGE_TYPES = ("reactionMessage", "pollUpdateMessage", "editedMessage", "deletedMessage")
+UNKNOWN_TYPE = "unknown"
+
+
+class _TemplateValues(dict):
+    """Неизвестные подстановки в шаблоне остаются пустыми"""
+
+    def __missing__(self, key):
+        return ""
+
+
+@dataclass(frozen=True)
+class ReplyRule:
+    """
+    Правило готового ответа без запроса к модели.
+
+    Срабатывает, если тип сообщения входит в message_types (пустой кортеж - любой тип)
+    и текст подходит под pattern (если он задан). Ответ - шаблон str.format,
+    доступные подстановки: sender_name, text.
+    """
+    name: str
+    reply: str
+    message_types: Tuple[str, ...] = ()
+    pattern: Optional[str] = None
+    _regex: Optional[Pattern] = field(init=False, repr=False, compare=False, default=None)
+
+    def __post_init__(self):
+        if self.pattern is not None:
+            object.__setattr__(self, "_regex", re.compile(self.pattern, re.IGNORECASE))
+
+    def matches(self, message_type: str, text: str) -> bool:
+        if self.message_types and message_type not in self.message_types:
+            return False
+        if self._regex is not None and not self._regex.search(text or ""):
+            return False
+        return True
+
+    def render(self, **values) -> str:
+        return self.reply.format_map(_TemplateValues(values)).strip()
+
+
+# Правила проверяются по порядку, срабатывает первое подходящее
+RULES: Tuple[ReplyRule, ...] = (
+    # Ответ на изображение задан в системном промпте дословно
+    ReplyRule(
+        name="image",
+        message_types=("imageMessage",),
+        reply="Благодарю за информацию на фото, его увидит менеджер. А я готова ответить на ваши вопросы",
+    ),
+    # Только явные вложения: неизвестные типы могут оказаться ответом клиента на сообщение бота
+    ReplyRule(
+        name="unsupported_media",
+        message_types=MEDIA_MESSAGE_TYPES,
+        reply="Благодарю за сообщение, его увидит менеджер. Напишите, пожалуйста, ваш вопрос текстом - я с радостью отвечу",
+    ),
+)
+
+
+class RuleEngine:
+    """Подбирает готовый ответ по типу и тексту сообщения до обращения к модели"""
+
+    def __init__(self, rules: Tuple[ReplyRule, ...] = RULES):
+        self.rules = rules
+
+    @staticmethod
+    def message_kind(message_type: str) -> str:
+        if message_type in KNOWN_MESSAGE_TYPES or message_type in MEDIA_MESSAGE_TYPES:
+            return message_type
+        return UNKNOWN_TYPE
+
+    @staticmethod
+    def ignores(message_type: str) -> bool:
+        """Сообщение не требует ответа (реакция, правка, удаление, голос в опросе)"""
+        if message_type in IGNORED_MESSAGE_TYPES:
+            metrics.incr("rules.ignored")
+            logger.info(f"Сообщение типа {message_type} не требует ответа")
+            return True
+        return False
+
+    def match(self, message_type: str, text: str) -> Optional[ReplyRule]:
+        kind = self.message_kind(message_type)
+        for rule in self.rules:
+            if rule.matches(kind, text):
+                return rule
+        return None
+
+    def reply(self, message_type: str, text: str, values: Optional[Dict] = None) -> Optional[str]:
+        """
+        Готовый ответ на сообщение или None, если ответ должна дать модель.
+        Каждый готовый ответ учитывается как сэкономленный запрос к модели.
+        """
+        rule = self.match(message_type, text)
+        if rule is None:
+            return None
+        metrics.incr(f"rules.{rule.name}")
+        metrics.incr("llm.calls_avoided")
+        logger.info(f"Сообщение типа {message_type} обработано правилом {rule.name}")
+        return rule.render(text=text, **(values or {}))
@@ -0,0 +1,46 @@
+# bots/bot_whatsapp/stack/stub_ai.py
+import asyncio
+import random
+from typing import Dict, Any, Optional
+from .base_ai import AIError, BaseAI
+
+
+class StubAI(BaseAI):
+    """
+    Модель-заглушка с заданной задержкой и долей ошибок.
+    Для проверки маршрутизации (ModelRouter) и нагрузочных тестов без обращения к провайдеру.
+    """
+
+    def __init__(self,
+                 name: str = "stub",
+                 delay: float = 0.0,
+                 jitter: float = 0.0,
+                 fail_rate: float = 0.0,
+                 reply: Optional[str] = None,
+                 seed: Optional[int] = None):
+        """
+        :param name: Имя модели (попадает в ответ и используется для подсчета токенов)
+        :param delay: Задержка ответа, секунды
+        :param jitter: Случайная добавка к задержке от 0 до jitter секунд
+        :param fail_rate: Доля запросов, завершающихся AIError
+        :param reply: Текст ответа (по умолчанию - имя модели и последнее сообщение)
+        """
+        self.model = name
+        self.delay = delay
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.reply = reply
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    async def generate_response(self, message: str, context: Dict[str, Any] = None) -> str:
+        return await self.process_conversation([{"role": "user", "content": message}])
+
+    async def process_conversation(self, messages: list) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay + self._random.uniform(0, self.jitter))
+        if self.fail_rate and self._random.random() < self.fail_rate:
+            raise AIError(f"{self.model}: ошибка заглушки")
+        if self.reply is not None:
+            return self.reply
+        return f"[{self.model}] {messages[-1]['content'] if messages else ''}"
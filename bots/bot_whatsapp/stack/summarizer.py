@@ -0,0 +1,42 @@
+# bots/bot_whatsapp/stack/summarizer.py
+from typing import Dict, List, Optional
+from settings.logger import setup_logger
+from bots.bot_whatsapp.utils.metrics import metrics
+from .base_ai import BaseAI
+from .prompts import SUMMARY_PROMPT
+
+
+logger = setup_logger(__name__)
+
+ROLE_NAMES = {"user": "Клиент", "assistant": "Консультант"}
+
+
+class ConversationSummarizer:
+    """Сворачивает старые реплики разговора в краткое резюме с помощью AI-модели"""
+
+    def __init__(self, ai_model: BaseAI):
+        self.ai_model = ai_model
+
+    @staticmethod
+    def build_messages(summary: str, turns: List[Dict]) -> List[Dict]:
+        dialogue = "\n".join(
+            f"{ROLE_NAMES.get(turn['role'], turn['role'])}: {turn['content']}" for turn in turns
+        )
+        return [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Текущее резюме:\n{summary or '(пусто)'}\n\nНовые реплики:\n{dialogue}"},
+        ]
+
+    async def summarize(self, summary: str, turns: List[Dict]) -> Optional[str]:
+        """
+        Новое резюме с учетом реплик turns.
+
+        :return: Текст резюме или None, если модель не вернула ответ
+        """
+        with metrics.timer("llm.summary"):
+            result = await self.ai_model.process_conversation(self.build_messages(summary, turns))
+        if not result or not result.strip():
+            metrics.incr("llm.summary_failed")
+            logger.warning(f"Модель не вернула резюме для {len(turns)} реплик")
+            return None
+        return result.strip()
@@ -0,0 +1,63 @@
+# bots/bot_whatsapp/stack/tiering.py
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+from settings.config import Config
+from .catalog import Catalog
+
+
+FAST = "fast"
+STRONG = "strong"
+
+_NUMBER_RE = re.compile(r"\d")
+
+
+@dataclass
+class TurnFeatures:
+    length: int
+    turn: int
+    catalog_terms: int
+    has_numbers: bool
+
+
+class ComplexityClassifier:
+    """
+    Выбор модели для хода разговора без обращения к модели.
+
+    Ход считается сложным, если сработало хотя бы TIER_MIN_SIGNALS признаков: длинное
+    сообщение, поздний ход разговора, много терминов каталога, числа (размеры,
+    количество дверей) вместе с терминами каталога. Остальные ходы - простые
+    (приветствие, короткий вопрос) и уходят в быструю модель.
+    """
+
+    def __init__(self, config: Config, catalog: Optional[Catalog] = None):
+        self.catalog = catalog
+        self.length_threshold = config.TIER_LENGTH_THRESHOLD
+        self.turn_threshold = config.TIER_TURN_THRESHOLD
+        self.keyword_threshold = config.TIER_KEYWORD_THRESHOLD
+        self.min_signals = config.TIER_MIN_SIGNALS
+
+    def features(self, message: str, history: List[dict], turn: Optional[int] = None) -> TurnFeatures:
+        return TurnFeatures(
+            length=len(message),
+            # История в запросе усечена и свернута в резюме, по ней номер хода занижен
+            turn=turn if turn is not None else sum(1 for item in history if item["role"] == "user"),
+            catalog_terms=self.catalog.matched_terms(message) if self.catalog else 0,
+            has_numbers=bool(_NUMBER_RE.search(message)),
+        )
+
+    def classify(self, message: str, history: List[dict], turn: Optional[int] = None) -> str:
+        """
+        :param message: Текст хода клиента
+        :param history: История вместе с текущим сообщением
+        :param turn: Номер хода клиента с начала разговора (по умолчанию - по истории)
+        :return: FAST или STRONG
+        """
+        features = self.features(message, history, turn)
+        signals = sum((
+            features.length >= self.length_threshold,
+            features.turn >= self.turn_threshold,
+            features.catalog_terms >= self.keyword_threshold,
+            features.has_numbers and features.catalog_terms > 0,
+        ))
+        return STRONG if signals >= self.min_signals else FAST
@@ -0,0 +1,92 @@
+# bots/bot_whatsapp/stack/tokens.py
+from functools import lru_cache
+from typing import Dict, List
+from settings.logger import setup_logger
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - без tiktoken считаем приблизительно
+    tiktoken = None
+
+
+logger = setup_logger(__name__)
+
+# Бюджет токенов на историю разговора (без системного промпта) для моделей
+HISTORY_TOKEN_BUDGETS: Dict[str, int] = {
+    "gpt-4o-mini": 3000,
+    "gpt-4o": 3000,
+    "gpt-4.1-mini": 3000,
+    "gpt-4.1": 3000,
+    "gpt-3.5-turbo": 2000,
+}
+DEFAULT_HISTORY_TOKEN_BUDGET = 2000
+
+# Служебные токены формата чата: на каждое сообщение и на начало ответа
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+# Без токенизатора: в среднем около трех символов русского текста на токен
+CHARS_PER_TOKEN = 3
+
+
+@lru_cache(maxsize=16)
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            logger.warning(f"Неизвестная tiktoken модель {model}, используется o200k_base")
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Словарь кодировки скачивается при первом обращении; без сети считаем приблизительно
+        logger.warning(f"Не удалось загрузить кодировку tiktoken для {model}: {e}")
+        return None
+
+
+@lru_cache(maxsize=256)
+def count_tokens(text: str, model: str) -> int:
+    """Количество токенов в тексте (кэшируется - системные промпты считаются один раз)"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return max(1, len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def message_tokens(message: Dict, model: str) -> int:
+    """Токены одного сообщения чата с учетом служебных; берет сохраненное значение, если оно есть"""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = count_tokens(message.get("content") or "", model)
+    return tokens + TOKENS_PER_MESSAGE
+
+
+def prompt_tokens(messages: List[Dict], model: str) -> int:
+    """Оценка числа токенов запроса к модели"""
+    return sum(message_tokens(message, model) for message in messages) + TOKENS_PER_REPLY
+
+
+def history_budget(model: str, override: int = 0) -> int:
+    """Бюджет токенов на историю: явная настройка или значение для модели"""
+    if override:
+        return override
+    return HISTORY_TOKEN_BUDGETS.get(model, DEFAULT_HISTORY_TOKEN_BUDGET)
+
+
+def truncate_to_budget(history: List[Dict], budget: int, model: str) -> List[Dict]:
+    """
+    Оставляет самые свежие сообщения истории, укладывающиеся в бюджет токенов.
+    Последнее сообщение остается всегда, даже если оно одно больше бюджета.
+    """
+    kept = 0
+    used = 0
+    for message in reversed(history):
+        tokens = message_tokens(message, model)
+        if kept and used + tokens > budget:
+            break
+        used += tokens
+        kept += 1
+    return history[len(history) - kept:]
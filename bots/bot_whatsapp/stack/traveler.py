@@ -1,98 +1,405 @@
 # bots/bot_whatsapp/stack/traveler.py
 import asyncio
-from typing import Dict, Any, Optional
-from settings.connection_db import async_session
-from bots.bot_whatsapp.db.models import ConversationContext
+import time
+from typing import Dict, Any, Optional, Tuple
+from settings.config import load_config
+from bots.bot_whatsapp.db.context_store import ContextWriteBehind, context_writer
 from settings.logger import setup_logger
-from .base_ai import BaseAI
+from bots.bot_whatsapp.utils.metrics import metrics
+from .answer_cache import AnswerCache, answer_cache
+from .base_ai import AIError, BaseAI
 from .chatgpt_ai import ChatGPTAI
-from .prompts import SYSTEM_PROMPTS
+from .model_router import create_default_model
+from .catalog import Catalog, get_catalog
+from .prompts import CORE_PROMPTS, SYSTEM_PROMPTS
+from .summarizer import ConversationSummarizer
+from .tiering import STRONG, ComplexityClassifier
+from .tokens import (
+    TOKENS_PER_MESSAGE,
+    count_tokens,
+    history_budget,
+    prompt_tokens,
+    truncate_to_budget,
+)
 
 
 logger = setup_logger(__name__)
 
 
 class AITraveler:
-    def __init__(self, ai_model: Optional[BaseAI] = None, phone_number: str = None):
+    def __init__(self,
+                 ai_model: Optional[BaseAI] = None,
+                 phone_number: str = None,
+                 context_store: Optional[ContextWriteBehind] = None,
+                 answers: Optional[AnswerCache] = None,
+                 catalog: Optional[Catalog] = None,
+                 fast_model: Optional[BaseAI] = None):
         """
         Менеджер взаимодействия с AI-моделями
         
-        :param ai_model: Экземпляр AI-модели (по умолчанию ChatGPT)
+        :param ai_model: Экземпляр AI-модели (по умолчанию ChatGPT MODEL_GPT или маршрутизатор с MODEL_FALLBACKS)
         :param phone_number: Номер телефона для сохранения контекста
+        :param context_store: Отложенная запись реплик (по умолчанию общая для процесса)
+        :param answers: Кэш ответов на типовые вопросы (по умолчанию общий для процесса)
+        :param catalog: Каталог для подбора справки (по умолчанию общий, если CATALOG_TOP_K > 0)
+        :param fast_model: Быстрая модель для простых ходов (по умолчанию MODEL_FAST, если задана)
         """
-        self.ai_model = ai_model or ChatGPTAI()
+        self.config = load_config()
+        self.ai_model = ai_model or create_default_model()
         self.phone_number = phone_number
+        self.context_store = context_store or context_writer
+        self.answers = answers if answers is not None else answer_cache
+        self.catalog = catalog if catalog is not None else get_catalog()
+        # Простые ходы отвечает быстрая модель, сложные - основная (см. stack/tiering.py)
+        self.fast_model = fast_model or (ChatGPTAI(self.config.MODEL_FAST) if self.config.MODEL_FAST else None)
+        self.classifier = ComplexityClassifier(self.config, self.catalog) if self.fast_model else None
         self.conversation_history = []
-        
-        # Загрузка контекста из базы данных асинхронно
-        if phone_number:
-            asyncio.create_task(self.load_context_from_db())
+        # Порядковый номер следующей реплики в conversation_messages
+        self._next_seq = 0
+        # Резюме старой части разговора и seq первой реплики, не вошедшей в него
+        self.summary = ""
+        self._summary_seq = 0
+        self.summarizer = ConversationSummarizer(self.fast_model or self.ai_model)
+        self._summary_task: Optional[asyncio.Task] = None
+        # Контекст загружается из БД один раз, при первом обращении (см. ensure_loaded)
+        self._loaded = not phone_number
+        self._load_task: Optional[asyncio.Task] = None
+        # Незавершенные ходы: пока они есть, AITraveler не вытесняется из кэша (см. TravelerCache)
+        self._in_flight = 0
+
+    @classmethod
+    async def create(cls, ai_model: Optional[BaseAI] = None, phone_number: str = None) -> "AITraveler":
+        """Создает AITraveler с уже загруженным из БД контекстом"""
+        traveler = cls(ai_model=ai_model, phone_number=phone_number)
+        await traveler.ensure_loaded()
+        return traveler
+
+    async def ensure_loaded(self):
+        """
+        Дожидается загрузки контекста из БД. Параллельные вызовы ждут одну и ту же загрузку,
+        после ошибки следующий вызов пробует загрузить контекст снова.
+        """
+        if self._loaded:
+            return
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(self.load_context_from_db())
+        load_task = self._load_task
+        try:
+            # shield: отмена одного из ожидающих не должна прерывать общую загрузку
+            await asyncio.shield(load_task)
+        finally:
+            if load_task.done() and not self._loaded and self._load_task is load_task:
+                self._load_task = None
 
     async def load_context_from_db(self):
+        """Загружает резюме и последние реплики разговора, еще не вошедшие в резюме"""
         try:
-            async with async_session() as session:
-                context_record = await ConversationContext.get_or_create(session, self.phone_number)
-                self.conversation_history = context_record.conversation_history
-                logger.info(f"Загружена история разговора для {self.phone_number}: {self.conversation_history}")
+            (rows, self._next_seq), (self.summary, self._summary_seq) = await asyncio.gather(
+                self.context_store.load_recent(self.phone_number, self.config.HISTORY_LOAD_LIMIT),
+                self.context_store.load_summary(self.phone_number),
+            )
+            self.conversation_history = [
+                {"role": row["role"], "content": row["content"], "tokens": row["token_count"], "seq": row["seq"]}
+                for row in rows
+                if row["seq"] >= self._summary_seq
+            ]
+            self._loaded = True
+            logger.info(f"Загружена история разговора для {self.phone_number}: {self.conversation_history}")
         except Exception as e:
             logger.error(f"Ошибка при загрузке контекста для {self.phone_number}: {str(e)}")
+            raise
+
+    @property
+    def model_name(self) -> str:
+        """Имя модели для подсчета токенов"""
+        return getattr(self.ai_model, "model", None) or self.config.MODEL_GPT or "gpt-4o-mini"
+
+    def _append_history(self, role: str, content: str):
+        """Добавляет реплику в историю и ставит ее в очередь на запись отдельной строкой"""
+        # Токены считаются один раз и хранятся вместе с репликой
+        tokens = count_tokens(content, self.model_name)
+        seq = self._next_seq
+        self.conversation_history.append({"role": role, "content": content, "tokens": tokens, "seq": seq})
+        self._next_seq += 1
+        if self.phone_number:
+            self.context_store.append(self.phone_number, seq, role, content, tokens)
+
+    def _append_user_message(self, message: str):
+        """Добавляет сообщение клиента, если оно не повторяет последнюю реплику"""
+        last = self.conversation_history[-1] if self.conversation_history else None
+        if not last or (last["role"], last["content"]) != ("user", message):
+            self._append_history("user", message)
+        logger.info(f"[{self.phone_number}] Сообщение добавлено в историю: {message}")
+
+    def _commit_turn(self, message: str, response: str):
+        self._append_user_message(message)
+        self._append_history("assistant", response)
+
+    @property
+    def busy(self) -> bool:
+        """Идет ход разговора: его реплики еще не добавлены в историю"""
+        return self._in_flight > 0
+
+    async def record_turn(self, message: str, response: str):
+        """Записывает в историю ход разговора, ответ на который дан без модели (см. stack/rules.py)"""
+        self._in_flight += 1
+        try:
+            await self.ensure_loaded()
+            self._commit_turn(message, response)
+            self._maybe_summarize()
+        finally:
+            self._in_flight -= 1
+
+    @staticmethod
+    def _truncate(history: list, budget: int, model: str, max_history: Optional[int]) -> list:
+        history = truncate_to_budget(history, budget, model)
+        if max_history and len(history) > max_history:
+            history = history[-max_history:]
+        return history
+
+    def select_model(self, message: str, history: list) -> Tuple[str, BaseAI]:
+        """Уровень сложности хода и модель для него"""
+        if self.classifier is None:
+            return STRONG, self.ai_model
+        tier = self.classifier.classify(message, history, self._user_turn(message))
+        return tier, self.ai_model if tier == STRONG else self.fast_model
+
+    def _user_turn(self, message: str) -> int:
+        """
+        Номер хода клиента с начала разговора. Считается по seq, а не по истории в памяти:
+        она усекается и сворачивается в резюме. Реплики клиента и бота чередуются,
+        сообщение без ответа (ошибка модели) - последняя реплика с нечетным seq.
+        """
+        user_messages = (self._next_seq + 1) // 2
+        last = self.conversation_history[-1] if self.conversation_history else None
+        if last and (last["role"], last["content"]) == ("user", message):
+            # Повтор сообщения, уже записанного без ответа
+            return user_messages
+        return user_messages + 1
+
+    def build_context(self, context_type: str, history: list) -> Dict[str, Any]:
+        """
+        Системный промпт и справка из каталога для ответа на последнее сообщение истории.
+        Без каталога используется полный промпт из SYSTEM_PROMPTS со всей базой знаний.
+        """
+        if self.catalog is None or context_type not in CORE_PROMPTS:
+            return {
+                "system_prompt": SYSTEM_PROMPTS.get(context_type, SYSTEM_PROMPTS["default"]),
+                "reference": "",
+                "cache_key": SYSTEM_PROMPTS.get(context_type, SYSTEM_PROMPTS["default"]),
+            }
+        # Поиск по двум последним сообщениям клиента: уточнения вроде "а у Rada?" без предыдущего непонятны
+        query = " ".join([item["content"] for item in history if item["role"] == "user"][-2:])
+        with metrics.timer("catalog.search"):
+            reference = self.catalog.reference(query, self.config.CATALOG_TOP_K)
+        return {
+            "system_prompt": CORE_PROMPTS[context_type],
+            "reference": reference,
+            # Ответы из кэша устаревают при смене промпта или каталога
+            "cache_key": CORE_PROMPTS[context_type] + self.catalog.version,
+        }
+
+    def build_messages(self, system_prompt: str, history: Optional[list] = None, reference: str = "") -> list:
+        """
+        Список сообщений для модели: системный промпт, справка из каталога, резюме старой
+        части разговора и история (по умолчанию текущая) без служебных полей
+        """
+        if history is None:
+            history = self.conversation_history
+        messages = [{"role": "system", "content": system_prompt}]
+        if reference:
+            messages.append({"role": "system", "content": reference})
+        if self.summary:
+            messages.append({"role": "system", "content": f"Краткое содержание предыдущей части разговора:\n{self.summary}"})
+        return messages + [{"role": item["role"], "content": item["content"]} for item in history]
 
+    def _is_early_turn(self, history: list) -> bool:
+        """
+        Ответ на первые ANSWER_CACHE_MAX_TURNS сообщений клиента не зависит от истории
+        и может браться из кэша ответов
 
-    async def save_context_to_db(self):
-        """Сохранение контекста в базу данных"""
+        :param history: История вместе с текущим сообщением клиента
+        """
+        # Вся история с начала разговора должна быть в памяти
+        if self.summary or self._summary_seq or len(self.conversation_history) != self._next_seq:
+            return False
+        user_turns = sum(1 for item in history if item["role"] == "user")
+        return user_turns <= self.config.ANSWER_CACHE_MAX_TURNS
+
+    def _maybe_summarize(self):
+        """
+        Запускает в фоне свертку старых реплик в резюме, если история превысила
+        SUMMARY_TRIGGER_TOKENS. Последние SUMMARY_KEEP_MESSAGES реплик остаются как есть.
+        """
+        trigger = self.config.SUMMARY_TRIGGER_TOKENS
+        keep = self.config.SUMMARY_KEEP_MESSAGES
+        if not trigger or (self._summary_task and not self._summary_task.done()):
+            return
+        if len(self.conversation_history) <= keep:
+            return
+        if prompt_tokens(self.conversation_history, self.model_name) <= trigger:
+            return
+        turns = self.conversation_history[:len(self.conversation_history) - keep]
+        self._summary_task = asyncio.create_task(self._summarize(turns))
+
+    async def _summarize(self, turns: list):
+        try:
+            summary = await self.summarizer.summarize(self.summary, turns)
+        except Exception as e:
+            metrics.incr("llm.summary_failed")
+            logger.error(f"[{self.phone_number}] Ошибка при составлении резюме разговора: {e}")
+            return
+        if summary is None:
+            return
+
+        # Свернутые реплики убираются из истории, пока идет запрос сюда могли добавиться новые
+        self.summary = summary
+        self._summary_seq = turns[-1]["seq"] + 1
+        self.conversation_history = [
+            item for item in self.conversation_history if item["seq"] >= self._summary_seq
+        ]
+        metrics.incr("llm.summary_turns", len(turns))
+        logger.info(
+            f"[{self.phone_number}] В резюме свернуто реплик: {len(turns)}, "
+            f"длина резюме {len(summary)} символов"
+        )
         if self.phone_number:
-            async with async_session() as session:
-                context_record = await ConversationContext.get_or_create(session, self.phone_number)
-                await context_record.save_context(session, self.conversation_history)
-                logger.info(f"Сохранена история разговора для {self.phone_number}")
+            try:
+                await self.context_store.save_summary(self.phone_number, summary, self._summary_seq)
+            except Exception as e:
+                logger.error(f"[{self.phone_number}] Ошибка при сохранении резюме разговора: {e}")
+
+    async def flush_context(self):
+        """
+        Сразу записывает несохраненную историю этого номера (например, при вытеснении из кэша),
+        дождавшись составляемого резюме
+        """
+        if self._summary_task:
+            await asyncio.gather(self._summary_task, return_exceptions=True)
+        if self.phone_number:
+            await self.context_store.flush([self.phone_number])
 
 
     async def process_message(self, 
                                message: str, 
                                context_type: str = "default", 
-                               max_history: int = 10) -> str:
-        """Обработка входящего сообщения с учетом контекста и сохранением в БД"""
-        context = {
-            "system_prompt": SYSTEM_PROMPTS.get(context_type, SYSTEM_PROMPTS["default"])
-        }
+                               max_history: Optional[int] = None) -> str:
+        """
+        Обработка входящего сообщения с учетом контекста и сохранением в БД
+
+        История усекается по бюджету токенов модели (HISTORY_TOKEN_BUDGET),
+        max_history дополнительно ограничивает число сообщений.
+        """
+        self._in_flight += 1
+        try:
+            return await self._process_message(message, context_type, max_history)
+        finally:
+            self._in_flight -= 1
 
-        # Добавляю текущее сообщение в историю
-        if not self.conversation_history or self.conversation_history[-1] != {"role": "user", "content": message}:
-            self.conversation_history.append({"role": "user", "content": message})
+    async def _process_message(self, message: str, context_type: str, max_history: Optional[int]) -> str:
+        # Без загруженной истории ответ потерял бы контекст, а сохранение затерло бы его в БД
+        await self.ensure_loaded()
 
-        logger.info(f"[{self.phone_number}] Сообщение добавлено в историю: {message}")
+        # Сообщение клиента попадает в историю только вместе с ответом: если обработку
+        # отменят во время запроса к модели (см. controller/debouncer.py), история не изменится
+        model = self.model_name
+        history = list(self.conversation_history)
+        last = history[-1] if history else None
+        if not last or (last["role"], last["content"]) != ("user", message):
+            history.append({"role": "user", "content": message, "tokens": count_tokens(message, model)})
+        context = self.build_context(context_type, history)
+        # Уровень выбирается до кэша: ответы быстрой и основной модели кэшируются раздельно
+        tier, tier_model = self.select_model(message, history)
+
+        early_turn = self.answers.enabled and self._is_early_turn(history)
+        if early_turn:
+            cached = self.answers.get(message, context["cache_key"], tier)
+            if cached is not None:
+                self._commit_turn(message, cached)
+                metrics.incr("llm.calls_avoided")
+                logger.info(f"[{self.phone_number}] Ответ из кэша без запроса к модели: {cached}")
+                return cached
 
-        # Усекаем историю до максимального размера
-        if len(self.conversation_history) > max_history:
-            self.conversation_history = self.conversation_history[-max_history:]
-            logger.info(f"История усечена до последних {max_history} сообщений.")
+        # Усекаем историю по бюджету токенов (старые реплики остаются в БД). Обычно история
+        # короче бюджета за счет резюме, усечение срабатывает, пока резюме еще не готово
+        summary_tokens = count_tokens(self.summary, model)
+        budget = max(history_budget(model, self.config.HISTORY_TOKEN_BUDGET) - summary_tokens, 0)
+        history_length = len(history)
+        history = self._truncate(history, budget, model, max_history)
+        if len(history) < history_length:
+            logger.info(
+                f"История усечена до {len(history)} сообщений "
+                f"(бюджет {budget} токенов для {model})."
+            )
 
         # Генерируем полный список сообщений с системным промптом
-        full_messages = [
-            {"role": "system", "content": context["system_prompt"]}
-        ] + self.conversation_history
+        full_messages = self.build_messages(context["system_prompt"], history, context["reference"])
         logger.info(f"Полный список сообщений для модели: {full_messages}")
 
-        response = await self.ai_model.process_conversation(full_messages)
+        system_tokens = count_tokens(context["system_prompt"], model) + TOKENS_PER_MESSAGE
+        if context["reference"]:
+            system_tokens += count_tokens(context["reference"], model) + TOKENS_PER_MESSAGE
+        if self.summary:
+            system_tokens += summary_tokens + TOKENS_PER_MESSAGE
+        total_tokens = system_tokens + prompt_tokens(history, model)
+        metrics.observe("llm.prompt_tokens", total_tokens)
+        logger.info(
+            f"[{self.phone_number}] Токенов в запросе: {total_tokens} "
+            f"(системный промпт и резюме {system_tokens}, история {total_tokens - system_tokens}, "
+            f"сообщений {len(full_messages)})"
+        )
+
+        started = time.perf_counter()
+        try:
+            response = await tier_model.process_conversation(full_messages)
+        except AIError as e:
+            metrics.incr(f"llm.tier.{tier}.errors")
+            # Извинение не попадает в историю: при следующем сообщении модель увидит вопрос клиента
+            logger.error(f"[{self.phone_number}] Модель не ответила: {e}. Используется ответ по умолчанию.")
+            self._append_user_message(message)
+            return "Извините, я не смог обработать ваш запрос."
         if response is None:
             logger.error("AI модель вернула None. Используется ответ по умолчанию.")
             response = "Извините, я не смог обработать ваш запрос."
+        else:
+            self._report_tier(tier, tier_model, time.perf_counter() - started, total_tokens, response)
+            if early_turn:
+                self.answers.put(message, context["cache_key"], response, tier)
 
-        # Добавляю ответ в историю
-        self.conversation_history.append({"role": "assistant", "content": response})
+        # Добавляю ход в историю, в БД реплики запишутся в фоне. Между ответом модели
+        # и записью нет await, поэтому отмена не может оставить ход записанным наполовину
+        self._commit_turn(message, response)
+        self.conversation_history = self._truncate(self.conversation_history, budget, model, max_history)
         logger.info(f"Ответ от AI: {response}")
 
-        # Сохраняем контекст в базу данных
-        await self.save_context_to_db()
+        # Резюме составляется после ответа и не задерживает его
+        self._maybe_summarize()
 
         return response
 
+    def _report_tier(self, tier: str, tier_model: BaseAI, elapsed: float, request_tokens: int, response: str):
+        """Время ответа и токены по уровням, чтобы проверять экономию от быстрой модели"""
+        model = getattr(tier_model, "model", None) or self.model_name
+        response_tokens = count_tokens(response, model)
+        metrics.incr(f"llm.tier.{tier}.requests")
+        metrics.observe(f"llm.tier.{tier}.latency", elapsed)
+        metrics.observe(f"llm.tier.{tier}.prompt_tokens", request_tokens)
+        metrics.observe(f"llm.tier.{tier}.completion_tokens", response_tokens)
+        logger.info(
+            f"[{self.phone_number}] Уровень {tier} ({model}): ответ за {elapsed:.2f} сек, "
+            f"токенов {request_tokens} + {response_tokens}"
+        )
+
     async def reset_conversation(self):
         """Сброс истории беседы с удалением из базы данных"""
+        if self._summary_task:
+            self._summary_task.cancel()
+            await asyncio.gather(self._summary_task, return_exceptions=True)
+            self._summary_task = None
         self.conversation_history = []
+        self._next_seq = 0
+        self.summary = ""
+        self._summary_seq = 0
         
         if self.phone_number:
-            async with async_session() as session:
-                context_record = await ConversationContext.get_or_create(session, self.phone_number)
-                context_record.context = {}
-                await session.commit()
\ No newline at end of file
+            await self.context_store.delete_chat(self.phone_number)
\ No newline at end of file
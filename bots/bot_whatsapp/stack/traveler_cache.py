@@ -0,0 +1,145 @@
+# bots/bot_whatsapp/stack/traveler_cache.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from settings.logger import setup_logger
+from .traveler import AITraveler
+
+
+logger = setup_logger(__name__)
+
+
+class TravelerCache:
+    """
+    Кэш AITraveler по номеру телефона с ограничением по размеру (LRU) и времени простоя (TTL).
+
+    При вытеснении несохраненный контекст записывается в БД, при следующем
+    сообщении AITraveler создается заново и загружает историю из conversation_messages.
+
+    AITraveler с незавершенным ходом (AITraveler.busy) не вытесняется: иначе новый
+    экземпляр загрузил бы историю без этого хода, и реплики обоих получили бы одни и те же
+    seq. Такой AITraveler остается в кэше, даже если кэш переполнен, и вытесняется позже.
+    """
+
+    def __init__(self,
+                 max_size: int = 1000,
+                 ttl: float = 1800.0,
+                 factory: Optional[Callable[[str], AITraveler]] = None):
+        """
+        :param max_size: Максимальное число AITraveler в памяти
+        :param ttl: Время простоя в секундах, после которого AITraveler вытесняется
+        :param factory: Функция создания AITraveler по номеру телефона
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.factory = factory or (lambda phone_number: AITraveler(phone_number=phone_number))
+        self._entries: "OrderedDict[str, AITraveler]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        # Сохранение вытесненных контекстов: новый AITraveler ждет его перед загрузкой
+        self._flushing: Dict[str, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, phone_number: str) -> bool:
+        return phone_number in self._entries
+
+    async def get(self, phone_number: str) -> AITraveler:
+        """Возвращает AITraveler для номера, создавая его при промахе"""
+        traveler = self._entries.get(phone_number)
+        if traveler is not None and (traveler.busy or not self._is_expired(phone_number)):
+            self.hits += 1
+            self._touch(phone_number)
+            return traveler
+
+        if traveler is not None:
+            self._evict(phone_number)
+
+        self.misses += 1
+        flushing = self._flushing.get(phone_number)
+        if flushing:
+            await asyncio.shield(flushing)
+
+        # Пока ждали сохранения, AITraveler мог создать параллельный вызов
+        traveler = self._entries.get(phone_number)
+        if traveler is None:
+            logger.info(f"Создание нового AITraveler для номера: {phone_number}")
+            traveler = self.factory(phone_number)
+            self._entries[phone_number] = traveler
+        self._touch(phone_number)
+
+        if len(self._entries) > self.max_size:
+            # Самые давние без незавершенного хода; текущий только что использован и идет последним
+            idle = [phone for phone, entry in self._entries.items() if not entry.busy and entry is not traveler]
+            for oldest in idle[:len(self._entries) - self.max_size]:
+                self._evict(oldest)
+        return traveler
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    async def start(self, sweep_interval: float = 60.0):
+        """Запускает периодическое вытеснение простаивающих AITraveler"""
+        self._sweeper = asyncio.create_task(self._sweep_loop(sweep_interval))
+
+    async def stop(self):
+        """Останавливает вытеснение и сохраняет контекст всех AITraveler"""
+        if self._sweeper:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        for phone_number in list(self._entries):
+            self._evict(phone_number)
+        await asyncio.gather(*self._flushing.values(), return_exceptions=True)
+        logger.info(f"Кэш AITraveler остановлен: {self.stats()}")
+
+    def evict_expired(self) -> int:
+        expired = [
+            phone for phone, traveler in self._entries.items()
+            if not traveler.busy and self._is_expired(phone)
+        ]
+        for phone_number in expired:
+            self._evict(phone_number)
+        return len(expired)
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            evicted = self.evict_expired()
+            if evicted:
+                logger.info(f"Вытеснено простаивающих AITraveler: {evicted}, {self.stats()}")
+
+    def _touch(self, phone_number: str):
+        self._entries.move_to_end(phone_number)
+        self._last_used[phone_number] = time.monotonic()
+
+    def _is_expired(self, phone_number: str) -> bool:
+        return time.monotonic() - self._last_used.get(phone_number, 0.0) > self.ttl
+
+    def _evict(self, phone_number: str):
+        traveler = self._entries.pop(phone_number)
+        self._last_used.pop(phone_number, None)
+        self.evictions += 1
+        task = asyncio.create_task(self._flush(phone_number, traveler))
+        self._flushing[phone_number] = task
+
+    async def _flush(self, phone_number: str, traveler: AITraveler):
+        try:
+            await traveler.flush_context()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении контекста вытесненного {phone_number}: {e}")
+        finally:
+            if self._flushing.get(phone_number) is asyncio.current_task():
+                del self._flushing[phone_number]
@@ -0,0 +1,79 @@
+# bot_whatsapp/utils/circuit_breaker.py
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Вызов отклонен без обращения к сервису: предохранитель разомкнут"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name}: сервис недоступен, повтор через {retry_in:.0f} сек")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для внешнего сервиса.
+
+    После failure_threshold ошибок подряд размыкается на reset_timeout секунд и
+    отклоняет вызовы сразу. Затем пропускает один пробный вызов (half-open):
+    успех замыкает предохранитель, ошибка размыкает его снова.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def before_call(self):
+        """Проверка перед вызовом: бросает CircuitOpenError, если вызывать сервис нельзя"""
+        state = self.state
+        if state == self.CLOSED:
+            return
+        now = time.monotonic()
+        # Пробный вызов, который так и не завершился (например, был отменен), не блокирует следующий
+        probe_stale = now - self._probe_started >= self.reset_timeout
+        if state == self.HALF_OPEN and (not self._probe_in_flight or probe_stale):
+            self._probe_in_flight = True
+            self._probe_started = now
+            return
+        retry_in = max(0.0, self.reset_timeout - (now - self.opened_at))
+        raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self):
+        if self._state != self.CLOSED:
+            logger.info(f"{self.name}: сервис снова доступен, предохранитель замкнут")
+        self._state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probe_in_flight or self.failures >= self.failure_threshold:
+            if self._state != self.OPEN or self._probe_in_flight:
+                logger.warning(
+                    f"{self.name}: ошибок подряд {self.failures}, "
+                    f"предохранитель разомкнут на {self.reset_timeout:.0f} сек"
+                )
+            self._state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probe_in_flight = False
@@ -17,7 +17,8 @@ def extract_message_text(message_data: Dict) -> Optional[str]:
     message_type = message_data.get("typeMessage", "")
     if message_type == "textMessage":
         return message_data.get("textMessageData", {}).get("textMessage", None)
-    elif message_type == "extendedTextMessage":
+    elif message_type in ("extendedTextMessage", "quotedMessage"):
+        # Ответ с цитатой: текст ответа там же, где у extendedTextMessage
         return message_data.get("extendedTextMessageData", {}).get("text", None)
     elif message_type == "audioMessage":
         # handler using whisper
@@ -29,7 +30,7 @@ def extract_message_text(message_data: Dict) -> Optional[str]:
     
 
 def extract_message_data(notification: Dict) -> Dict:
-    """Извлекает все необходимые данные из уведомления для сохранения в базу данных"""
+    """Извлекает все необходимые данные из уведомления для сохранения в базу данных вместе с самим уведомлением"""
     body = notification.get("body", {})
     receipt_id = notification.get("receiptId")
     instance_data = body.get("instanceData", {})
@@ -52,6 +53,8 @@ def extract_message_data(notification: Dict) -> Dict:
         "sender_contact_name": sender_data.get("senderContactName"),
         "message_type": message_data.get("typeMessage"),
         "message_text": message_text,
+        # Уведомление целиком: по нему трафик можно воспроизвести (tools.replay_notifications)
+        "raw_data": notification,
     }
 
 
@@ -0,0 +1,137 @@
+# bot_whatsapp/utils/keyed_scheduler.py
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Optional
+from bots.bot_whatsapp.utils.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable]
+
+
+@dataclass
+class _Lane:
+    """Последовательная очередь задач одного ключа (чата)"""
+    queue: asyncio.Queue
+    task: Optional[asyncio.Task] = None
+    # Задачи сверх lane_size: переходят в очередь по мере ее освобождения
+    overflow: Deque[Job] = field(default_factory=deque)
+    processed: int = field(default=0)
+
+
+class KeyedScheduler:
+    """
+    Планировщик задач с шардированием по ключу.
+
+    Задачи с одинаковым ключом выполняются строго по порядку в своей «полосе»,
+    задачи разных ключей выполняются параллельно, но не больше concurrency одновременно.
+    Полоса без задач дольше idle_timeout секунд завершается и удаляется.
+
+    Заполненная полоса не блокирует постановку задач другим ключам: лишние задачи
+    откладываются в общий резерв на max_overflow задач, и ожидание начинается
+    только когда заполнен он.
+    """
+
+    def __init__(self, concurrency: int, lane_size: int = 0, idle_timeout: float = 60.0, max_overflow: int = 0):
+        """
+        :param concurrency: Максимум одновременно выполняемых задач по всем ключам
+        :param lane_size: Максимум ожидающих задач в одной полосе (0 - без ограничения)
+        :param idle_timeout: Время простоя полосы в секундах до ее удаления
+        :param max_overflow: Максимум отложенных задач сверх lane_size по всем полосам (0 - без ограничения)
+        """
+        self.concurrency = concurrency
+        self.lane_size = lane_size
+        self.idle_timeout = idle_timeout
+        self.max_overflow = max_overflow
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._lanes: Dict[str, _Lane] = {}
+        self._overflow = 0
+        self._overflow_free = asyncio.Event()
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Общий лимит concurrency: им же ограничиваются задачи, запущенные вне полос"""
+        return self._semaphore
+
+    async def submit(self, key: str, job: Job) -> None:
+        """
+        Ставит задачу в полосу ключа. Если полоса заполнена - откладывает задачу в резерв,
+        ожидание возможно только при заполненном резерве.
+
+        :param key: Ключ шардирования (ID чата)
+        :param job: Функция без аргументов, возвращающая корутину
+        """
+        while self.max_overflow and self._overflow >= self.max_overflow:
+            self._overflow_free.clear()
+            await self._overflow_free.wait()
+
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = _Lane(queue=asyncio.Queue(maxsize=self.lane_size))
+            lane.task = asyncio.create_task(self._run_lane(key, lane))
+            self._lanes[key] = lane
+        if lane.overflow or lane.queue.full():
+            lane.overflow.append(job)
+            self._overflow += 1
+            metrics.incr("scheduler.lane_overflow")
+        else:
+            lane.queue.put_nowait(job)
+
+    def depth(self, key: str) -> int:
+        """Количество задач, ожидающих выполнения в полосе ключа"""
+        lane = self._lanes.get(key)
+        return lane.queue.qsize() + len(lane.overflow) if lane else 0
+
+    def stats(self) -> Dict:
+        """Сводка по полосам: их число, общая и максимальная глубина очередей, размер резерва"""
+        depths = {key: lane.queue.qsize() + len(lane.overflow) for key, lane in self._lanes.items()}
+        return {
+            "lanes": len(depths),
+            "pending": sum(depths.values()),
+            "max_depth": max(depths.values(), default=0),
+            "overflow": self._overflow,
+            "depths": depths,
+        }
+
+    async def close(self) -> None:
+        """Останавливает все полосы, не дожидаясь выполнения оставшихся задач"""
+        tasks = [lane.task for lane in self._lanes.values() if lane.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._lanes.clear()
+        self._overflow = 0
+        self._overflow_free.set()
+
+    async def _run_lane(self, key: str, lane: _Lane) -> None:
+        try:
+            while True:
+                try:
+                    job = await asyncio.wait_for(lane.queue.get(), timeout=self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if lane.queue.empty():
+                        break
+                    continue
+
+                if lane.overflow:
+                    lane.queue.put_nowait(lane.overflow.popleft())
+                    self._overflow -= 1
+                    self._overflow_free.set()
+
+                try:
+                    async with self._semaphore:
+                        await job()
+                except Exception as e:
+                    logger.error(f"Ошибка выполнения задачи для {key}: {e}", exc_info=True)
+                finally:
+                    lane.processed += 1
+                    lane.queue.task_done()
+        finally:
+            # Между проверкой пустой очереди и удалением нет точек переключения,
+            # поэтому submit не может положить задачу в уже завершенную полосу
+            if self._lanes.get(key) is lane:
+                del self._lanes[key]
+            logger.debug(f"Полоса {key} удалена, выполнено задач: {lane.processed}")
@@ -0,0 +1,78 @@
+# bot_whatsapp/utils/metrics.py
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict
+
+
+@dataclass
+class TimingStat:
+    """Накопленная статистика длительностей одной операции"""
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    # Последние замеры для перцентилей
+    samples: Deque[float] = field(default_factory=lambda: deque(maxlen=1024))
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class Metrics:
+    """Внутренние метрики процесса: счетчики и замеры длительности"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.timings: Dict[str, TimingStat] = defaultdict(TimingStat)
+
+    def incr(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def observe(self, name: str, value: float):
+        """Замер длительности в секундах (или другой величины, например размера пакета)"""
+        self.timings[name].observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Замеряет длительность блока: with metrics.timer("db.flush"): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict:
+        return {
+            "counters": dict(self.counters),
+            "timings": {
+                name: {
+                    "count": stat.count,
+                    "total": stat.total,
+                    "avg": stat.total / stat.count if stat.count else 0.0,
+                    "max": stat.max,
+                    "p50": stat.percentile(50),
+                    "p95": stat.percentile(95),
+                    "p99": stat.percentile(99),
+                }
+                for name, stat in self.timings.items()
+            },
+        }
+
+    def reset(self):
+        self.counters.clear()
+        self.timings.clear()
+
+
+# Общий реестр метрик процесса
+metrics = Metrics()
@@ -11,11 +11,112 @@ class Config:
     WHATSAPP_INSTANCE_ID: str
     WHATSAPP_API_TOKEN: str
     OPENAI_API_KEY: str
+    # Адрес OpenAI-совместимого API (пусто - api.openai.com)
+    OPENAI_BASE_URL: str
     MODEL_GPT: str
+    # Резервные модели через запятую: запрос дублируется в следующую, если основная отвечает
+    # дольше LLM_HEDGE_PERCENTILE-го перцентиля своего времени ответа, и передается ей при ошибке
+    MODEL_FALLBACKS: str
+    LLM_HEDGE_PERCENTILE: float
+    LLM_HEDGE_DELAY: float
+    LLM_HEDGE_MIN_DELAY: float
+    LLM_BACKEND_COOLDOWN: float
+    # Быстрая модель для простых ходов (пусто - все ходы отвечает MODEL_GPT). Ход сложный,
+    # если сработало не меньше TIER_MIN_SIGNALS признаков: длина сообщения (символов),
+    # номер хода клиента, число терминов каталога в сообщении, числа вместе с терминами
+    MODEL_FAST: str
+    TIER_LENGTH_THRESHOLD: int
+    TIER_TURN_THRESHOLD: int
+    TIER_KEYWORD_THRESHOLD: int
+    TIER_MIN_SIGNALS: int
+    # Запросы к OpenAI: таймауты (сек), число попыток и задержки между ними,
+    # лимит одновременных запросов на процесс и предохранитель (ошибок подряд / пауза, сек)
+    OPENAI_TIMEOUT: float
+    OPENAI_CONNECT_TIMEOUT: float
+    OPENAI_MAX_ATTEMPTS: int
+    OPENAI_BACKOFF_BASE: float
+    OPENAI_BACKOFF_MAX: float
+    OPENAI_CONCURRENCY: int
+    OPENAI_BREAKER_THRESHOLD: int
+    OPENAI_BREAKER_RESET: float
     TELEGRAM_BOT_TOKEN: str
     ENABLE_WHATSAPP: bool
     ENABLE_TELEGRAM: bool
     ENABLE_INSTAGRAM: bool
+    # Пул обработчиков уведомлений WhatsApp
+    WHATSAPP_WORKERS: int
+    WHATSAPP_QUEUE_SIZE: int
+    WHATSAPP_LANE_SIZE: int
+    WHATSAPP_LANE_IDLE_TIMEOUT: float
+    # Пауза (сек) в сообщениях клиента, после которой отвечает модель (0 - отвечать на каждое),
+    # максимальная задержка ответа от первого сообщения и максимум чатов, ожидающих ответа
+    WHATSAPP_DEBOUNCE_WINDOW: float
+    WHATSAPP_DEBOUNCE_MAX_WAIT: float
+    WHATSAPP_DEBOUNCE_MAX_CHATS: int
+    # Повторы уведомления из входящих, обработка которого завершилась ошибкой:
+    # число попыток до отказа и пауза перед повтором (сек, растет с каждой попыткой)
+    WHATSAPP_INBOX_MAX_ATTEMPTS: int
+    WHATSAPP_INBOX_RETRY_DELAY: float
+    # Способ получения уведомлений: polling (receiveNotification) или webhook
+    WHATSAPP_RECEIVE_MODE: str
+    WEBHOOK_HOST: str
+    WEBHOOK_PORT: int
+    WEBHOOK_PATH: str
+    WEBHOOK_TOKEN: str
+    # Адрес Green API (для нагрузочных тестов - локальная заглушка)
+    GREEN_API_URL: str
+    # Пул HTTP-соединений и таймауты запросов к Green API (сек)
+    GREEN_API_CONNECTION_LIMIT: int
+    GREEN_API_DNS_TTL: int
+    GREEN_API_KEEPALIVE_TIMEOUT: float
+    GREEN_API_RECEIVE_TIMEOUT: float
+    GREEN_API_DELETE_TIMEOUT: float
+    GREEN_API_SEND_TIMEOUT: float
+    # Long-poll ожидание receiveNotification (5-60 сек) и паузы при простое
+    GREEN_API_LONG_POLL_TIMEOUT: int
+    WHATSAPP_POLL_BACKOFF_MIN: float
+    WHATSAPP_POLL_BACKOFF_MAX: float
+    WHATSAPP_POLL_REPORT_INTERVAL: float
+    # Очередь исходящих сообщений: лимит частоты, повторы и размер очереди
+    OUTBOUND_RATE: float
+    OUTBOUND_BURST: int
+    OUTBOUND_QUEUE_SIZE: int
+    OUTBOUND_WORKERS: int
+    OUTBOUND_MAX_ATTEMPTS: int
+    OUTBOUND_BACKOFF_BASE: float
+    OUTBOUND_BACKOFF_MAX: float
+    # Кэш AITraveler: максимум разговоров в памяти и время простоя до вытеснения (сек)
+    TRAVELER_CACHE_SIZE: int
+    TRAVELER_CACHE_TTL: float
+    TRAVELER_CACHE_SWEEP_INTERVAL: float
+    # Отложенная запись контекста: период (сек) и число контекстов для досрочной записи
+    CONTEXT_FLUSH_INTERVAL: float
+    CONTEXT_FLUSH_MAX_PENDING: int
+    # Сколько последних реплик загружать из БД при создании AITraveler
+    HISTORY_LOAD_LIMIT: int
+    # Бюджет токенов на историю в запросе (0 - значение по модели, см. stack/tokens.py)
+    HISTORY_TOKEN_BUDGET: int
+    # Свертка старой части разговора в резюме: порог токенов истории (0 - выключено)
+    # и число последних реплик, которые остаются дословно
+    SUMMARY_TRIGGER_TOKENS: int
+    SUMMARY_KEEP_MESSAGES: int
+    # Кэш ответов на типовые вопросы первых ходов: размер (0 - выключен), время жизни,
+    # порог похожести вопросов и число первых сообщений клиента, для которых он работает
+    ANSWER_CACHE_SIZE: int
+    ANSWER_CACHE_TTL: float
+    ANSWER_CACHE_THRESHOLD: float
+    ANSWER_CACHE_MAX_TURNS: int
+    # Каталог товаров: файл и число записей справки на ход (0 - полный промпт без каталога)
+    CATALOG_PATH: str
+    CATALOG_TOP_K: int
+    # Пакетная запись уведомлений: размер буфера, пакета и период записи (сек)
+    NOTIFICATION_BUFFER_SIZE: int
+    NOTIFICATION_BATCH_SIZE: int
+    NOTIFICATION_FLUSH_INTERVAL: float
+    # Хранение notifications: месяцев в БД, секций вперед, каталог архивов
+    NOTIFICATION_RETENTION_MONTHS: int
+    NOTIFICATION_PARTITIONS_AHEAD: int
+    NOTIFICATION_ARCHIVE_DIR: str
     
 
 
@@ -25,9 +126,81 @@ def load_config() -> Config:
         WHATSAPP_INSTANCE_ID=os.getenv("WHATSAPP_INSTANCE_ID", ""),
         WHATSAPP_API_TOKEN=os.getenv("WHATSAPP_API_TOKEN", ""),
         OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", ""),
+        OPENAI_BASE_URL=os.getenv("OPENAI_BASE_URL", ""),
         MODEL_GPT=os.getenv("MODEL_GPT", ""),
+        MODEL_FALLBACKS=os.getenv("MODEL_FALLBACKS", ""),
+        LLM_HEDGE_PERCENTILE=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+        LLM_HEDGE_DELAY=float(os.getenv("LLM_HEDGE_DELAY", "4")),
+        LLM_HEDGE_MIN_DELAY=float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5")),
+        LLM_BACKEND_COOLDOWN=float(os.getenv("LLM_BACKEND_COOLDOWN", "30")),
+        MODEL_FAST=os.getenv("MODEL_FAST", ""),
+        TIER_LENGTH_THRESHOLD=int(os.getenv("TIER_LENGTH_THRESHOLD", "120")),
+        TIER_TURN_THRESHOLD=int(os.getenv("TIER_TURN_THRESHOLD", "6")),
+        TIER_KEYWORD_THRESHOLD=int(os.getenv("TIER_KEYWORD_THRESHOLD", "3")),
+        TIER_MIN_SIGNALS=int(os.getenv("TIER_MIN_SIGNALS", "1")),
+        OPENAI_TIMEOUT=float(os.getenv("OPENAI_TIMEOUT", "30")),
+        OPENAI_CONNECT_TIMEOUT=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+        OPENAI_MAX_ATTEMPTS=int(os.getenv("OPENAI_MAX_ATTEMPTS", "3")),
+        OPENAI_BACKOFF_BASE=float(os.getenv("OPENAI_BACKOFF_BASE", "0.5")),
+        OPENAI_BACKOFF_MAX=float(os.getenv("OPENAI_BACKOFF_MAX", "8")),
+        OPENAI_CONCURRENCY=int(os.getenv("OPENAI_CONCURRENCY", "20")),
+        OPENAI_BREAKER_THRESHOLD=int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5")),
+        OPENAI_BREAKER_RESET=float(os.getenv("OPENAI_BREAKER_RESET", "30")),
         TELEGRAM_BOT_TOKEN=os.getenv("TELEGRAM_BOT_TOKEN", ""),
         ENABLE_WHATSAPP=os.getenv("ENABLE_WHATSAPP", "false").lower() == "true",
         ENABLE_TELEGRAM=os.getenv("ENABLE_TELEGRAM", "false").lower() == "true",
         ENABLE_INSTAGRAM=os.getenv("ENABLE_INSTAGRAM", "false").lower() == "true",
-    )
\ No newline at end of file
+        WHATSAPP_WORKERS=int(os.getenv("WHATSAPP_WORKERS", "8")),
+        WHATSAPP_QUEUE_SIZE=int(os.getenv("WHATSAPP_QUEUE_SIZE", "100")),
+        WHATSAPP_LANE_SIZE=int(os.getenv("WHATSAPP_LANE_SIZE", "20")),
+        WHATSAPP_LANE_IDLE_TIMEOUT=float(os.getenv("WHATSAPP_LANE_IDLE_TIMEOUT", "60")),
+        WHATSAPP_DEBOUNCE_WINDOW=float(os.getenv("WHATSAPP_DEBOUNCE_WINDOW", "2")),
+        WHATSAPP_DEBOUNCE_MAX_WAIT=float(os.getenv("WHATSAPP_DEBOUNCE_MAX_WAIT", "10")),
+        WHATSAPP_DEBOUNCE_MAX_CHATS=int(os.getenv("WHATSAPP_DEBOUNCE_MAX_CHATS", "100")),
+        WHATSAPP_INBOX_MAX_ATTEMPTS=int(os.getenv("WHATSAPP_INBOX_MAX_ATTEMPTS", "3")),
+        WHATSAPP_INBOX_RETRY_DELAY=float(os.getenv("WHATSAPP_INBOX_RETRY_DELAY", "5")),
+        WHATSAPP_RECEIVE_MODE=os.getenv("WHATSAPP_RECEIVE_MODE", "polling").lower(),
+        WEBHOOK_HOST=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        WEBHOOK_PORT=int(os.getenv("WEBHOOK_PORT", "8080")),
+        WEBHOOK_PATH=os.getenv("WEBHOOK_PATH", "/webhook"),
+        WEBHOOK_TOKEN=os.getenv("WEBHOOK_TOKEN", ""),
+        GREEN_API_URL=os.getenv("GREEN_API_URL", "https://api.green-api.com"),
+        GREEN_API_CONNECTION_LIMIT=int(os.getenv("GREEN_API_CONNECTION_LIMIT", "20")),
+        GREEN_API_DNS_TTL=int(os.getenv("GREEN_API_DNS_TTL", "300")),
+        GREEN_API_KEEPALIVE_TIMEOUT=float(os.getenv("GREEN_API_KEEPALIVE_TIMEOUT", "30")),
+        GREEN_API_RECEIVE_TIMEOUT=float(os.getenv("GREEN_API_RECEIVE_TIMEOUT", "10")),
+        GREEN_API_DELETE_TIMEOUT=float(os.getenv("GREEN_API_DELETE_TIMEOUT", "10")),
+        GREEN_API_SEND_TIMEOUT=float(os.getenv("GREEN_API_SEND_TIMEOUT", "15")),
+        GREEN_API_LONG_POLL_TIMEOUT=int(os.getenv("GREEN_API_LONG_POLL_TIMEOUT", "20")),
+        WHATSAPP_POLL_BACKOFF_MIN=float(os.getenv("WHATSAPP_POLL_BACKOFF_MIN", "0.5")),
+        WHATSAPP_POLL_BACKOFF_MAX=float(os.getenv("WHATSAPP_POLL_BACKOFF_MAX", "10")),
+        WHATSAPP_POLL_REPORT_INTERVAL=float(os.getenv("WHATSAPP_POLL_REPORT_INTERVAL", "60")),
+        OUTBOUND_RATE=float(os.getenv("OUTBOUND_RATE", "5")),
+        OUTBOUND_BURST=int(os.getenv("OUTBOUND_BURST", "10")),
+        OUTBOUND_QUEUE_SIZE=int(os.getenv("OUTBOUND_QUEUE_SIZE", "500")),
+        OUTBOUND_WORKERS=int(os.getenv("OUTBOUND_WORKERS", "4")),
+        OUTBOUND_MAX_ATTEMPTS=int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "5")),
+        OUTBOUND_BACKOFF_BASE=float(os.getenv("OUTBOUND_BACKOFF_BASE", "1")),
+        OUTBOUND_BACKOFF_MAX=float(os.getenv("OUTBOUND_BACKOFF_MAX", "60")),
+        TRAVELER_CACHE_SIZE=int(os.getenv("TRAVELER_CACHE_SIZE", "1000")),
+        TRAVELER_CACHE_TTL=float(os.getenv("TRAVELER_CACHE_TTL", "1800")),
+        TRAVELER_CACHE_SWEEP_INTERVAL=float(os.getenv("TRAVELER_CACHE_SWEEP_INTERVAL", "60")),
+        CONTEXT_FLUSH_INTERVAL=float(os.getenv("CONTEXT_FLUSH_INTERVAL", "2")),
+        CONTEXT_FLUSH_MAX_PENDING=int(os.getenv("CONTEXT_FLUSH_MAX_PENDING", "100")),
+        HISTORY_LOAD_LIMIT=int(os.getenv("HISTORY_LOAD_LIMIT", "50")),
+        HISTORY_TOKEN_BUDGET=int(os.getenv("HISTORY_TOKEN_BUDGET", "0")),
+        SUMMARY_TRIGGER_TOKENS=int(os.getenv("SUMMARY_TRIGGER_TOKENS", "1500")),
+        SUMMARY_KEEP_MESSAGES=int(os.getenv("SUMMARY_KEEP_MESSAGES", "6")),
+        ANSWER_CACHE_SIZE=int(os.getenv("ANSWER_CACHE_SIZE", "500")),
+        ANSWER_CACHE_TTL=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+        ANSWER_CACHE_THRESHOLD=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.85")),
+        ANSWER_CACHE_MAX_TURNS=int(os.getenv("ANSWER_CACHE_MAX_TURNS", "1")),
+        CATALOG_PATH=os.getenv("CATALOG_PATH", "data/catalog.json"),
+        CATALOG_TOP_K=int(os.getenv("CATALOG_TOP_K", "4")),
+        NOTIFICATION_BUFFER_SIZE=int(os.getenv("NOTIFICATION_BUFFER_SIZE", "1000")),
+        NOTIFICATION_BATCH_SIZE=int(os.getenv("NOTIFICATION_BATCH_SIZE", "100")),
+        NOTIFICATION_FLUSH_INTERVAL=float(os.getenv("NOTIFICATION_FLUSH_INTERVAL", "1")),
+        NOTIFICATION_RETENTION_MONTHS=int(os.getenv("NOTIFICATION_RETENTION_MONTHS", "6")),
+        NOTIFICATION_PARTITIONS_AHEAD=int(os.getenv("NOTIFICATION_PARTITIONS_AHEAD", "2")),
+        NOTIFICATION_ARCHIVE_DIR=os.getenv("NOTIFICATION_ARCHIVE_DIR", "archive/notifications"),
+    )
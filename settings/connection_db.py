@@ -13,7 +13,8 @@ DB_PORT = os.getenv('DB_PORT', '5432')
 DB_NAME = os.getenv('DB_NAME')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
-urllib.parse.quote_plus(DB_PASSWORD)
+# Без DB_PASSWORD модули с БД импортируются (например, в бенчмарках без БД), подключение упадет позже
+urllib.parse.quote_plus(DB_PASSWORD or '')
 
 DATABASE_URL = (
     f'postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
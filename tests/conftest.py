@@ -0,0 +1,24 @@
+# tests/conftest.py
+import asyncio
+import pytest
+
+
+@pytest.fixture
+def run():
+    """Выполняет корутину в новом цикле событий: run(lambda: coro())"""
+    def run(factory):
+        return asyncio.run(factory())
+    return run
+
+
+def incoming(sender: str, text: str, receipt_id: int = 0) -> dict:
+    """Уведомление о входящем текстовом сообщении в формате receiveNotification"""
+    return {
+        "receiptId": receipt_id,
+        "body": {
+            "typeWebhook": "incomingMessageReceived",
+            "timestamp": 1700000000,
+            "senderData": {"chatId": sender, "sender": sender, "senderName": "Клиент"},
+            "messageData": {"typeMessage": "textMessage", "textMessageData": {"textMessage": text}},
+        },
+    }
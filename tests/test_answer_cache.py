@@ -0,0 +1,88 @@
+# tests/test_answer_cache.py
+import time
+from bots.bot_whatsapp.stack.answer_cache import AnswerCache, normalize_question
+
+
+PROMPT = "Вы - консультант магазина дверей."
+DELIVERY = "Сколько стоит доставка двери по городу?"
+# Опечатка в последней букве: нормализованный текст другой, n-граммы почти те же
+DELIVERY_TYPO = "сколько стоит доставка двери по городк"
+PICKUP = "Где находится пункт самовывоза?"
+ANSWER = "Доставка по городу - 3000 тенге."
+
+
+def filled(**kwargs) -> AnswerCache:
+    cache = AnswerCache(**kwargs)
+    cache.put(DELIVERY, PROMPT, ANSWER, "strong")
+    cache.put(PICKUP, PROMPT, "Самовывоз со склада на Райымбека.", "strong")
+    cache.put("Есть ли двери шириной 90 см в наличии?", PROMPT, "Да, есть.", "strong")
+    return cache
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = filled()
+    assert cache.get("сколько СТОИТ доставка двери, по городу!", PROMPT, "strong") == ANSWER
+    assert cache.stats()["hits"] == 1
+
+
+def test_similar_hit():
+    cache = filled()
+    assert cache.get(DELIVERY_TYPO, PROMPT, "strong") == ANSWER
+    assert cache.stats()["similar_hits"] == 1
+
+
+def test_different_question_misses():
+    cache = filled()
+    assert cache.get("Какие бренды входных дверей у вас есть?", PROMPT, "strong") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_tiers_are_separate():
+    cache = filled()
+    assert cache.get(DELIVERY, PROMPT, "fast") is None
+    assert cache.get(DELIVERY_TYPO, PROMPT, "fast") is None
+
+
+def test_short_question_exact_only():
+    cache = AnswerCache()
+    cache.put("да", PROMPT, "Отлично!", "fast")
+    assert cache.get("да", PROMPT, "fast") == "Отлично!"
+    assert cache.get("дай", PROMPT, "fast") is None
+
+
+def test_expired_entries_are_not_returned():
+    cache = filled(ttl=0.05)
+    time.sleep(0.1)
+    assert cache.get(DELIVERY, PROMPT, "strong") is None
+    assert cache.get(DELIVERY_TYPO, PROMPT, "strong") is None
+    assert len(cache) == 2
+    assert cache._frequency(" ск") == 0
+
+
+def test_prompt_change_clears_cache():
+    cache = filled()
+    assert cache.get(DELIVERY, PROMPT + " Новые цены.", "strong") is None
+    assert len(cache) == 0
+    assert not cache._postings
+    assert cache.get(DELIVERY, PROMPT, "strong") is None
+
+
+def test_lru_eviction_updates_index():
+    cache = AnswerCache(max_size=2)
+    cache.put(DELIVERY, PROMPT, ANSWER, "strong")
+    cache.put(PICKUP, PROMPT, "Самовывоз", "strong")
+    assert cache.get(DELIVERY, PROMPT, "strong") == ANSWER
+    cache.put("Есть ли двери шириной 90 см в наличии?", PROMPT, "Да", "strong")
+    assert cache.get(PICKUP, PROMPT, "strong") is None
+    assert cache.get(DELIVERY_TYPO, PROMPT, "strong") == ANSWER
+    assert all(key[1] != normalize_question(PICKUP) for postings in cache._postings.values() for key in postings)
+
+
+def test_index_matches_entries_after_updates():
+    cache = AnswerCache(max_size=20)
+    for index in range(50):
+        cache.put(f"Вопрос номер {index} про двери", PROMPT, f"Ответ {index}", "strong")
+    indexed = {key for postings in cache._postings.values() for key in postings}
+    assert indexed == set(cache._entries)
+    assert len(cache) == 20
+    assert cache.get("Вопрос номер 49 про двери?", PROMPT, "strong") == "Ответ 49"
@@ -0,0 +1,148 @@
+# tests/test_debounce.py
+import asyncio
+import pytest
+from conftest import incoming
+
+
+WORKERS = 2
+MAX_CHATS = 3
+
+
+class MemoryInbox:
+    """Входящие в памяти вместо таблицы notification_inbox"""
+
+    def __init__(self):
+        self.rows = {}
+        self.done_ids = []
+
+    async def save(self, notification):
+        inbox_id = len(self.rows) + len(self.done_ids) + 1
+        self.rows[inbox_id] = notification
+        return inbox_id
+
+    async def done(self, inbox_id):
+        self.rows.pop(inbox_id, None)
+        self.done_ids.append(inbox_id)
+
+    async def fail(self, inbox_id):
+        return 1
+
+    async def pending(self):
+        return []
+
+
+class Generation:
+    """Генерация ответа с подсчетом одновременных вызовов и чатов, ожидающих ответа"""
+
+    def __init__(self, debouncer, delay: float = 0.02):
+        self.debouncer = debouncer
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.max_chats = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.sent = []
+
+    async def generate(self, chat_id, text):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self.max_chats = max(self.max_chats, len(self.debouncer._buffers))
+        try:
+            await self.gate.wait()
+            await asyncio.sleep(self.delay)
+            return text
+        finally:
+            self.active -= 1
+
+    async def send(self, chat_id, reply):
+        self.sent.append((chat_id, reply))
+
+
+@pytest.fixture
+def make_bot(monkeypatch):
+    monkeypatch.setenv("WHATSAPP_WORKERS", str(WORKERS))
+    monkeypatch.setenv("WHATSAPP_DEBOUNCE_WINDOW", "0.03")
+    monkeypatch.setenv("WHATSAPP_DEBOUNCE_MAX_WAIT", "1")
+    monkeypatch.setenv("WHATSAPP_DEBOUNCE_MAX_CHATS", str(MAX_CHATS))
+
+    def make_bot():
+        from bots.bot_whatsapp.controller.whatsapp_bot import WhatsAppBot
+
+        bot = WhatsAppBot("instance", "token")
+        bot.inbox = MemoryInbox()
+        debouncer = bot.webhook_handler.debouncer
+        generation = Generation(debouncer)
+        debouncer.generate = generation.generate
+        debouncer.send = generation.send
+        return bot, generation
+    return make_bot
+
+
+async def put(bot, sender, text):
+    notification = incoming(sender, text)
+    await bot.queue.put((notification, await bot.inbox.save(notification)))
+
+
+async def until(condition, timeout: float = 5.0):
+    async def wait():
+        while not condition():
+            await asyncio.sleep(0.005)
+    await asyncio.wait_for(wait(), timeout)
+
+
+def test_order_and_limits_with_debounce(run, make_bot):
+    """Ответы каждого чата идут по порядку, генераций не больше WORKERS, чатов - не больше MAX_CHATS"""
+    chats = [f"7700000000{index}@c.us" for index in range(6)]
+    rounds = 3
+
+    async def scenario():
+        bot, generation = make_bot()
+        bot.dispatcher = asyncio.create_task(bot._dispatch_loop())
+        for turn in range(rounds):
+            for chat in chats:
+                await put(bot, chat, f"{chat} #{turn}")
+            # Пауза дольше окна: следующее сообщение чата чаще всего попадает в новый ход
+            await asyncio.sleep(0.04)
+        await until(lambda: len(bot.inbox.done_ids) == len(chats) * rounds)
+        bot.dispatcher.cancel()
+        await bot.scheduler.close()
+        return generation, bot
+
+    generation, bot = run(scenario)
+    assert generation.max_active <= WORKERS
+    assert generation.max_chats <= MAX_CHATS
+    assert not bot.inbox.rows
+    for chat in chats:
+        answered = [line for sent_to, reply in generation.sent if sent_to == chat for line in reply.split("\n")]
+        assert answered == [f"{chat} #{turn}" for turn in range(rounds)]
+
+
+def test_slow_generation_holds_back_intake(run, make_bot):
+    """Пока генерация стоит, новые чаты не забираются из очереди, а входящие не удаляются"""
+    chats = [f"7700000001{index}@c.us" for index in range(6)]
+
+    async def scenario():
+        bot, generation = make_bot()
+        generation.gate.clear()
+        bot.dispatcher = asyncio.create_task(bot._dispatch_loop())
+        for chat in chats:
+            await put(bot, chat, f"{chat} вопрос")
+        await asyncio.sleep(0.2)
+        blocked = {
+            "chats": len(bot.webhook_handler.debouncer._buffers),
+            "active": generation.active,
+            # Одно уведомление уже взято распределением и ждет места
+            "queued": bot.queue.qsize(),
+            "done": len(bot.inbox.done_ids),
+        }
+        generation.gate.set()
+        await until(lambda: len(bot.inbox.done_ids) == len(chats))
+        bot.dispatcher.cancel()
+        await bot.scheduler.close()
+        return blocked, generation
+
+    blocked, generation = run(scenario)
+    assert blocked == {"chats": MAX_CHATS, "active": WORKERS, "queued": len(chats) - MAX_CHATS - 1, "done": 0}
+    assert generation.max_active <= WORKERS
+    assert sorted(chat for chat, _ in generation.sent) == sorted(chats)
@@ -0,0 +1,93 @@
+# tests/test_model_router.py
+import asyncio
+import time
+import pytest
+from bots.bot_whatsapp.stack.base_ai import AIError
+from bots.bot_whatsapp.stack.model_router import Backend, ModelRouter
+from bots.bot_whatsapp.stack.stub_ai import StubAI
+
+
+MESSAGES = [{"role": "user", "content": "Сколько стоит доставка?"}]
+
+
+def backend(name: str, delay: float = 0.0, fail_rate: float = 0.0, priority: int = 0) -> Backend:
+    return Backend(name=name, model=StubAI(name, delay=delay, fail_rate=fail_rate), priority=priority)
+
+
+def names(router: ModelRouter) -> list:
+    return [item.name for item in router.ordered()]
+
+
+def test_ordered_by_ewma_within_priority():
+    slow, fast, reserve = backend("slow"), backend("fast"), backend("reserve", priority=1)
+    router = ModelRouter([slow, fast, reserve])
+    slow.observe(2.0, router.ewma_alpha)
+    fast.observe(0.5, router.ewma_alpha)
+    reserve.observe(0.1, router.ewma_alpha)
+    assert names(router) == ["fast", "slow", "reserve"]
+
+
+def test_unmeasured_backend_goes_first():
+    primary, fallback = backend("primary"), backend("fallback")
+    router = ModelRouter([primary, fallback])
+    assert names(router) == ["primary", "fallback"]
+    primary.observe(1.0, router.ewma_alpha)
+    assert names(router) == ["fallback", "primary"]
+
+
+def test_cooling_backend_goes_last():
+    primary, fallback = backend("primary"), backend("fallback")
+    router = ModelRouter([primary, fallback], cooldown=30)
+    primary.observe(0.1, router.ewma_alpha)
+    fallback.observe(1.0, router.ewma_alpha)
+    primary.failures, primary.failed_at = 1, time.monotonic()
+    assert names(router) == ["fallback", "primary"]
+    primary.failed_at -= 31
+    assert names(router) == ["primary", "fallback"]
+
+
+def test_hedge_wins_and_loser_is_observed(run):
+    primary, fallback = backend("primary", delay=0.5), backend("fallback", delay=0.01)
+    router = ModelRouter([primary, fallback], hedge_delay=0.05, hedge_min_delay=0.01)
+
+    reply = run(lambda: router.process_conversation(MESSAGES))
+
+    assert reply.startswith("[fallback]")
+    assert (primary.model.calls, fallback.model.calls) == (1, 1)
+    assert (primary.wins, fallback.wins) == (0, 1)
+    # Отмененный основной запрос попал в замеры временем до отмены
+    assert len(primary.samples) == 1
+    assert primary.samples[0] >= 0.05
+    assert primary.failures == 0
+
+
+def test_no_hedge_when_fast(run):
+    primary, fallback = backend("primary", delay=0.01), backend("fallback")
+    router = ModelRouter([primary, fallback], hedge_delay=0.5)
+
+    reply = run(lambda: router.process_conversation(MESSAGES))
+
+    assert reply.startswith("[primary]")
+    assert fallback.model.calls == 0
+
+
+def test_failover_and_cooldown(run):
+    primary, fallback = backend("primary", fail_rate=1.0), backend("fallback")
+    router = ModelRouter([primary, fallback], hedge_percentile=0)
+
+    async def twice():
+        return [await router.process_conversation(MESSAGES) for _ in range(2)]
+
+    replies = run(twice)
+
+    assert all(reply.startswith("[fallback]") for reply in replies)
+    # После ошибки основная модель идет последней и во второй раз не вызывается
+    assert primary.model.calls == 1
+    assert fallback.model.calls == 2
+    assert names(router) == ["fallback", "primary"]
+
+
+def test_all_failed(run):
+    router = ModelRouter([backend("a", fail_rate=1.0), backend("b", fail_rate=1.0)], hedge_percentile=0)
+    with pytest.raises(AIError):
+        run(lambda: router.process_conversation(MESSAGES))
@@ -0,0 +1,32 @@
+# tests/test_rules.py
+from bots.bot_whatsapp.stack.rules import RuleEngine
+from bots.bot_whatsapp.utils.extract_message import extract_message_text
+
+
+def test_image_and_media_get_canned_reply():
+    rules = RuleEngine()
+    assert rules.reply("imageMessage", "") is not None
+    assert rules.reply("videoMessage", "") is not None
+    assert rules.reply("documentMessage", "") is not None
+
+
+def test_text_and_replies_go_to_model():
+    rules = RuleEngine()
+    for message_type in ("textMessage", "extendedTextMessage", "quotedMessage", "someNewMessage"):
+        assert rules.reply(message_type, "Сколько стоит доставка?") is None
+
+
+def test_reactions_are_ignored():
+    rules = RuleEngine()
+    assert rules.ignores("reactionMessage")
+    assert rules.reply("reactionMessage", "") is None
+    assert not rules.ignores("textMessage")
+
+
+def test_quoted_reply_text():
+    message_data = {
+        "typeMessage": "quotedMessage",
+        "extendedTextMessageData": {"text": "Да, подходит", "stanzaId": "BAE5"},
+        "quotedMessage": {"typeMessage": "textMessage", "textMessage": "Вам подойдет дверь 90 см?"},
+    }
+    assert extract_message_text(message_data) == "Да, подходит"
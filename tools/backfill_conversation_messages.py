@@ -0,0 +1,82 @@
+# tools/backfill_conversation_messages.py
+"""
+Перенос истории из conversation_contexts (JSONB) в conversation_messages.
+
+    python -m tools.backfill_conversation_messages [--batch-size 200] [--dry-run]
+
+Чаты, у которых в conversation_messages уже есть реплики, пропускаются,
+поэтому скрипт можно запускать повторно.
+"""
+import argparse
+import asyncio
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from settings.connection_db import async_session, engine
+from bots.bot_whatsapp.db.models import ConversationContext, ConversationMessage
+
+
+async def backfill(batch_size: int, dry_run: bool):
+    last_phone = ""
+    chats = messages = skipped = 0
+    while True:
+        async with async_session() as session:
+            # Постраничный обход по первичному ключу, без OFFSET
+            stmt = (
+                select(ConversationContext)
+                .where(ConversationContext.phone_number > last_phone)
+                .order_by(ConversationContext.phone_number)
+                .limit(batch_size)
+            )
+            contexts = (await session.execute(stmt)).scalars().all()
+            if not contexts:
+                break
+            last_phone = contexts[-1].phone_number
+
+            phones = [context.phone_number for context in contexts]
+            migrated = set((await session.execute(
+                select(ConversationMessage.chat_id)
+                .where(ConversationMessage.chat_id.in_(phones))
+                .group_by(ConversationMessage.chat_id)
+            )).scalars().all())
+
+            rows = []
+            for context in contexts:
+                history = context.conversation_history
+                if context.phone_number in migrated or not history:
+                    skipped += 1
+                    continue
+                chats += 1
+                rows += [
+                    {
+                        "chat_id": context.phone_number,
+                        "seq": seq,
+                        "role": item.get("role", "user"),
+                        "content": item.get("content") or "",
+                        "token_count": None,
+                        "created_at": context.updated_at or func.now(),
+                    }
+                    for seq, item in enumerate(history)
+                ]
+
+            messages += len(rows)
+            if rows and not dry_run:
+                stmt = insert(ConversationMessage).values(rows)
+                await session.execute(stmt.on_conflict_do_nothing(index_elements=["chat_id", "seq"]))
+                await session.commit()
+            print(f"Обработано до {last_phone}: перенесено чатов {chats}, реплик {messages}, пропущено {skipped}")
+
+    await engine.dispose()
+    suffix = " (пробный запуск, данные не записаны)" if dry_run else ""
+    print(f"Готово: чатов {chats}, реплик {messages}, пропущено {skipped}{suffix}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос истории разговоров в conversation_messages")
+    parser.add_argument("--batch-size", type=int, default=200, help="Сколько контекстов обрабатывать за раз")
+    parser.add_argument("--dry-run", action="store_true", help="Только посчитать, ничего не записывать")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
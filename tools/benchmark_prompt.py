@@ -0,0 +1,103 @@
+# tools/benchmark_prompt.py
+"""
+Сравнение полного системного промпта и короткого промпта со справкой из каталога.
+
+    python -m tools.benchmark_prompt [tools/samples/questions.txt] [--top-k 4] [--live]
+
+Для каждого вопроса считает токены запроса в обоих режимах и время поиска по каталогу.
+С --live дополнительно отправляет оба запроса в модель (нужен OPENAI_API_KEY) и
+сравнивает время ответа.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from settings.config import load_config
+from bots.bot_whatsapp.stack.catalog import Catalog
+from bots.bot_whatsapp.stack.prompts import CORE_PROMPTS, SYSTEM_PROMPTS
+from bots.bot_whatsapp.stack.tokens import prompt_tokens
+
+
+def load_questions(path: str) -> list:
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def build_requests(question: str, catalog: Catalog, top_k: int) -> tuple:
+    """Сообщения для модели в текущем режиме (полный промпт) и в режиме каталога"""
+    full = [
+        {"role": "system", "content": SYSTEM_PROMPTS["default"]},
+        {"role": "user", "content": question},
+    ]
+    started = time.perf_counter()
+    reference = catalog.reference(question, top_k)
+    search_ms = (time.perf_counter() - started) * 1000
+    core = [{"role": "system", "content": CORE_PROMPTS["default"]}]
+    if reference:
+        core.append({"role": "system", "content": reference})
+    core.append({"role": "user", "content": question})
+    return full, core, search_ms
+
+
+async def measure_latency(ai_model, messages: list) -> float:
+    started = time.perf_counter()
+    await ai_model.process_conversation(messages)
+    return time.perf_counter() - started
+
+
+async def run(questions: list, catalog: Catalog, top_k: int, model: str, live: bool):
+    ai_model = None
+    if live:
+        from bots.bot_whatsapp.stack.chatgpt_ai import ChatGPTAI, close_client
+        ai_model = ChatGPTAI(model)
+
+    rows = []
+    for question in questions:
+        full, core, search_ms = build_requests(question, catalog, top_k)
+        row = {
+            "question": question,
+            "full_tokens": prompt_tokens(full, model),
+            "core_tokens": prompt_tokens(core, model),
+            "search_ms": search_ms,
+        }
+        if live:
+            row["full_s"] = await measure_latency(ai_model, full)
+            row["core_s"] = await measure_latency(ai_model, core)
+        rows.append(row)
+        line = (f"{row['full_tokens']:>6} -> {row['core_tokens']:>5} токенов, "
+                f"поиск {row['search_ms']:.2f} мс")
+        if live:
+            line += f", ответ {row['full_s']:.2f} -> {row['core_s']:.2f} сек"
+        print(f"{line} | {question}")
+
+    full_tokens = statistics.mean(row["full_tokens"] for row in rows)
+    core_tokens = statistics.mean(row["core_tokens"] for row in rows)
+    print(f"\nВопросов: {len(rows)}, модель {model}, top-k {top_k}")
+    print(f"Токенов запроса в среднем: {full_tokens:.0f} -> {core_tokens:.0f} "
+          f"({1 - core_tokens / full_tokens:.0%} меньше)")
+    print(f"Поиск по каталогу: в среднем {statistics.mean(row['search_ms'] for row in rows):.2f} мс, "
+          f"максимум {max(row['search_ms'] for row in rows):.2f} мс")
+    if live:
+        full_s = statistics.median(row["full_s"] for row in rows)
+        core_s = statistics.median(row["core_s"] for row in rows)
+        print(f"Медиана времени ответа: {full_s:.2f} -> {core_s:.2f} сек")
+        await close_client()
+
+
+def main():
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Токены и задержка: полный промпт против справки из каталога")
+    parser.add_argument("questions", nargs="?", default="tools/samples/questions.txt",
+                        help="Файл с вопросами, по одному на строку")
+    parser.add_argument("--catalog", default=config.CATALOG_PATH, help="Файл каталога")
+    parser.add_argument("--top-k", type=int, default=config.CATALOG_TOP_K or 4,
+                        help="Сколько записей каталога передавать модели")
+    parser.add_argument("--model", default=config.MODEL_GPT or "gpt-4o-mini", help="Модель для подсчета токенов")
+    parser.add_argument("--live", action="store_true", help="Отправить запросы в модель и замерить время ответа")
+    args = parser.parse_args()
+    catalog = Catalog.load(args.catalog)
+    asyncio.run(run(load_questions(args.questions), catalog, args.top_k, args.model, args.live))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# tools/loadtest.py
+"""
+Нагрузочный тест бота без WhatsApp и OpenAI.
+
+    python -m tools.loadtest [--chats 50] [--messages 5] [--rate 20] [--llm-latency lognormal:0.8,0.4]
+
+Поднимает заглушки Green API и OpenAI (tools.standins), запускает WhatsAppBot в режиме
+опроса против них и локальной БД (DB_* из окружения, таблицы создаются через
+alembic upgrade head), подает --chats x --messages сообщений с частотой --rate в секунду
+и ждет ответов на все или --timeout секунд.
+
+Итог: сообщений в секунду, p50/p95/p99 времени до отправки ответа - от получения
+сообщения ботом и от постановки сообщения в очередь заглушки (с ожиданием в очереди
+Green API), доли времени БД и запросов к модели от суммарного времени ответов.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import time
+from typing import Awaitable, Callable
+from tools.standins import StandIns, parse_distribution, start_standins
+
+
+DEFAULT_QUESTIONS = "tools/samples/questions.txt"
+
+# Таймеры метрик, которые относятся к БД и к модели
+DB_TIMERS = ("db.context_load", "db.context_flush", "db.notification_flush", "db.inbox_save", "db.inbox_done", "db.inbox_fail")
+LLM_TIMERS = ("llm.request",)
+
+
+def configure_environment(host: str, port: int):
+    """
+    Направляет бота на заглушки. Адреса и ключи перезаписываются всегда, чтобы тест
+    не ушел в настоящие Green API и OpenAI из-за значений в .env
+    """
+    base = f"http://{host}:{port}"
+    os.environ["GREEN_API_URL"] = base
+    os.environ["OPENAI_BASE_URL"] = f"{base}/v1"
+    os.environ["OPENAI_API_KEY"] = "loadtest"
+    os.environ["WHATSAPP_INSTANCE_ID"] = "1101000001"
+    os.environ["WHATSAPP_API_TOKEN"] = "loadtest"
+    os.environ["WHATSAPP_RECEIVE_MODE"] = "polling"
+    os.environ.setdefault("GREEN_API_LONG_POLL_TIMEOUT", "5")
+
+
+def load_questions(path: str) -> list:
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()] or ["Здравствуйте"]
+
+
+async def inject(standins: StandIns, chats: int, messages: int, rate: float, questions: list):
+    """Подает сообщения по кругу между чатами с частотой rate в секунду"""
+    texts = itertools.cycle(questions)
+    interval = 1 / rate if rate > 0 else 0.0
+    started = time.perf_counter()
+    for index in range(chats * messages):
+        chat_id = f"7700{index % chats:07d}@c.us"
+        standins.inject(chat_id, next(texts))
+        delay = started + (index + 1) * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def timers_total(snapshot: dict, names: tuple) -> float:
+    timings = snapshot["timings"]
+    return sum(timings[name]["total"] for name in names if name in timings)
+
+
+async def drive_bot(args, feed: Callable[[StandIns], Awaitable]) -> dict:
+    """
+    Запускает WhatsAppBot против заглушек, подает трафик через feed и ждет ответов
+    на все входящие сообщения или args.timeout секунд после подачи
+    """
+    # Модули бота импортируются после настройки окружения
+    from settings.config import load_config
+    from bots.bot_whatsapp.controller.whatsapp_bot import WhatsAppBot
+    from bots.bot_whatsapp.utils.metrics import metrics
+
+    standins = StandIns(
+        parse_distribution(args.green_latency, args.seed),
+        parse_distribution(args.llm_latency, args.seed),
+    )
+    runner = await start_standins(standins, args.host, args.port)
+    config = load_config()
+    metrics.reset()
+
+    bot = WhatsAppBot(config.WHATSAPP_INSTANCE_ID, config.WHATSAPP_API_TOKEN)
+    bot_task = asyncio.create_task(bot.start())
+    try:
+        await feed(standins)
+        deadline = time.monotonic() + args.timeout
+        while not standins.idle and time.monotonic() < deadline:
+            if bot_task.done():
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        # Остановка бота: очереди обработки и записи в БД дорабатывают в его finally
+        bot_task.cancel()
+        await asyncio.gather(bot_task, return_exceptions=True)
+        await runner.cleanup()
+
+    if bot_task.done() and not bot_task.cancelled() and bot_task.exception():
+        raise bot_task.exception()
+
+    latencies = standins.reply_latencies
+    inject_latencies = standins.inject_latencies
+    snapshot = metrics.snapshot()
+    elapsed = standins.last_reply - standins.first_delivery if standins.last_reply else 0.0
+    return {
+        "delivered": standins.delivered,
+        "incoming": standins.incoming,
+        "replied": len(latencies),
+        "merged": standins.merged,
+        "unanswered": standins.pending_replies + len(standins.notifications),
+        "sent": standins.sent,
+        "completions": standins.completions,
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "inject_p50": percentile(inject_latencies, 50),
+        "inject_p95": percentile(inject_latencies, 95),
+        "inject_p99": percentile(inject_latencies, 99),
+        "inject_mean": statistics.fmean(inject_latencies) if inject_latencies else 0.0,
+        "db_time": timers_total(snapshot, DB_TIMERS),
+        "llm_time": timers_total(snapshot, LLM_TIMERS),
+        "reply_total": sum(latencies),
+    }
+
+
+def share(part: float, total: float) -> str:
+    return f"{part / total:.1%}" if total else "н/д"
+
+
+def print_report(result: dict):
+    reply_total = result["reply_total"]
+    print(f"Уведомлений: {result['delivered']}, входящих сообщений: {result['incoming']}, "
+          f"с ответом: {result['replied']}, без ответа: {result['unanswered']}")
+    print(f"Отправлено ответов: {result['sent']}, запросов к модели: {result['completions']}, "
+          f"сообщений объединено с предыдущими: {result['merged']}")
+    print(f"Пропускная способность: {result['throughput']:.2f} сообщений/сек за {result['elapsed']:.1f} сек")
+    print(f"Время ответа от получения ботом, сек: p50 {result['p50']:.3f}, p95 {result['p95']:.3f}, "
+          f"p99 {result['p99']:.3f}, среднее {result['mean']:.3f}")
+    print(f"Время ответа от постановки в очередь, сек: p50 {result['inject_p50']:.3f}, "
+          f"p95 {result['inject_p95']:.3f}, p99 {result['inject_p99']:.3f}, среднее {result['inject_mean']:.3f}")
+    print(f"БД: {result['db_time']:.2f} сек ({share(result['db_time'], reply_total)} от суммарного времени ответов)")
+    print(f"Модель: {result['llm_time']:.2f} сек ({share(result['llm_time'], reply_total)} от суммарного времени ответов)")
+
+
+def add_standin_arguments(parser: argparse.ArgumentParser):
+    """Параметры заглушек и ожидания, общие для нагрузочного теста и воспроизведения трафика"""
+    parser.add_argument("--timeout", type=float, default=120.0, help="Сколько ждать ответов после подачи, секунды")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900, help="Порт заглушек")
+    parser.add_argument("--green-latency", default="const:0.02", help="Задержка ответов Green API")
+    parser.add_argument("--llm-latency", default="lognormal:0.8,0.4", help="Задержка chat completions")
+    parser.add_argument("--seed", type=int, default=None, help="Зерно генератора задержек")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на заглушках Green API и OpenAI")
+    parser.add_argument("--chats", type=int, default=50, help="Число чатов")
+    parser.add_argument("--messages", type=int, default=5, help="Сообщений в каждом чате")
+    parser.add_argument("--rate", type=float, default=20.0, help="Входящих сообщений в секунду (0 - все сразу)")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="Файл с текстами сообщений")
+    add_standin_arguments(parser)
+    args = parser.parse_args()
+
+    configure_environment(args.host, args.port)
+    # Повторяющиеся вопросы не должны отвечаться из кэша, а каждое сообщение - получать ответ
+    os.environ.setdefault("ANSWER_CACHE_SIZE", "0")
+    os.environ.setdefault("WHATSAPP_DEBOUNCE_WINDOW", "0")
+    questions = load_questions(args.questions)
+
+    async def feed(standins: StandIns):
+        await inject(standins, args.chats, args.messages, args.rate, questions)
+
+    print_report(asyncio.run(drive_bot(args, feed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# tools/notifications_retention.py
+"""
+Обслуживание помесячных секций notifications.
+
+    python -m tools.notifications_retention [--keep-months 6] [--archive-dir archive/notifications] [--dry-run]
+
+1. Создает секции на текущий и NOTIFICATION_PARTITIONS_AHEAD следующих месяцев.
+   Строки этих месяцев, уже попавшие в секцию DEFAULT, переносятся в новую секцию.
+2. Секции старше keep-months выгружает в CSV.gz через COPY (потоком, без загрузки
+   в память), затем отсоединяет от notifications и удаляет. Секция отсоединяется только
+   после успешной выгрузки: при ошибке архивирования она остается на месте и будет
+   обработана следующим запуском. Отсоединенные, но не удаленные секции (например,
+   после сбоя между DETACH и DROP) тоже выгружаются и удаляются.
+
+Отсоединение без секции DEFAULT идет через DETACH PARTITION ... CONCURRENTLY и не
+блокирует запись. PostgreSQL не разрешает CONCURRENTLY при наличии секции DEFAULT,
+поэтому с ней используется обычный DETACH с коротким lock_timeout и повторами:
+эксклюзивная блокировка берется на мгновение и не выстраивает очередь из записей
+за долгими транзакциями.
+
+Запускать по расписанию, например раз в сутки через cron.
+"""
+import argparse
+import asyncio
+import gzip
+import os
+from datetime import date, datetime
+import asyncpg
+from settings.config import load_config
+from settings.connection_db import DATABASE_URL
+from bots.bot_whatsapp.db.partitions import (
+    DEFAULT_PARTITION,
+    PARENT_TABLE,
+    add_months,
+    create_partition_sql,
+    month_start,
+    parse_partition_month,
+    partition_name,
+)
+
+
+# Ожидание блокировки для DETACH без CONCURRENTLY и число попыток
+DETACH_LOCK_TIMEOUT = "5s"
+DETACH_ATTEMPTS = 5
+DETACH_RETRY_DELAY = 10.0
+
+
+async def list_partitions(conn: asyncpg.Connection) -> list[str]:
+    rows = await conn.fetch(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass
+        ORDER BY c.relname
+        """,
+        PARENT_TABLE,
+    )
+    return [row["relname"] for row in rows]
+
+
+async def list_detached_partitions(conn: asyncpg.Connection) -> list[str]:
+    """Таблицы с именем секции notifications, не присоединенные к ней"""
+    rows = await conn.fetch(
+        """
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind = 'r'
+          AND NOT c.relispartition
+          AND n.nspname = current_schema()
+          AND c.relname LIKE $1
+        ORDER BY c.relname
+        """,
+        f"{PARENT_TABLE}\\_p%",
+    )
+    return [row["relname"] for row in rows if parse_partition_month(row["relname"]) is not None]
+
+
+async def has_default_partition(conn: asyncpg.Connection) -> bool:
+    partdefid = await conn.fetchval(
+        "SELECT partdefid FROM pg_partitioned_table WHERE partrelid = $1::regclass",
+        PARENT_TABLE,
+    )
+    return bool(partdefid)
+
+
+def month_bounds(month: date) -> tuple[datetime, datetime]:
+    end = add_months(month, 1)
+    return datetime(month.year, month.month, 1), datetime(end.year, end.month, 1)
+
+
+async def default_rows_count(conn: asyncpg.Connection, month: date) -> int:
+    start, end = month_bounds(month)
+    return await conn.fetchval(
+        f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE timestamp >= $1 AND timestamp < $2", start, end
+    )
+
+
+async def create_partition_from_default(conn: asyncpg.Connection, month: date):
+    """
+    Создает секцию месяца, для которого в DEFAULT уже есть строки.
+
+    CREATE ... PARTITION OF в этом случае падает, поэтому DEFAULT на время переноса
+    отсоединяется: создание секции, перенос строк и возврат DEFAULT - одна транзакция.
+    """
+    start, end = month_bounds(month)
+    async with conn.transaction():
+        await conn.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+        await conn.execute(create_partition_sql(month))
+        await conn.execute(
+            f"INSERT INTO {PARENT_TABLE} SELECT * FROM {DEFAULT_PARTITION} WHERE timestamp >= $1 AND timestamp < $2",
+            start, end,
+        )
+        await conn.execute(
+            f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= $1 AND timestamp < $2", start, end
+        )
+        await conn.execute(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+
+
+async def ensure_future_partitions(conn: asyncpg.Connection, months_ahead: int, dry_run: bool):
+    current = month_start(date.today())
+    existing = set(await list_partitions(conn))
+    has_default = await has_default_partition(conn)
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        moved = await default_rows_count(conn, month) if has_default else 0
+        if moved:
+            print(f"Создание секции {name} с переносом строк из {DEFAULT_PARTITION}: {moved}")
+            if not dry_run:
+                await create_partition_from_default(conn, month)
+            continue
+        print(f"Создание секции {name}")
+        if not dry_run:
+            await conn.execute(create_partition_sql(month))
+
+
+async def archive_partition(conn: asyncpg.Connection, name: str, archive_dir: str) -> str:
+    """Выгружает секцию в CSV.gz потоком COPY и возвращает путь к архиву"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wb") as archive:
+        async def write_chunk(chunk: bytes):
+            archive.write(chunk)
+
+        await conn.copy_from_table(name, output=write_chunk, format="csv", header=True)
+    # Архив появляется под итоговым именем только после успешной выгрузки
+    os.replace(tmp_path, path)
+    return path
+
+
+async def finalize_pending_detach(conn: asyncpg.Connection):
+    """Завершает DETACH ... CONCURRENTLY, прерванный в прошлом запуске"""
+    rows = await conn.fetch(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass AND i.inhdetachpending
+        """,
+        PARENT_TABLE,
+    )
+    for row in rows:
+        print(f"Завершение прерванного отсоединения секции {row['relname']}")
+        await conn.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {row['relname']} FINALIZE")
+
+
+async def detach_partition(conn: asyncpg.Connection, name: str, concurrently: bool):
+    """Отсоединяет секцию; вызывается вне транзакции"""
+    if concurrently:
+        await conn.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name} CONCURRENTLY")
+        return
+    await conn.execute(f"SET lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+    try:
+        for attempt in range(1, DETACH_ATTEMPTS + 1):
+            try:
+                await conn.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+                return
+            except asyncpg.exceptions.LockNotAvailableError:
+                if attempt == DETACH_ATTEMPTS:
+                    raise
+                print(f"Таблица {PARENT_TABLE} занята, повтор отсоединения {name} через {DETACH_RETRY_DELAY:.0f} сек")
+                await asyncio.sleep(DETACH_RETRY_DELAY)
+    finally:
+        await conn.execute("RESET lock_timeout")
+
+
+async def drop_old_partitions(conn: asyncpg.Connection, keep_months: int, archive_dir: str, dry_run: bool):
+    cutoff = add_months(month_start(date.today()), -keep_months)
+    if not dry_run:
+        await finalize_pending_detach(conn)
+
+    # Остались от прошлых запусков: данных в notifications уже нет, архив мог не записаться
+    for name in await list_detached_partitions(conn):
+        if parse_partition_month(name) >= cutoff:
+            print(f"Таблица {name} не присоединена к {PARENT_TABLE}, но не старше {cutoff:%Y-%m}: пропускаю")
+            continue
+        print(f"Отсоединенная секция {name}: архивирование и удаление")
+        if dry_run:
+            continue
+        path = await archive_partition(conn, name, archive_dir)
+        await conn.execute(f"DROP TABLE {name}")
+        print(f"Секция {name} выгружена в {path} ({os.path.getsize(path)} байт) и удалена")
+
+    concurrently = not await has_default_partition(conn)
+    for name in await list_partitions(conn):
+        month = parse_partition_month(name)
+        if month is None or month >= cutoff:
+            continue
+        print(f"Секция {name} старше {cutoff:%Y-%m}: архивирование, отсоединение и удаление")
+        if dry_run:
+            continue
+        # Выгрузка до отсоединения: если она не удалась, секция остается в notifications
+        path = await archive_partition(conn, name, archive_dir)
+        await detach_partition(conn, name, concurrently)
+        await conn.execute(f"DROP TABLE {name}")
+        print(f"Секция {name} выгружена в {path} ({os.path.getsize(path)} байт) и удалена")
+
+
+async def run(keep_months: int, months_ahead: int, archive_dir: str, dry_run: bool):
+    conn = await asyncpg.connect(DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://"))
+    try:
+        await ensure_future_partitions(conn, months_ahead, dry_run)
+        await drop_old_partitions(conn, keep_months, archive_dir, dry_run)
+    finally:
+        await conn.close()
+
+
+def main():
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Создание и архивирование секций notifications")
+    parser.add_argument("--keep-months", type=int, default=config.NOTIFICATION_RETENTION_MONTHS,
+                        help="Сколько полных месяцев хранить в БД, кроме текущего")
+    parser.add_argument("--months-ahead", type=int, default=config.NOTIFICATION_PARTITIONS_AHEAD,
+                        help="На сколько месяцев вперед создавать секции")
+    parser.add_argument("--archive-dir", default=config.NOTIFICATION_ARCHIVE_DIR,
+                        help="Каталог для архивов старых секций")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет сделано")
+    args = parser.parse_args()
+    asyncio.run(run(args.keep_months, args.months_ahead, args.archive_dir, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# tools/post_webhooks.py
+"""
+Локальная замена Green API для проверки режима вебхуков.
+
+Отправляет записанные вебхуки (по одному JSON на строку) на сервер бота:
+
+    python -m tools.post_webhooks tools/samples/webhooks.jsonl --url http://localhost:8080/webhook
+
+Строка может содержать тело вебхука или уведомление receiveNotification
+вида {"receiptId": ..., "body": {...}} - тогда отправляется body.
+"""
+import argparse
+import asyncio
+import json
+import time
+import aiohttp
+
+
+def load_payloads(path: str) -> list:
+    payloads = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            payload = json.loads(line)
+            payloads.append(payload.get("body", payload) if "receiptId" in payload else payload)
+    return payloads
+
+
+async def post_payloads(url: str, payloads: list, token: str, delay: float, repeat: int):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    async with aiohttp.ClientSession(headers=headers) as session:
+        for _ in range(repeat):
+            for payload in payloads:
+                started = time.perf_counter()
+                async with session.post(url, json=payload) as response:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    print(f"{payload.get('typeWebhook')} {payload.get('idMessage')}: "
+                          f"{response.status} за {elapsed_ms:.1f} мс")
+                if delay:
+                    await asyncio.sleep(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправка записанных вебхуков Green API на локальный сервер бота")
+    parser.add_argument("path", help="Файл с вебхуками, по одному JSON на строку")
+    parser.add_argument("--url", default="http://localhost:8080/webhook", help="Адрес сервера вебхуков")
+    parser.add_argument("--token", default="", help="Значение WEBHOOK_TOKEN")
+    parser.add_argument("--delay", type=float, default=0.0, help="Пауза между вебхуками, сек")
+    parser.add_argument("--repeat", type=int, default=1, help="Сколько раз отправить весь файл")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.path)
+    asyncio.run(post_payloads(args.url, payloads, args.token, args.delay, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# tools/replay_notifications.py
+"""
+Воспроизведение записанного трафика через бота на заглушках Green API и OpenAI.
+
+    python -m tools.replay_notifications --since 2024-05-01 --until 2024-05-02 [--speed 10]
+    python -m tools.replay_notifications --file tools/samples/webhooks.jsonl --speed 0
+
+Уведомления берутся из notifications.raw_data за период (или из файла, по одному JSON на
+строку) и подаются боту через заглушку receiveNotification с исходными паузами между
+ними, ускоренными в --speed раз (0 - без пауз). Дальше они проходят обычный путь
+WhatsAppBot.message_handler, ответы уходят в заглушки (tools.standins), а не клиентам.
+
+Номера в уведомлениях заменяются на условные (000RRRRRNNNNNN@c.us, RRRRR - номер
+прогона), чтобы не смешивать историю воспроизведения с настоящими разговорами и с
+прошлыми прогонами; --keep-ids оставляет исходные.
+Итог - как у tools.loadtest, плюс состав трафика по типам сообщений.
+"""
+import argparse
+import asyncio
+import copy
+import random
+import time
+from collections import Counter
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional
+from tools.loadtest import add_standin_arguments, configure_environment, drive_bot, print_report
+from tools.post_webhooks import load_payloads
+from tools.standins import StandIns
+
+
+class IdMapper:
+    """
+    Заменяет номера чатов и отправителей на условные, сохраняя суффикс (@c.us, @g.us).
+    Номера включают номер прогона: иначе каждый прогон продолжал бы разговоры
+    предыдущего из conversation_messages.
+    """
+
+    def __init__(self, keep: bool = False, run: Optional[int] = None):
+        """
+        :param keep: Оставлять исходные номера
+        :param run: Номер прогона 0-99999 (по умолчанию случайный)
+        """
+        self.keep = keep
+        self.run = random.randrange(100000) if run is None else run
+        self._ids: Dict[str, str] = {}
+
+    @property
+    def prefix(self) -> str:
+        """Общее начало условных номеров прогона"""
+        return f"000{self.run:05d}"
+
+    def __call__(self, value: Optional[str]) -> Optional[str]:
+        if self.keep or not value:
+            return value
+        if value not in self._ids:
+            _, _, suffix = value.partition("@")
+            self._ids[value] = f"{self.prefix}{len(self._ids):06d}" + (f"@{suffix}" if suffix else "")
+        return self._ids[value]
+
+
+def prepare(notification: Dict, ids: IdMapper) -> Dict:
+    """Копия уведомления для повторной подачи: условные номера и текущее время"""
+    notification = copy.deepcopy(notification)
+    body = notification.setdefault("body", {})
+    sender_data = body.get("senderData")
+    if sender_data:
+        sender_data["chatId"] = ids(sender_data.get("chatId"))
+        sender_data["sender"] = ids(sender_data.get("sender"))
+    # Исходное время могло попасть в уже удаленную секцию notifications
+    body["timestamp"] = int(time.time())
+    return notification
+
+
+async def iter_file(path: str) -> AsyncIterator[Dict]:
+    for payload in load_payloads(path):
+        yield {"body": payload}
+
+
+async def iter_database(start: datetime, end: datetime, chat_id: Optional[str], page_size: int) -> AsyncIterator[Dict]:
+    """Сохраненные уведомления за период постранично, в порядке поступления"""
+    from settings.connection_db import async_session
+    from bots.bot_whatsapp.db.queries import get_raw_notifications_in_range
+
+    cursor = None
+    while True:
+        async with async_session() as session:
+            rows = await get_raw_notifications_in_range(session, start, end, page_size, cursor, chat_id)
+        for row in rows:
+            yield row.raw_data
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1].timestamp, rows[-1].id)
+
+
+async def replay(standins: StandIns,
+                 source: AsyncIterator[Dict],
+                 ids: IdMapper,
+                 speed: float,
+                 max_gap: float,
+                 mix: Counter):
+    """
+    Подает уведомления с исходными паузами, ускоренными в speed раз. Паузы длиннее
+    max_gap секунд (ночь, выходные) сокращаются до max_gap
+    """
+    started = time.perf_counter()
+    offset = 0.0
+    previous: Optional[int] = None
+    async for notification in source:
+        body = notification.get("body", {})
+        timestamp = body.get("timestamp")
+        if speed > 0 and isinstance(timestamp, int):
+            if previous is not None:
+                offset += min(max(timestamp - previous, 0), max_gap) / speed
+            previous = timestamp
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        mix[body.get("messageData", {}).get("typeMessage") or body.get("typeWebhook") or "unknown"] += 1
+        standins.inject_notification(prepare(notification, ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных уведомлений через бота на заглушках")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--since", type=datetime.fromisoformat, help="Начало периода в notifications (YYYY-MM-DD[THH:MM])")
+    source.add_argument("--file", help="Файл с уведомлениями или вебхуками, по одному JSON на строку")
+    parser.add_argument("--until", type=datetime.fromisoformat, default=None, help="Конец периода (по умолчанию - сейчас)")
+    parser.add_argument("--chat-id", default=None, help="Воспроизвести один чат")
+    parser.add_argument("--speed", type=float, default=1.0, help="Ускорение относительно исходного темпа (0 - без пауз)")
+    parser.add_argument("--max-gap", type=float, default=60.0, help="Предел исходной паузы между уведомлениями, секунды")
+    parser.add_argument("--page-size", type=int, default=500, help="Уведомлений за один запрос к БД")
+    parser.add_argument("--keep-ids", action="store_true", help="Не заменять номера чатов")
+    parser.add_argument("--run", type=int, default=None, help="Номер прогона в условных номерах (по умолчанию случайный)")
+    add_standin_arguments(parser)
+    args = parser.parse_args()
+
+    configure_environment(args.host, args.port)
+    ids = IdMapper(keep=args.keep_ids, run=args.run)
+    mix: Counter = Counter()
+
+    async def feed(standins: StandIns):
+        if args.file:
+            notifications = iter_file(args.file)
+        else:
+            notifications = iter_database(args.since, args.until or datetime.now(), args.chat_id, args.page_size)
+        await replay(standins, notifications, ids, args.speed, args.max_gap, mix)
+
+    result = asyncio.run(drive_bot(args, feed))
+    print_report(result)
+    print("Состав трафика: " + ", ".join(f"{name} {count}" for name, count in mix.most_common()))
+    if not args.keep_ids:
+        print(f"Условные номера прогона начинаются с {ids.prefix}")
+
+
+if __name__ == "__main__":
+    main()
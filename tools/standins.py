@@ -0,0 +1,272 @@
+# tools/standins.py
+"""
+Локальные заглушки Green API и OpenAI chat completions для нагрузочных тестов.
+
+    python -m tools.standins [--port 8900] [--green-latency const:0.02] [--llm-latency lognormal:0.8,0.4]
+
+Green API: receiveNotification (long-poll), deleteNotification, sendMessage
+по адресу http://127.0.0.1:<port>/waInstance<id>/... для любого инстанса и токена.
+OpenAI: POST http://127.0.0.1:<port>/v1/chat/completions.
+
+Задержки задаются распределениями: const:С, uniform:ОТ,ДО, exp:СРЕДНЕЕ,
+lognormal:МЕДИАНА,СИГМА (секунды). Бот направляется на заглушки переменными
+GREEN_API_URL и OPENAI_BASE_URL (см. tools.loadtest).
+
+Время ответа считается для каждого входящего сообщения: от постановки в очередь
+заглушки и от отдачи боту до sendMessage. Ответ закрывает одно, самое раннее
+сообщение чата. Ответ модели помечается номером запроса (#N), и если бот объединил
+несколько сообщений в один ход (WHATSAPP_DEBOUNCE_WINDOW), ответ закрывает все
+сообщения, вошедшие в запрос.
+"""
+import argparse
+import asyncio
+import math
+import random
+import re
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional
+from aiohttp import web
+
+
+def parse_distribution(spec: str, seed: Optional[int] = None) -> Callable[[], float]:
+    """Функция случайной задержки (сек) по описанию вида lognormal:0.8,0.4"""
+    rng = random.Random(seed)
+    kind, _, raw = spec.partition(":")
+    params = [float(value) for value in raw.split(",") if value]
+    if kind == "const":
+        return lambda: params[0] if params else 0.0
+    if kind == "uniform":
+        return lambda: rng.uniform(params[0], params[1])
+    if kind == "exp":
+        return lambda: rng.expovariate(1 / params[0])
+    if kind == "lognormal":
+        median, sigma = params
+        return lambda: rng.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+
+_COMPLETION_TAG_RE = re.compile(r"\(#(\d+)\)$")
+
+
+@dataclass
+class _Waiting:
+    """Входящее сообщение, отданное боту и ожидающее ответа"""
+    text: Optional[str]
+    injected_at: float
+    delivered_at: float
+
+
+def message_text(body: Dict) -> Optional[str]:
+    message_data = body.get("messageData", {})
+    return (
+        message_data.get("textMessageData", {}).get("textMessage")
+        or message_data.get("extendedTextMessageData", {}).get("text")
+    )
+
+
+class StandIns:
+    """Состояние заглушек: очередь входящих уведомлений и время ответов по чатам"""
+
+    def __init__(self,
+                 green_latency: Callable[[], float],
+                 llm_latency: Callable[[], float],
+                 completion_tokens: int = 60):
+        self.green_latency = green_latency
+        self.llm_latency = llm_latency
+        self.completion_tokens = completion_tokens
+        self.notifications: Deque[Dict] = deque()
+        self._available = asyncio.Event()
+        self._next_receipt = 1
+        # Время постановки в очередь по квитанциям еще не отданных уведомлений
+        self._injected: Dict[int, float] = {}
+        # Еще не отвеченные сообщения по чатам, в порядке отдачи боту
+        self._waiting: Dict[str, Deque[_Waiting]] = defaultdict(deque)
+        # Последнее сообщение клиента в запросах к модели по номерам запросов
+        self._prompts: Dict[int, str] = {}
+        # Время ответа от отдачи сообщения боту и от его постановки в очередь
+        self.reply_latencies: List[float] = []
+        self.inject_latencies: List[float] = []
+        self.merged = 0
+        self.sent = 0
+        self.delivered = 0
+        self.incoming = 0
+        self.completions = 0
+        self.first_delivery: Optional[float] = None
+        self.last_reply: Optional[float] = None
+
+    def inject(self, chat_id: str, text: str, instance_id: int = 1101000001):
+        """Ставит входящее текстовое сообщение клиента в очередь receiveNotification"""
+        self.inject_notification({
+            "body": {
+                "typeWebhook": "incomingMessageReceived",
+                "instanceData": {"idInstance": instance_id, "wid": "77010000000@c.us", "typeInstance": "whatsapp"},
+                "timestamp": int(time.time()),
+                "idMessage": f"LOAD{self._next_receipt:018d}",
+                "senderData": {
+                    "chatId": chat_id,
+                    "chatName": chat_id,
+                    "sender": chat_id,
+                    "senderName": chat_id,
+                    "senderContactName": "",
+                },
+                "messageData": {"typeMessage": "textMessage", "textMessageData": {"textMessage": text}},
+            },
+        })
+
+    def inject_notification(self, notification: Dict):
+        """Ставит уведомление (например, записанное ранее) в очередь под новой квитанцией"""
+        self.notifications.append({**notification, "receiptId": self._next_receipt})
+        self._injected[self._next_receipt] = time.perf_counter()
+        self._next_receipt += 1
+        self._available.set()
+
+    @property
+    def pending_replies(self) -> int:
+        return sum(len(times) for times in self._waiting.values())
+
+    @property
+    def idle(self) -> bool:
+        """Все уведомления отданы боту и на все входящие сообщения есть ответ"""
+        return not self.notifications and not self.pending_replies
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/waInstance{instance}/receiveNotification/{token}", self.receive_notification)
+        app.router.add_delete("/waInstance{instance}/deleteNotification/{token}/{receipt}", self.delete_notification)
+        app.router.add_post("/waInstance{instance}/sendMessage/{token}", self.send_message)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        return app
+
+    async def receive_notification(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.green_latency())
+        wait = float(request.query.get("receiveTimeout", 0) or 0)
+        deadline = time.monotonic() + wait
+        while not self.notifications:
+            self._available.clear()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return web.json_response(None)
+            try:
+                await asyncio.wait_for(self._available.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return web.json_response(None)
+
+        notification = self.notifications.popleft()
+        now = time.perf_counter()
+        injected_at = self._injected.pop(notification["receiptId"], now)
+        self.first_delivery = self.first_delivery or now
+        self.delivered += 1
+        # Ответа ждут только входящие сообщения; бот отвечает на номер отправителя
+        body = notification.get("body", {})
+        sender_data = body.get("senderData", {})
+        if body.get("typeWebhook") == "incomingMessageReceived":
+            self.incoming += 1
+            self._waiting[sender_data.get("sender") or sender_data.get("chatId")].append(
+                _Waiting(text=message_text(body), injected_at=injected_at, delivered_at=now)
+            )
+        return web.json_response(notification)
+
+    async def delete_notification(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.green_latency())
+        return web.json_response({"result": True})
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        await asyncio.sleep(self.green_latency())
+        now = time.perf_counter()
+        self.sent += 1
+        self.last_reply = now
+        waiting = self._waiting.get(payload.get("chatId"), deque())
+        count = self._answered_count(waiting, payload.get("message") or "")
+        if count > 1:
+            self.merged += count - 1
+        for _ in range(min(count, len(waiting))):
+            item = waiting.popleft()
+            self.reply_latencies.append(now - item.delivered_at)
+            self.inject_latencies.append(now - item.injected_at)
+        return web.json_response({"idMessage": f"REPLY{self.sent:018d}"})
+
+    def _answered_count(self, waiting: Deque[_Waiting], reply: str) -> int:
+        """
+        Сколько первых ожидающих сообщений чата закрывает ответ: несколько, только если
+        запрос к модели, по которому он получен, содержал их объединенный текст
+        """
+        match = _COMPLETION_TAG_RE.search(reply)
+        prompt = self._prompts.pop(int(match.group(1)), None) if match else None
+        if prompt is None:
+            return 1
+        texts = []
+        for count, item in enumerate(waiting, start=1):
+            if item.text is None:
+                break
+            texts.append(item.text)
+            if "\n".join(texts) == prompt:
+                return count
+        return 1
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        await asyncio.sleep(self.llm_latency())
+        self.completions += 1
+        completion = self.completions
+        messages = payload.get("messages", [])
+        prompt_chars = sum(len(message.get("content") or "") for message in messages)
+        user_messages = [message for message in messages if message.get("role") == "user"]
+        if user_messages:
+            self._prompts[completion] = user_messages[-1].get("content") or ""
+        content = "Благодарю за интерес к нашим межкомнатным дверям. " * max(1, self.completion_tokens // 12)
+        # Номер запроса в ответе связывает отправленный ботом ответ с сообщениями из запроса
+        content = f"{content.strip()} (#{completion})"
+        return web.json_response({
+            "id": f"chatcmpl-{completion}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+            "usage": {
+                "prompt_tokens": prompt_chars // 3,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": prompt_chars // 3 + self.completion_tokens,
+            },
+        })
+
+
+async def start_standins(standins: StandIns, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(standins.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def serve(host: str, port: int, standins: StandIns):
+    runner = await start_standins(standins, host, port)
+    print(f"Green API: GREEN_API_URL=http://{host}:{port}")
+    print(f"OpenAI: OPENAI_BASE_URL=http://{host}:{port}/v1")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальные заглушки Green API и OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--green-latency", default="const:0.02", help="Задержка ответов Green API")
+    parser.add_argument("--llm-latency", default="lognormal:0.8,0.4", help="Задержка chat completions")
+    args = parser.parse_args()
+    standins = StandIns(parse_distribution(args.green_latency), parse_distribution(args.llm_latency))
+    try:
+        asyncio.run(serve(args.host, args.port, standins))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()